@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 将当前目录添加到路径中
+sys.path.append(os.getcwd())
+
+import database
+from loader.codec import read_bytes, split_ext
+from loader.data_loader import PlainDataLoader
+from loader.jsonbackend import available_backends, get_backend
+from loader.poem import RECORD_FIELDS
+from loader.snapshot import load_snapshot, save_snapshot
+from render import render_poem
+from search import fuzzy_poems, search_poems
+
+# 有代表性的搜索：作者名、诗题、常见字、繁体输入、带筛选
+SEARCH_CASES = [
+    {"name": "keyword-author", "dataset": "all", "query": "李白"},
+    {"name": "keyword-title", "dataset": "all", "query": "静夜思"},
+    {"name": "keyword-common", "dataset": "all", "query": "明月", "limit": 2000},
+    {"name": "keyword-trad", "dataset": "all", "query": "東風"},
+    {"name": "keyword-miss", "dataset": "all", "query": "没有这句诗"},
+    {"name": "filter-author", "dataset": "all", "query": "", "author": "苏轼"},
+    {"name": "keyword-and-title", "dataset": "all", "query": "月", "title": "秋"},
+    {"name": "songci-keyword", "dataset": 5, "query": "杨柳"},
+]
+# 近似搜索：错一两个字、漏标点、繁体输入、常见短语
+FUZZY_CASES = [
+    {"name": "one-typo", "dataset": "all", "query": "白日依山进"},
+    {"name": "two-typos", "dataset": "all", "query": "床前明月光疑是地上雪"},
+    {"name": "long-line", "dataset": "all", "query": "大江东去浪淘尽千古风流任务"},
+    {"name": "trad", "dataset": "all", "query": "舉頭望明月低頭思故相"},
+    {"name": "common", "dataset": "all", "query": "明月"},
+]
+# 相对基线变慢超过该比例视为回归
+DEFAULT_TOLERANCE = 0.25
+
+
+class _Identity():
+    def convert(self, text):
+        return text
+
+
+def get_converters():
+    """有 opencc 时使用与界面一致的简繁转换器，否则退化为原样返回"""
+    try:
+        import opencc
+        return (opencc.OpenCC('s2t'), opencc.OpenCC('t2s')), True
+    except ImportError:
+        return (_Identity(), _Identity()), False
+
+
+def measure(func, repeat: int) -> dict:
+    """运行 repeat 次，返回耗时统计（毫秒）"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "runs": repeat,
+    }
+
+
+def bench_loader(datasets, repeat: int) -> dict:
+    """首次调用（冷）与重复调用（热）分开统计"""
+    results = {}
+    for target in datasets:
+        for name, method in (("get_poems", "get_poems"), ("get_records", "get_records"),
+                             ("body_extractor", "body_extractor")):
+            loader = PlainDataLoader()
+            results[f"loader.{name}.{target}.cold"] = measure(lambda: getattr(loader, method)(target), 1)
+            results[f"loader.{name}.{target}.warm"] = measure(lambda: getattr(loader, method)(target), repeat)
+    return results
+
+
+def bench_snapshot(repeat: int) -> dict:
+    """在临时目录中写出快照，再分别测完整恢复与只恢复元数据（按需载入）"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "loader.pickle")
+        loader = PlainDataLoader()
+        results["snapshot.save"] = measure(lambda: save_snapshot(loader, path), 1)
+        results["snapshot.load"] = measure(lambda: load_snapshot(PlainDataLoader(), path), repeat)
+        results["snapshot.load_lazy"] = measure(lambda: load_snapshot(PlainDataLoader(), path, lazy=True), repeat)
+    return results
+
+
+def bench_decode(loader, repeat: int) -> dict:
+    """全库解析耗时与峰值内存：已安装的各解码后端分别做完整解码与只取 Poem 字段的解码
+
+    文件内容预先读入内存，只计解码；峰值内存在单独一轮中用 tracemalloc 统计，解码结果全部保留，与加载器一致。
+    """
+    payloads = []
+    for target in loader.datasets:
+        for path in loader.dataset_files(target):
+            raw = read_bytes(path)
+            if split_ext(os.path.basename(path))[1].startswith(".jsonl"):
+                raw = b"[" + raw.strip().replace(b"\n", b",") + b"]"
+            payloads.append(raw)
+
+    results = {}
+    for name in available_backends():
+        backend = get_backend(name)
+        for mode, fields in (("full", None), ("fields", RECORD_FIELDS)):
+            def run():
+                if fields:
+                    return [backend.decode_fields(raw, fields) for raw in payloads]
+                return [backend.loads(raw) for raw in payloads]
+            stats = measure(run, repeat)
+            tracemalloc.start()
+            kept = run()
+            stats["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+            tracemalloc.stop()
+            del kept
+            results[f"decode.{name}.{mode}"] = stats
+    return results
+
+
+def bench_search(loader, converters, repeat: int) -> dict:
+    results = {}
+    for case in SEARCH_CASES:
+        def run():
+            return search_poems(loader, case["dataset"], case["query"], case.get("author"), case.get("title"),
+                                case.get("limit", 2000), converters=converters)
+        stats = measure(run, repeat)
+        stats["hits"] = len(run())
+        results[f"search.{case['name']}"] = stats
+    return results
+
+
+def bench_fuzzy(loader, converters, repeat: int) -> dict:
+    """首次调用构建（或从缓存读取）行表与二元组索引，计入 fuzzy.index"""
+    from loader.fuzzy import get_bigram_index
+
+    start = time.perf_counter()
+    get_bigram_index(loader)
+    results = {"fuzzy.index": {"median_ms": round((time.perf_counter() - start) * 1000, 3), "runs": 1}}
+    for case in FUZZY_CASES:
+        def run():
+            return fuzzy_poems(loader, case["dataset"], case["query"], converters=converters)
+        stats = measure(run, repeat)
+        stats["hits"] = len(run())
+        results[f"fuzzy.{case['name']}"] = stats
+    return results
+
+
+def bench_render(loader, converters, repeat: int, sample: int = 200) -> dict:
+    """对各种数据形态抽样生成卡片 HTML"""
+    rng = random.Random(0)
+    poems = []
+    for target in ("tangsong", "songci", "shijing", "chuci", "nalanxingde", "qianjiashi", "dizigui"):
+        if target in loader.datasets:
+            pool = loader.get_records(target)
+            poems += rng.sample(pool, min(len(pool), sample // 5 or 1))
+
+    def run():
+        for poem in poems:
+            render_poem(poem, converters)
+
+    stats = measure(run, repeat)
+    stats["poems"] = len(poems)
+    stats["per_poem_ms"] = round(stats["median_ms"] / max(len(poems), 1), 4)
+    return {"render.render_poem": stats}
+
+
+def bench_database(rows: int, repeat: int) -> dict:
+    """在临时库中构造 rows 条笔记后测各个 CRUD 函数"""
+    results = {}
+    old_db = database.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "bench_notes.db")
+        try:
+            database.init_db()
+            rng = random.Random(0)
+            tags = ["必背", "伤感", "写景", "咏史", "哲理", "爱情"]
+            poem = {"title": "静夜思", "author": "李白", "paragraphs": ["床前明月光，疑是地上霜。", "举头望明月，低头思故乡。"]}
+
+            start = time.perf_counter()
+            for i in range(rows):
+                database.save_analysis(dict(poem, title=f"诗{i}"), f"解析{i}")
+            results["db.save_analysis"] = {
+                "median_ms": round((time.perf_counter() - start) * 1000 / rows, 4), "runs": rows,
+            }
+            for i in range(1, rows + 1, max(rows // 1000, 1)):
+                database.update_note(i, f"点评{i}", ", ".join(rng.sample(tags, 2)), rng.randint(0, 5))
+
+            results["db.update_note"] = measure(lambda: database.update_note(rng.randint(1, rows), "点评", "写景", 3), repeat)
+            results["db.get_history.all"] = measure(lambda: database.get_history(), repeat)
+            results["db.get_history.keyword"] = measure(lambda: database.get_history(keyword="诗123"), repeat)
+            results["db.get_history.tag"] = measure(lambda: database.get_history(tag_filter="伤感"), repeat)
+            results["db.get_all_existing_tags"] = measure(database.get_all_existing_tags, repeat)
+            ids = iter(range(rows, 0, -1))
+            results["db.delete_history"] = measure(lambda: database.delete_history(next(ids)), repeat)
+        finally:
+            database.DB_FILE = old_db
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """返回比基线慢超过 tolerance 的项"""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("median_ms"):
+            continue
+        ratio = stats["median_ms"] / base["median_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append({"name": name, "baseline_ms": base["median_ms"],
+                                "current_ms": stats["median_ms"], "ratio": round(ratio, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据加载、搜索、渲染与笔记数据库的基准测试（无需 Streamlit）")
+    parser.add_argument("--suites", nargs="*", default=["loader", "snapshot", "decode", "search", "fuzzy", "render", "db"])
+    parser.add_argument("--datasets", nargs="*", default=None, help="loader 基准的数据集，默认全部")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db-rows", type=int, default=100000)
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径，默认打印到标准输出")
+    parser.add_argument("--baseline", default=None, help="与之比较的基线 JSON")
+    parser.add_argument("--save-baseline", default=None, help="将本次结果另存为基线")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    random.seed(0)
+    loader = PlainDataLoader()
+    converters, has_opencc = get_converters()
+    results = {}
+    if "loader" in args.suites:
+        results.update(bench_loader(args.datasets or list(loader.datasets), args.repeat))
+    if "snapshot" in args.suites:
+        results.update(bench_snapshot(args.repeat))
+    if "decode" in args.suites:
+        results.update(bench_decode(loader, args.repeat))
+    if "search" in args.suites:
+        results.update(bench_search(loader, converters, args.repeat))
+    if "fuzzy" in args.suites:
+        results.update(bench_fuzzy(loader, converters, args.repeat))
+    if "render" in args.suites:
+        results.update(bench_render(loader, converters, args.repeat))
+    if "db" in args.suites:
+        results.update(bench_database(args.db_rows, args.repeat))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencc": has_opencc,
+            "json_backend": get_backend().name,
+            "repeat": args.repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    if report.get("regressions"):
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['name']}: {r['baseline_ms']}ms -> {r['current_ms']}ms (x{r['ratio']})",
+                  file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
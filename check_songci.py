@@ -3,7 +3,7 @@ import json
 
 def check_songci():
     base_dir = "宋词"
-    excludes = ["authors.song.json", "ci.db", "main.py", "README.md", "UpdateCi.py"]
+    excludes = ["authors.song.json", "ci.db", "main.py", "README.md", "UpdateCi.py", "all.json", "align_report.json", "ci.song.manifest.json", "author.song.manifest.json"]
     tag = "paragraphs"
     
     print("开始检查宋词文件...")
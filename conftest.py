@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+TANG = [
+    {"title": "静夜思", "author": "李白", "paragraphs": ["床前明月光，疑是地上霜。", "举头望明月，低头思故乡。"]},
+    {"title": "春晓", "author": "孟浩然", "paragraphs": ["春眠不觉晓，处处闻啼鸟。", "夜来风雨声，花落知多少。"]},
+    {"title": "月下独酌", "author": "李白", "paragraphs": ["花间一壶酒，独酌无相亲。", "举杯邀明月，对影成三人。"]},
+]
+SONG = [
+    {"rhythmic": "水调歌头", "author": "苏轼", "paragraphs": ["明月几时有？把酒问青天。", "千里共婵娟。"]},
+]
+# 与 TANG 逐条对应的搜索结果数，静夜思最多（见 rank/README.md）
+TANG_RANK = [
+    {"author": "李白", "title": "静夜思", "baidu": 900000, "google": 5000000},
+    {"author": "孟浩然", "title": "春晓", "baidu": 300, "google": 2000},
+    {"author": "李白", "title": "月下独酌", "baidu": 200, "google": 1000},
+]
+
+
+def make_corpus(root, song=SONG):
+    """在 root 下写出 tang、song 两个数据集与排名数据，返回 datas.json 路径"""
+    datasets = {}
+    for i, (name, poems, dynasty) in enumerate((("tang", TANG, "唐"), ("song", song, "宋"))):
+        (root / name).mkdir()
+        (root / name / "poems.json").write_text(json.dumps(poems, ensure_ascii=False), encoding="utf-8")
+        datasets[name] = {"name": name, "id": i, "path": f"{name}/", "tag": "paragraphs", "dynasty": dynasty}
+    (root / "rank").mkdir()
+    (root / "rank" / "poems.rank.json").write_text(json.dumps(TANG_RANK, ensure_ascii=False), encoding="utf-8")
+    datasets["tang"]["rank"] = "rank/"
+    config = root / "datas.json"
+    config.write_text(json.dumps({"cp_path": str(root), "cache_path": str(root / "cache"), "datasets": datasets}),
+                      encoding="utf-8")
+    return str(config)
+
+
+def titles(index, query, scope=None):
+    from loader.query import compile_query
+
+    return [p.display_title for p in compile_query(query, index, scope=scope)]
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    """各测试模块共用的小语料倒排表，不要改动其数据文件（需要改动时用 make_corpus 另建一份）"""
+    from loader.corpus import get_corpus_index
+    from loader.data_loader import PlainDataLoader
+
+    config = make_corpus(tmp_path_factory.mktemp("corpus"))
+    get_corpus_index(PlainDataLoader(config))
+    # 第二个加载器从缓存读取倒排表
+    return get_corpus_index(PlainDataLoader(config))
@@ -2,8 +2,15 @@ import sqlite3
 import datetime
 import json
 
+from loader.metrics import timed
+from loader.poem import Poem
+
 DB_FILE = "poem_notes.db"
 
+# 记录每个函数（含连接、执行与提交）的耗时
+db_timed = timed("db_call_seconds", "SQLite call latency by function")
+
+@db_timed
 def init_db():
     """初始化数据库表"""
     conn = sqlite3.connect(DB_FILE)
@@ -39,21 +46,20 @@ def init_db():
     conn.commit()
     conn.close()
 
+@db_timed
 def save_analysis(poem, analysis_text):
     """保存解析记录"""
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
     
-    # 获取基本信息
-    title = poem.get('title', '无题')
-    author = poem.get('author', '佚名')
+    # 获取基本信息；笔记等处传入的原始字典先统一为 Poem
+    if not isinstance(poem, Poem):
+        poem = Poem.from_dict(poem)
+    title = poem.title or '无题'
+    author = poem.author or '佚名'
     
-    # 构造内容字符串用于存储
-    content_list = poem.get('paragraphs') or poem.get('content') or poem.get('para') or []
-    if isinstance(content_list, list):
-        content_str = "\n".join([str(x) for x in content_list])
-    else:
-        content_str = str(content_list)
+    # 构造内容字符串用于存储（各行以换行分隔）
+    content_str = poem.text
         
     # 生成哈希用于去重（可选，这里暂不做强制去重，允许重复解析）
     poem_hash = str(hash(content_str))
@@ -68,6 +74,7 @@ def save_analysis(poem, analysis_text):
     conn.commit()
     conn.close()
 
+@db_timed
 def update_note(record_id, user_comment, tags, rating=None):
     """更新笔记的点评、标签和评分"""
     conn = sqlite3.connect(DB_FILE)
@@ -78,6 +85,7 @@ def update_note(record_id, user_comment, tags, rating=None):
     conn.commit()
     conn.close()
 
+@db_timed
 def get_history(keyword=None, tag_filter=None):
     """获取历史记录，支持筛选"""
     conn = sqlite3.connect(DB_FILE)
@@ -103,6 +111,7 @@ def get_history(keyword=None, tag_filter=None):
     conn.close()
     return rows
 
+@db_timed
 def get_all_existing_tags():
     """获取所有已使用的标签"""
     conn = sqlite3.connect(DB_FILE)
@@ -126,6 +135,7 @@ def get_all_existing_tags():
                     tags_set.add(t)
     return sorted(list(tags_set))
 
+@db_timed
 def delete_history(record_id):
     """删除指定记录"""
     conn = sqlite3.connect(DB_FILE)
@@ -5,28 +5,36 @@ import json
 # 将当前目录添加到路径中
 sys.path.append(os.getcwd())
 
+from loader.catalog import format_size, load_catalog
 from loader.data_loader import PlainDataLoader
 
 def check_data_types():
     loader = PlainDataLoader()
     
+    # 数据集目录（python -m loader.catalog 生成）中有效的条目直接给出统计与字段类型，不必载入数据
+    catalog = load_catalog(loader)
+    
     print("正在检查各数据集的数据类型...")
     
     for key, config in loader.datasets.items():
+        entry = catalog.get(key)
+        if entry is not None:
+            print(f"[{key}] {entry['poems']} 条, {entry['lines']} 行, {entry['chars']} 字, "
+                  f"{entry['files']} 个文件 {format_size(entry['bytes'])}")
+            print(f"  -> 字段: {entry['schema']}")
+            continue
         try:
             # 这里的 key 类似于 "tang-shi"
-            data = loader.body_extractor(key)
-            if not data:
+            records = loader.get_records(key)
+            if not records:
                 print(f"[{key}] 数据为空")
                 continue
                 
-            sample = data[0]
-            print(f"[{key}] 数据类型: {type(sample)}")
-            
-            if isinstance(sample, str):
-                print(f"  -> 样本: {sample[:50]}...")
-            elif isinstance(sample, dict):
-                print(f"  -> 键: {list(sample.keys())}")
+            sample = records[0]
+            fields = sorted({r.field or '无' for r in records})
+            nested = sum(1 for r in records if r.body is not None)
+            print(f"[{key}] {len(records)} 条, 正文字段: {fields}, 非扁平正文: {nested} 条")
+            print(f"  -> 样本: {sample.display_title} / {sample.author or '佚名'} / {' '.join(sample.lines)[:50]}...")
             
         except Exception as e:
             print(f"[{key}] 读取出错: {e}")
@@ -1,22 +1,40 @@
-import streamlit as st
-import streamlit.components.v1 as components
-import random
+import importlib
+import importlib.util
 import os
 import sys
-import json
-import database
-import opencc
-import openai
-from dotenv import load_dotenv
-
-# 加载环境变量
-current_dir = os.path.dirname(os.path.abspath(__file__))
-load_dotenv(os.path.join(current_dir, '.env'))
 
 # 将当前目录添加到路径中，以便能导入 loader
 sys.path.append(os.getcwd())
 
+# 最先导入，以其导入时刻作为启动耗时的起点
+from startup import Warmup, report as startup_report
+
+with startup_report.phase("import"):
+    import streamlit as st
+    import streamlit.components.v1 as components
+    from streamlit.runtime.scriptrunner import add_script_run_ctx
+    import random
+    import database
+    try:
+        # 可选：逐键触发的输入框，未安装时边输入边搜索在输入框提交（回车或失焦）后开始
+        from st_keyup import st_keyup
+    except ImportError:
+        st_keyup = None
+    # openai、opencc、dotenv 较重或只在部分功能中用到，改为在使用处导入
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+from loader.catalog import format_size, load_catalog
 from loader.data_loader import PlainDataLoader
+from loader.metrics import record_cache, registry, start_http_server
+from loader.poem import Poem
+from loader.snapshot import is_valid, load_snapshot, read_header, save_snapshot, snapshot_path
+from incremental import IncrementalSearch
+from render import render_poem
+from results import ResultSet, fingerprint
+from search import (facet_counts, facets_ready, fuzzy_poems, locate_quote, poems_by_facets, positional_lines,
+                    query_poems, same_rhyme_poems, search_poems, similar_poems, similar_ready, warm_facets,
+                    warm_similar)
 
 @st.cache_data(show_spinner=False)
 def get_ai_analysis(api_key, base_url, model_name, title, author, content):
@@ -25,6 +43,7 @@ def get_ai_analysis(api_key, base_url, model_name, title, author, content):
         return "请先在侧边栏设置 AI API Key"
     
     try:
+        import openai
         client = openai.OpenAI(api_key=api_key, base_url=base_url)
         
         prompt = f"""
@@ -96,24 +115,117 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def load_env():
+    """加载 .env 中的环境变量（每个进程一次）"""
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(current_dir, '.env'))
+
 @st.cache_resource
 def get_converters():
+    import opencc
     return opencc.OpenCC('s2t'), opencc.OpenCC('t2s')
 
+@st.cache_resource
+def get_searcher():
+    """边输入边搜索的线程池，各会话共用（每个进程一次）"""
+    return IncrementalSearch()
+
 @st.cache_resource
 def get_loader():
     """缓存加载器实例，避免重复加载"""
     try:
-        return PlainDataLoader()
+        loader = PlainDataLoader()
+        # 有效的快照只恢复元数据，各数据集在首次使用或后台预热时载入
+        load_snapshot(loader, lazy=True)
+        return loader
     except Exception as e:
         st.error(f"数据加载失败: {e}")
         return None
 
+@st.cache_resource
+def get_catalog(_loader):
+    """与 datas.json 同目录的数据集目录中仍然有效的条目（见 loader/catalog.py），不读取数据（每个进程一次）"""
+    return load_catalog(_loader)
+
+# 侧栏的分面筛选（见 loader/facets.py）
+SIDEBAR_FACETS = {"form": "体裁", "dynasty": "朝代", "popularity": "知名度"}
+FACET_HELP = {
+    "form": "按句数、字数与句式归类",
+    "dynasty": "按数据文件与文集推断",
+    "popularity": "按各搜索引擎的结果数分档，只有全唐诗、全宋诗与宋词有数据",
+}
+
+def warmup_targets(loader):
+    """WARMUP_DATASETS 为逗号分隔的数据集名；未设置时预热全部，设为空则不预热数据集"""
+    value = os.getenv("WARMUP_DATASETS")
+    if value is None:
+        return list(loader.datasets)
+    return [t.strip() for t in value.split(",") if t.strip() in loader.datasets]
+
+@st.cache_resource
+def start_warmup(_loader):
+    """首屏渲染完成后在后台线程预热简繁转换器、AI 客户端模块与常用数据集（每个进程一次）"""
+    tasks = [("converters", get_converters)]
+    # 结果按进程缓存，不能依赖某个会话的 AI 开关；已安装时总是预热导入，之后任一会话开启 AI 都无需等待
+    if importlib.util.find_spec("openai") is not None:
+        tasks.append(("openai", lambda: importlib.import_module("openai")))
+    targets = warmup_targets(_loader)
+    tasks += [(f"records:{target}", lambda t=target: _loader.get_records(t)) for target in targets]
+    if len(targets) == len(_loader.datasets):
+        # 侧栏各筛选项旁的计数在分面列就绪后显示
+        tasks.append(("facets", lambda: warm_facets(_loader, ("dataset", *SIDEBAR_FACETS))))
+    if len(targets) == len(_loader.datasets) and not is_valid(_loader, read_header(snapshot_path(_loader))):
+        # 已构建全部数据集，顺便写出快照供下次启动使用
+        tasks.append(("snapshot", lambda: save_snapshot(_loader)))
+    if len(targets) == len(_loader.datasets):
+        # 相似作品索引全量构建较慢，放在最后；建成前界面上的按钮不可用
+        tasks.append(("similar", lambda: warm_similar(_loader)))
+    warmup = Warmup(tasks)
+    # 让后台线程可以使用 st.cache_resource 缓存的函数
+    add_script_run_ctx(warmup.thread)
+    return warmup.start()
+
+@st.cache_resource
+def start_metrics_server():
+    """设置 METRICS_PORT 时在后台提供 Prometheus /metrics"""
+    port = os.getenv("METRICS_PORT")
+    if port:
+        return start_http_server(int(port))
+    return None
+
+def show_metrics_panel():
+    with st.expander("📈 性能指标", expanded=False):
+        st.markdown("**启动耗时**")
+        st.dataframe(startup_report.rows(), hide_index=True, use_container_width=True)
+        ratios = registry.cache_ratios()
+        if ratios:
+            st.markdown("**缓存命中率**")
+            for cache, (hit, total, ratio) in sorted(ratios.items()):
+                st.caption(f"{cache}: {ratio:.0%} ({int(hit)}/{int(total)})")
+        for metric in registry.metrics():
+            if metric.kind != "histogram":
+                continue
+            st.markdown(f"**{metric.name}**")
+            rows = [
+                {"labels": ", ".join(f"{k}={v}" for k, v in key) or "-", "count": s["count"],
+                 "avg": round(s["avg"], 4), "total": round(s["sum"], 3)}
+                for key, s in sorted(metric.summary().items())
+            ]
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        if st.checkbox("显示 Prometheus 文本", key="metrics_show_text"):
+            st.code(registry.render_prometheus(), language="text")
+
 def main():
+    with startup_report.phase("env"):
+        load_env()
+    start_metrics_server()
+
     # 初始化数据库
     database.init_db()
     
-    loader = get_loader()
+    with startup_report.phase("loader"):
+        loader = get_loader()
     if not loader:
         return
 
@@ -148,15 +260,38 @@ def main():
         if "pending_dataset_selector" in st.session_state:
             st.session_state["dataset_selector"] = st.session_state.pop("pending_dataset_selector")
         
+        # 分面筛选依赖 numpy，在此处才导入；已选筛选条件或后台预热完成后，每个选项旁显示选中它之后的首数
+        from loader.facets import DYNASTIES, FORMS, POPULARITY
+        facet_options = {"form": FORMS, "dynasty": DYNASTIES, "popularity": POPULARITY}
+        facets = {facet: st.session_state.get(f"{facet}_selector", "不限") for facet in SIDEBAR_FACETS}
+        facets = {facet: value for facet, value in facets.items() if value != "不限"}
+        live = bool(facets) or facets_ready(loader, ("dataset", *SIDEBAR_FACETS))
+        counts = {"dataset": facet_counts(loader, "all", "dataset", facets)} if live else {}
+
+        # 分面列就绪前，没有筛选时的首数取自数据集目录
+        catalog = get_catalog(loader)
+
         def get_dataset_display_name(x):
             if x == "all":
-                return "📚 所有文集"
-            # 获取数据集对应的key
-            dataset_key = loader.id_table.get(x)
-            if dataset_key and dataset_key in loader.datasets:
-                name = loader.datasets[dataset_key].get('name', dataset_key)
-                return f"📖 {name}"
-            return f"📖 {x}"
+                name = "📚 所有文集"
+                if live:
+                    total = sum(counts["dataset"].values())
+                elif len(catalog) == len(loader.datasets):
+                    total = sum(entry["poems"] for entry in catalog.values())
+                else:
+                    total = None
+            else:
+                # 获取数据集对应的key
+                dataset_key = loader.id_table.get(x)
+                if dataset_key and dataset_key in loader.datasets:
+                    name = f"📖 {loader.datasets[dataset_key].get('name', dataset_key)}"
+                else:
+                    name = f"📖 {x}"
+                if live:
+                    total = counts["dataset"].get(dataset_key, 0)
+                else:
+                    total = catalog.get(dataset_key, {}).get("poems")
+            return name if total is None else f"{name} ({total})"
         
         selected_dataset_id = st.selectbox(
             "选择文集",
@@ -164,7 +299,20 @@ def main():
             format_func=get_dataset_display_name,
             key="dataset_selector"
         )
-        
+
+        for facet, label in SIDEBAR_FACETS.items():
+            if live:
+                counts[facet] = facet_counts(loader, selected_dataset_id, facet, facets)
+
+            def format_option(value, facet=facet):
+                if not live:
+                    return value
+                total = sum(counts[facet].values()) if value == "不限" else counts[facet].get(value, 0)
+                return f"{value} ({total})"
+
+            st.selectbox(label, options=["不限", *facet_options[facet]], key=f"{facet}_selector",
+                         format_func=format_option, help=FACET_HELP[facet])
+
         MODE_RANDOM = "🎲 随机探索"
         MODE_SEARCH = "🔍 搜索查询"
         MODE_GALLERY = "📚 文集画廊"
@@ -206,17 +354,25 @@ def main():
         st.markdown("### 关于")
         st.info("本项目包含全唐诗、全宋词、诗经、论语等大量中国古代文学经典。")
 
+        # 调试面板：设置环境变量 DEBUG_METRICS=True 后显示
+        if os.getenv("DEBUG_METRICS", "False").lower() == "true":
+            show_metrics_panel()
+
     # 主要内容区域
     if mode == MODE_RANDOM:
-        show_random_mode(loader, selected_dataset_id)
+        show_random_mode(loader, selected_dataset_id, facets)
     elif mode == MODE_SEARCH:
-        show_search_mode(loader, selected_dataset_id)
+        show_search_mode(loader, selected_dataset_id, facets)
     elif mode == MODE_GALLERY:
-        show_gallery_mode(loader, selected_dataset_id)
+        show_gallery_mode(loader, selected_dataset_id, facets)
     else:
         show_notes_mode()
 
-def show_gallery_mode(loader, dataset_id):
+    # 首屏已输出，其余较重的准备工作放到后台
+    startup_report.mark("first_paint")
+    start_warmup(loader)
+
+def show_gallery_mode(loader, dataset_id, facets=None):
     st.header("📚 文集画廊")
     
     # 1. 检查是否选择了具体文集
@@ -225,28 +381,44 @@ def show_gallery_mode(loader, dataset_id):
         st.markdown("### 📚 所有文集")
         st.caption("点击下方卡片可直接跳转到对应文集")
         
+        catalog = get_catalog(loader)
         cols = st.columns(4)
         for idx, (ds_id, ds_key) in enumerate(loader.id_table.items()):
             name = loader.datasets[ds_key].get('name', ds_key)
+            entry = catalog.get(ds_key)
+            label, help_text = f"📖 {name}", None
+            if entry:
+                label += f" ({entry['poems']} 首)"
+                help_text = (f"{entry['lines']} 行 · {entry['chars']} 字 · {entry['files']} 个文件 · "
+                             f"{format_size(entry['bytes'])}")
             with cols[idx % 4]:
-                if st.button(f"📖 {name}", key=f"sel_ds_{ds_id}", use_container_width=True):
+                if st.button(label, key=f"sel_ds_{ds_id}", help=help_text, use_container_width=True):
                     st.session_state["pending_dataset_selector"] = ds_id
                     st.rerun()
         return
 
     # 2. 加载数据 (带缓存)
     # 当数据集ID变化时，重新加载
-    if 'gallery_dataset' not in st.session_state or st.session_state.gallery_dataset != dataset_id:
+    # 会话中只保存结果句柄，翻页时再取当页的诗词
+    facets = facets or {}
+    gallery_key = fingerprint(dataset_id, sorted(facets.items()))
+    cached = st.session_state.get('gallery_results')
+    gallery_hit = cached is not None and cached.fingerprint == gallery_key
+    record_cache("gallery_session", gallery_hit)
+    if not gallery_hit:
         with st.spinner(f"正在加载文集数据，请稍候..."):
             target = loader.id_table[dataset_id]
-            st.session_state.gallery_poems = loader.get_poems(target)
-            st.session_state.gallery_dataset = dataset_id
+            if facets:
+                results = ResultSet.from_poems(gallery_key, poems_by_facets(loader, dataset_id, facets))
+            else:
+                results = ResultSet.dataset(gallery_key, target, len(loader.get_records(target)))
+            st.session_state.gallery_results = results
             st.session_state.gallery_page = 1
             st.session_state.gallery_view_mode = 'grid' # 重置为网格视图
             
-    poems = st.session_state.gallery_poems
+    poems = st.session_state.gallery_results
     if not poems:
-        st.warning("该文集暂无数据。")
+        st.warning("该文集没有符合筛选条件的作品。" if facets else "该文集暂无数据。")
         return
 
     # 3. 视图控制 (列表 vs 详情)
@@ -277,7 +449,10 @@ def show_gallery_mode(loader, dataset_id):
         # 顶部控制栏
         c1, c2, c3 = st.columns([2, 2, 1])
         with c1:
-            st.caption(f"当前文集共 {total_items} 首")
+            if facets:
+                st.caption(f"当前文集符合筛选（{'、'.join(facets.values())}）的作品 {total_items} 首")
+            else:
+                st.caption(f"当前文集共 {total_items} 首")
         with c3:
             # 只有页数大于1才显示
             if total_pages > 1:
@@ -298,7 +473,7 @@ def show_gallery_mode(loader, dataset_id):
         # 切片数据
         start_idx = (current_page - 1) * page_size
         end_idx = min(start_idx + page_size, total_items)
-        page_poems = poems[start_idx:end_idx]
+        page_poems = poems.page(loader, start_idx, end_idx)
         
         # 渲染网格
         cols = st.columns(4) # 4列布局
@@ -347,28 +522,20 @@ def show_gallery_mode(loader, dataset_id):
 
         for i, poem in enumerate(page_poems):
             with cols[i % 4]:
-                title = poem.get('title', '无题')
-                author = poem.get('author', '佚名')
+                title = poem.title or '无题'
+                author = poem.author or '佚名'
                 
-                # 获取预览文字
-                content_list = poem.get('paragraphs') or poem.get('content') or []
-                preview = ""
-                if isinstance(content_list, list) and content_list:
-                    # 取前4句，构建更丰富的预览
-                    lines = content_list[:4]
-                    formatted_lines = []
-                    for line in lines:
-                        s_line = str(line)
-                        # 如果单行太长，适当截断以保持整洁
-                        if len(s_line) > 18:
-                            s_line = s_line[:18] + "..."
-                        formatted_lines.append(s_line)
-                    
-                    preview = "\n".join(formatted_lines)
-                    if len(content_list) > 4:
-                        preview += "\n..."
-                elif isinstance(content_list, str):
-                    preview = content_list[:50] + "..." if len(content_list) > 50 else content_list
+                # 获取预览文字：取前4句，构建更丰富的预览
+                content_lines = poem.lines
+                formatted_lines = []
+                for line in content_lines[:4]:
+                    # 如果单行太长，适当截断以保持整洁
+                    if len(line) > 18:
+                        line = line[:18] + "..."
+                    formatted_lines.append(line)
+                preview = "\n".join(formatted_lines)
+                if len(content_lines) > 4:
+                    preview += "\n..."
                 
                 # 按钮显示内容 - 使用 Markdown 语法
                 # 构造更有层次感的文本结构
@@ -519,16 +686,16 @@ def show_notes_mode():
                     database.delete_history(row['id'])
                     st.rerun()
 
-def show_random_mode(loader, dataset_id):
+def show_random_mode(loader, dataset_id, facets=None):
     ai_enabled = st.session_state.get('ai_enabled', False)
     
     if ai_enabled:
         # AI模式下使用全宽布局，以便容纳左右分栏
         if st.button("🎲 换一首", type="primary", use_container_width=True):
-            st.session_state.random_poem = get_random_poem(loader, dataset_id)
+            st.session_state.random_poem = get_random_poem(loader, dataset_id, facets)
             
         if 'random_poem' not in st.session_state:
-            st.session_state.random_poem = get_random_poem(loader, dataset_id)
+            st.session_state.random_poem = get_random_poem(loader, dataset_id, facets)
         
         poem = st.session_state.random_poem
         if poem:
@@ -538,26 +705,28 @@ def show_random_mode(loader, dataset_id):
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🎲 换一首", type="primary"):
-                st.session_state.random_poem = get_random_poem(loader, dataset_id)
+                st.session_state.random_poem = get_random_poem(loader, dataset_id, facets)
 
             # 初始化
             if 'random_poem' not in st.session_state:
-                st.session_state.random_poem = get_random_poem(loader, dataset_id)
+                st.session_state.random_poem = get_random_poem(loader, dataset_id, facets)
             
             poem = st.session_state.random_poem
             if poem:
                 display_poem(poem, unique_id="random")
 
-def get_random_poem(loader, dataset_id):
+def get_random_poem(loader, dataset_id, facets=None):
     try:
-        if dataset_id == "all":
+        if facets:
+            poems = poems_by_facets(loader, dataset_id, facets)
+        elif dataset_id == "all":
             # 从所有数据集中随机选一个，然后再取一首
             target = random.choice(list(loader.datasets.keys()))
-            poems = loader.get_poems(target)
+            poems = loader.get_records(target)
         else:
             # 获取对应的数据集名称
             target = loader.id_table[dataset_id]
-            poems = loader.get_poems(target)
+            poems = loader.get_records(target)
             
         if poems:
             return random.choice(poems)
@@ -566,8 +735,19 @@ def get_random_poem(loader, dataset_id):
         st.error(f"获取诗词出错: {e}")
         return None
 
-def show_search_mode(loader, dataset_id):
-    query = st.text_input("输入关键词 (全局搜索)", placeholder="例如：李白, 静夜思, 月亮...")
+QUERY_HELP = """空格或 AND 表示同时满足，OR 表示任一满足，NOT 或前缀 - 表示排除，可用括号分组；
+"双引号" 括起的短语可含空格。字段：author:李白 title:春 rhythmic:浣溪沙 dataset:tangsong；
+押韵：rhyme:东、rhyme:下平七阳（平水韵）；体裁与分面：form:七绝、dynasty:唐、popularity:名篇；
+行位置：line:1:床前（第 1 句含）、line:-1:故乡（末句含）、^明月（某句以之开头）、故乡$（某句以之结尾）。"""
+
+
+def show_search_mode(loader, dataset_id, facets=None):
+    incremental = st.session_state.get("search_incremental", False)
+    if incremental and st_keyup is not None:
+        query = st_keyup("输入关键词 (全局搜索)", placeholder="例如：李白, 静夜思, 月亮...", debounce=300,
+                         key="search_query_live") or ""
+    else:
+        query = st.text_input("输入关键词 (全局搜索)", placeholder="例如：李白, 静夜思, 月亮...")
     
     with st.expander("🛠️ 高级筛选 & 设置", expanded=False):
         c1, c2, c3 = st.columns(3)
@@ -577,37 +757,84 @@ def show_search_mode(loader, dataset_id):
             filter_title = st.text_input("筛选标题 (包含)", placeholder="如: 静夜思")
         with c3:
             search_limit = st.number_input("最大结果数", min_value=100, max_value=50000, value=2000, step=1000)
+        use_syntax = st.toggle("使用查询语法", value=False, help=QUERY_HELP)
+        st.toggle("边输入边搜索", key="search_incremental",
+                  help="在后台逐个文集搜索，先显示已找到的结果；输入改变时取消上一次搜索。不适用于查询语法"
+                       + ("" if st_keyup is not None else "（安装 streamlit-keyup 后每次按键即开始搜索）"))
+
+    show_positional_search(loader, dataset_id)
 
-    # 初始化搜索状态
+    # 初始化搜索状态：会话中只保存结果句柄（编号与查询指纹），翻页时再取当页的诗词
     if 'search_results' not in st.session_state:
-        st.session_state.search_results = []
+        st.session_state.search_results = None
     if 'search_page' not in st.session_state:
         st.session_state.search_page = 1
-    if 'last_query' not in st.session_state:
-        st.session_state.last_query = ""
     
-    # 组合缓存键
-    current_key = f"{query}_{dataset_id}_{filter_author}_{filter_title}_{search_limit}"
+    # 查询指纹
+    facets = facets or {}
+    current_key = fingerprint(query, dataset_id, filter_author, filter_title, search_limit, use_syntax,
+                              sorted(facets.items()))
+
+    live = incremental and not use_syntax and (query or filter_author or filter_title)
+    if not live and st.session_state.get("search_job") is not None:
+        # 关闭边输入边搜索或清空输入时，放弃仍在进行的任务
+        st.session_state.search_job.cancel()
+        st.session_state.search_job = None
 
     if query or filter_author or filter_title:
         # 如果查询条件改变，执行新搜索
-        if current_key != st.session_state.last_query:
+        cached = st.session_state.search_results
+        search_hit = cached is not None and cached.fingerprint == current_key
+        record_cache("search_session", search_hit)
+        if not search_hit and live:
+            job = st.session_state.get("search_job")
+            if job is None or st.session_state.search_job_key != current_key:
+                st.session_state.search_job = get_searcher().submit(
+                    loader, dataset_id, query, filter_author or None, filter_title or None, search_limit, facets,
+                    previous=job)
+                st.session_state.search_job_key = current_key
+            show_search_progress(loader)
+            return
+        if not search_hit:
             # Display what is being searched
             search_info = []
             if query: search_info.append(f"关键词: {query}")
             if filter_author: search_info.append(f"作者: {filter_author}")
             if filter_title: search_info.append(f"标题: {filter_title}")
+            search_info += [f"{SIDEBAR_FACETS[facet]}: {value}" for facet, value in facets.items()]
             
             with st.spinner(f"正在搜索 ({', '.join(search_info)})..."):
-                results = search_poems(loader, dataset_id, query, filter_author, filter_title, search_limit)
-                st.session_state.search_results = results
-                st.session_state.last_query = current_key
+                if use_syntax:
+                    # 高级筛选并入查询，作为 author: / title: 条件
+                    parts = [f"({query})"] if query else []
+                    if filter_author:
+                        parts.append(f'author:"{filter_author}"')
+                    if filter_title:
+                        parts.append(f'title:"{filter_title}"')
+                    parts += [f'{facet}:"{value}"' for facet, value in facets.items()]
+                    try:
+                        results = query_poems(loader, dataset_id, " ".join(parts), search_limit,
+                                              converters=get_converters())
+                    except ValueError as e:
+                        st.error(f"查询语法错误: {e}")
+                        return
+                else:
+                    results = search_poems(loader, dataset_id, query, filter_author, filter_title, search_limit,
+                                           converters=get_converters(), facets=facets)
+                # 精确匹配落空时，按编辑距离找最接近的诗句（应对记错一两个字）
+                st.session_state.search_fuzzy = []
+                if not results and query and not use_syntax:
+                    st.session_state.search_fuzzy = fuzzy_poems(loader, dataset_id, query, limit=20,
+                                                                converters=get_converters())
+                st.session_state.search_results = ResultSet.from_poems(current_key, results)
                 st.session_state.search_page = 1
         
         results = st.session_state.search_results
         
         if results:
             st.success(f"找到 {len(results)} 条结果")
+            if query and not use_syntax and st.button("📍 定位出处", help="统计该词句在全部文集正文中逐行出现的位置（首次使用需要建立索引）"):
+                show_quote_locations(loader, query)
             
             # 分页配置
             page_size = 20
@@ -633,408 +860,120 @@ def show_search_mode(loader, dataset_id):
             
             start_idx = (current_page - 1) * page_size
             end_idx = min(start_idx + page_size, total_items)
-            current_results = results[start_idx : end_idx]
+            current_results = results.page(loader, start_idx, end_idx)
             
             st.caption(f"显示第 {start_idx + 1} - {end_idx} 条")
 
             for idx, poem in enumerate(current_results):
-                # 兼容不同数据格式的显示标题
-                title = poem.get('title', '无题')
-                if isinstance(poem.get('content'), list):
-                    # 某些数据集如诗经，内容在 content 字段且为列表
-                    preview = poem['content'][0]
-                elif isinstance(poem.get('paragraphs'), list):
-                    preview = poem['paragraphs'][0]
-                elif isinstance(poem.get('para'), list):
-                    preview = poem['para'][0]
-                elif isinstance(poem, dict) and 'content' in poem:
-                    content_val = poem['content']
-                    if isinstance(content_val, list) and content_val and isinstance(content_val[0], dict):
-                        # 字典列表（如弟子规）
-                        first_item = content_val[0]
-                        paras = first_item.get('paragraphs', []) or first_item.get('content', [])
-                        preview_text = paras[0] if paras else "..."
-                        preview = f"{first_item.get('chapter', '')} {preview_text}"
-                    elif isinstance(content_val, list) and content_val:
-                        preview = content_val[0]
-                    else:
-                        preview = str(content_val)
-                else:
-                    preview = "点击查看详情"
-                    
-                if title == '无题' and 'chapter' in poem:
-                    title = f"{poem.get('chapter', '')} - {poem.get('section', '')}"
+                title = poem.title
+                if not title:
+                    title = f"{poem.chapter} - {poem.section}" if poem.chapter else '无题'
                 
-                with st.expander(f"{title} - {poem.get('author', '佚名')}"):
+                with st.expander(f"{title} - {poem.author or '佚名'}"):
                     display_poem(poem, simple=True, unique_id=f"search_{idx}")
+        elif st.session_state.get("search_fuzzy"):
+            st.info(f"未找到完全匹配的诗词，以下是 {len(st.session_state.search_fuzzy)} 条相近的诗句")
+            for idx, hit in enumerate(st.session_state.search_fuzzy):
+                with st.expander(f"{hit.line}（差 {hit.distance} 字）—— {hit.poem.display_title} · {hit.poem.author or '佚名'}"):
+                    display_poem(hit.poem, simple=True, unique_id=f"fuzzy_{idx}")
         else:
             st.warning("未找到相关诗词")
 
-def search_poems(loader, dataset_id, query, filter_author=None, filter_title=None, limit=2000):
-    # 注意：这就只是一个简单的演示搜索，对于大数据集可能会慢
-    # 实际应用中应该建立索引
-    
-    targets = []
-    if dataset_id == "all":
-        targets = list(loader.datasets.keys())
-    else:
-        targets = [loader.id_table[dataset_id]]
-    
-    results = []
-    
-    # 准备简繁体多重搜索关键词
-    query_variants = set()
-    if query:
-        s2t, t2s = get_converters()
-        # 原始查询、转繁体、转简体，去重
-        query_variants = {query, s2t.convert(query), t2s.convert(query)}
-        # 转小写并过滤空值
-        query_variants = {q.lower() for q in query_variants if q}
-    
-    def extract_text_recursive(data):
-        """递归提取所有文本内容用于搜索"""
-        text = ""
-        if isinstance(data, dict):
-            # 提取可能的文本字段
-            for key in ['title', 'author', 'chapter', 'section', 'rhythmic']:
-                val = data.get(key)
-                if isinstance(val, str):
-                    text += val + " "
-            
-            # 递归处理内容字段
-            for key in ['paragraphs', 'content', 'para']:
-                val = data.get(key)
-                if val:
-                    text += extract_text_recursive(val) + " "
-        elif isinstance(data, list):
-            for item in data:
-                text += extract_text_recursive(item) + " "
-        elif isinstance(data, str):
-            text += data + " "
-        elif isinstance(data, (int, float)):
-            text += str(data) + " "
-            
-        return text
+@st.fragment(run_every=0.3)
+def show_search_progress(loader, page_size=20):
+    """边输入边搜索：定时读取后台任务已找到的结果，先显示第一页；完成后整页重跑，按普通结果显示"""
+    job = st.session_state.get("search_job")
+    if job is None:
+        return
+    if job.done and job.error:
+        st.error(f"搜索失败: {job.error}")
+        return
+    if job.done:
+        poems = job.poems
+        st.session_state.search_fuzzy = []
+        query = job.args[1]
+        if not poems and query:
+            st.session_state.search_fuzzy = fuzzy_poems(loader, job.args[0], query, limit=20,
+                                                        converters=get_converters())
+        st.session_state.search_results = ResultSet.from_poems(st.session_state.search_job_key, poems)
+        st.session_state.search_page = 1
+        st.session_state.search_job = None
+        st.rerun(scope="app")
+    poems, searched = job.snapshot()
+    total = job.total or 1
+    st.progress(searched / total, text=f"正在搜索… 已找到 {len(poems)} 条（{searched}/{job.total or '?'} 个文集）")
+    for idx, poem in enumerate(poems[:page_size]):
+        with st.expander(f"{poem.display_title} - {poem.author or '佚名'}"):
+            display_poem(poem, simple=True, unique_id=f"search_live_{idx}")
+
+def show_positional_search(loader, dataset_id, limit=200):
+    """飞花令：按字位、句长与同句共现查句"""
+    with st.expander("🌸 飞花令 / 按字位查句", expanded=False):
+        c1, c2, c3 = st.columns([2, 2, 1])
+        with c1:
+            pattern = st.text_input("句式", placeholder="如: ??月????（? 为任意字）", key="positional_pattern")
+        with c2:
+            contains = st.text_input("同句须含", placeholder="如: 花酒", key="positional_contains")
+        with c3:
+            length = st.selectbox("句长", ["不限", 4, 5, 6, 7], key="positional_length")
+        if not (pattern.strip() or contains.strip()):
+            return
+        try:
+            total, found = positional_lines(loader, dataset_id, pattern.strip() or None, contains.strip(),
+                                            None if length == "不限" else length, limit)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        if not total:
+            st.info("没有符合条件的诗句")
+            return
+        st.markdown(f"**共 {total} 句**" + (f"，仅列出前 {len(found)} 句" if total > len(found) else ""))
+        for clause in found:
+            st.caption(f"{clause.text} —— {clause.poem.display_title} · {clause.poem.author or '佚名'}")
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def similar_available():
+    """相似作品索引是否可用；检查需要遍历源文件属性，短时间内复用结果"""
+    return similar_ready(get_loader())
+
+def loader_name(target):
+    return get_loader().datasets.get(target, {}).get("name", target)
+
+
+def show_quote_locations(loader, query, limit=50):
+    with st.spinner("正在定位..."):
+        counts, found = locate_quote(loader, query, limit, converters=get_converters())
+    total = sum(counts.values())
+    if not total:
+        st.info("正文中没有逐字相同的句子（可能出现在标题或作者中）")
+        return
+    st.markdown(f"**「{query}」在正文中出现 {total} 次**")
+    st.table([{"文集": loader.datasets[t].get("name", t), "次数": n}
+              for t, n in sorted(counts.items(), key=lambda kv: -kv[1])])
+    for occ in found:
+        poem = loader.get_records(occ.dataset)[occ.pid]
+        st.caption(f"{loader.datasets[occ.dataset].get('name', occ.dataset)} · {poem.display_title} · "
+                   f"{poem.author or '佚名'} · 第 {occ.line_no + 1} 行：{poem.lines[occ.line_no]}")
+    if total > len(found):
+        st.caption(f"仅列出前 {len(found)} 处")
 
-    for target in targets:
-        if len(results) >= limit:
-            break
-            
-        # 使用新的 get_poems 方法获取完整对象
-        poems = loader.get_poems(target)
-        if not poems:
-            continue
-            
-        for poem in poems:
-            if len(results) >= limit:
-                break
-            
-            # 1. 高级筛选 (AND 逻辑)
-            if filter_author:
-                poem_author = poem.get('author', '')
-                if not poem_author or filter_author not in poem_author:
-                    continue
-            
-            if filter_title:
-                poem_title = poem.get('title', '')
-                if not poem_title or filter_title not in poem_title:
-                    continue
-
-            # 2. 关键词匹配
-            match = False
-            if not query:
-                # 如果没有关键词，但通过了高级筛选，则视为匹配
-                match = True
-            else:
-                # 默认全字段搜索 (包含标题、作者、内容)
-                # 使用递归提取全文进行搜索
-                full_content = extract_text_recursive(poem).lower()
-                if any(q in full_content for q in query_variants):
-                    match = True
-            
-            if match:
-                results.append(poem)
-                
-    return results
 
 def display_poem(poem, simple=False, unique_id=None, show_ai_ui=True):
-    # 这里的 poem 应该是一个字典对象了
-    if not isinstance(poem, dict):
+    # 这里的 poem 应该是 Poem 记录，笔记模式下为字典
+    if not isinstance(poem, (Poem, dict)):
         st.error(f"数据格式错误: {type(poem)}")
         st.text(str(poem))
         return
 
-    # 获取原始内容
-    raw_title = poem.get('title', '')
-    if not raw_title: raw_title = poem.get('rhythmic', '')
-    if not raw_title: raw_title = poem.get('chapter', '无题')
-    
-    raw_author = poem.get('author', '佚名')
-    
-    # 统一获取内容入口
-    paragraphs = poem.get('paragraphs', [])
-    if not paragraphs:
-        paragraphs = poem.get('content', [])
-    if not paragraphs:
-        paragraphs = poem.get('para', [])
-    
-    if isinstance(paragraphs, str):
-        paragraphs = [paragraphs]
-    
-    # 简繁转换准备
-    s2t, t2s = get_converters()
-    
-    # 辅助函数：递归处理内容转换和 HTML 生成
-    def process_content(content_data, converter, level=0):
-        html_parts = []
-        text_parts = []
-        
-        if not content_data:
-            return "", ""
-            
-        if isinstance(content_data, list):
-            if not content_data:
-                return "", ""
-                
-            first_item = content_data[0]
-            
-            if isinstance(first_item, str):
-                # 字符串列表（最底层内容）
-                for line in content_data:
-                    if isinstance(line, str):
-                        converted_line = converter.convert(line)
-                        html_parts.append(f'<div>{converted_line}</div>')
-                        text_parts.append(converted_line)
-                        
-            elif isinstance(first_item, dict):
-                # 字典列表（嵌套章节/卷）
-                for item in content_data:
-                    if not isinstance(item, dict): continue
-                    
-                    # 尝试获取章节标题
-                    # 优先级：chapter > title > section
-                    chap_title = item.get('chapter') or item.get('title') or item.get('section') or ''
-                    
-                    if chap_title:
-                        conv_title = converter.convert(chap_title)
-                        # 根据层级调整标题样式，避免全是 h3
-                        font_size = max(16, 20 - level * 2)
-                        margin_top = 15 if level == 0 else 10
-                        html_parts.append(f'<h3 style="margin: {margin_top}px 0 10px 0; font-size: {font_size}px;">{conv_title}</h3>')
-                        text_parts.append(conv_title)
-                    
-                    # 递归获取下级内容
-                    sub_content = item.get('paragraphs') or item.get('content') or item.get('para') or []
-                    
-                    sub_html, sub_text = process_content(sub_content, converter, level + 1)
-                    html_parts.append(sub_html)
-                    if sub_text:
-                        text_parts.append(sub_text)
-                        
-        elif isinstance(content_data, str):
-            # 纯字符串
-            converted = converter.convert(content_data)
-            html_parts.append(f'<div>{converted}</div>')
-            text_parts.append(converted)
-            
-        return "".join(html_parts), "。".join(text_parts)
+    rendered = render_poem(poem, get_converters(), simple=simple)
+    html_content = rendered["html"]
+    total_height = rendered["height"]
+    scrolling = rendered["scrolling"]
+    sim_title = rendered["title"]
+    sim_author = rendered["author"]
+    sim_full_text = rendered["full_text"]
 
-    # 生成简体版
-    sim_title = t2s.convert(raw_title)
-    sim_author = t2s.convert(raw_author)
-    sim_content_html, sim_full_text = process_content(paragraphs, t2s)
-    
-    # 生成繁体版
-    trad_title = s2t.convert(sim_title)
-    trad_author = s2t.convert(sim_author)
-    trad_content_html, trad_full_text = process_content(paragraphs, s2t)
-    
-    # 构造数据对象
-    data_sim = json.dumps({
-        "title": sim_title,
-        "author": sim_author,
-        "content_html": sim_content_html,
-        "full_text": f"{sim_title}。{sim_author}。{sim_full_text}"
-    })
-    
-    data_trad = json.dumps({
-        "title": trad_title,
-        "author": trad_author,
-        "content_html": trad_content_html,
-        "full_text": f"{trad_title}。{trad_author}。{trad_full_text}"
-    })
-    
-    # 计算 iframe 高度 (粗略估计)
-    # 简单的行数估计不再准确，这里给一个更大的默认值或基于字符数估计
-    content_len = len(sim_full_text)
-    # 增加基础高度，并稍微放宽每行的估算
-    estimated_height = 200 + (content_len / 20) * 35 
-    if estimated_height < 300: estimated_height = 300
-    
-    total_height = int(estimated_height)
-    # 设置最大高度，超过则滚动
-    if total_height > 600:
-        total_height = 600
-    
-    # 始终启用滚动，防止估算错误导致内容被截断
-    scrolling = True
-
-    # HTML 模板
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-    <style>
-        body {{
-            font-family: "KaiTi", "SimKai", "Microsoft YaHei", serif;
-            text-align: center;
-            background-color: {'#ffffff' if simple else '#f9f9f9'};
-            padding: 10px;
-            margin: 0;
-            overflow-y: auto;  /* 始终允许滚动 */
-        }}
-        /* 隐藏滚动条但保留功能 (可选，这里为了用户体验保留默认滚动条) */
-        ::-webkit-scrollbar {{
-            width: 8px;
-        }}
-        ::-webkit-scrollbar-track {{
-            background: #f1f1f1; 
-        }}
-        ::-webkit-scrollbar-thumb {{
-            background: #888; 
-            border-radius: 4px;
-        }}
-        ::-webkit-scrollbar-thumb:hover {{
-            background: #555; 
-        }}
-        .poem-card {{
-            background-color: #fff;
-            padding: 20px;
-            border-radius: 10px;
-            box-shadow: {'none' if simple else '0 2px 4px rgba(0,0,0,0.05)'};
-        }}
-        .header {{
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            margin-bottom: 10px;
-        }}
-        .title {{
-            font-size: 24px;
-            font-weight: bold;
-            color: #2c3e50;
-            margin-right: 10px;
-        }}
-        .controls {{
-            display: flex;
-            align-items: center;
-        }}
-        .btn {{
-            cursor: pointer;
-            background: none;
-            border: none;
-            font-size: 24px;
-            margin: 0 5px;
-            transition: transform 0.2s;
-            padding: 0;
-            line-height: 1;
-        }}
-        .play-btn {{ color: #3498db; }}
-        .play-btn:hover {{ color: #2980b9; transform: scale(1.1); }}
-        .stop-btn {{ color: #e74c3c; }}
-        .stop-btn:hover {{ color: #c0392b; transform: scale(1.1); }}
-        .font-btn {{ 
-            color: #8e44ad; 
-            font-size: 16px; 
-            border: 1px solid #8e44ad; 
-            border-radius: 4px; 
-            padding: 2px 6px;
-            font-weight: bold;
-        }}
-        .font-btn:hover {{ background-color: #8e44ad; color: white; }}
-        
-        .author {{
-            font-size: 16px;
-            color: #7f8c8d;
-            margin-bottom: 20px;
-            font-style: italic;
-        }}
-        .content {{
-            font-size: 18px;
-            line-height: 2;
-            color: #34495e;
-        }}
-    </style>
-    </head>
-    <body>
-        <div class="poem-card">
-            <div class="header">
-                <span class="title" id="title">{sim_title}</span>
-                <div class="controls">
-                    <button class="btn play-btn" onclick="playSpeech()" title="朗读">🔊</button>
-                    <button class="btn stop-btn" onclick="stopSpeech()" title="停止">⏹</button>
-                    <button class="btn font-btn" onclick="toggleFont()" title="简/繁切换">繁</button>
-                </div>
-            </div>
-            <div class="author" id="author">{sim_author}</div>
-            <div class="content" id="content">
-                {sim_content_html}
-            </div>
-        </div>
-
-        <script>
-            var dataSim = {data_sim};
-            var dataTrad = {data_trad};
-            var isTraditional = false;
-            var synth = window.speechSynthesis;
-            var currentUtterance = null;
-
-            function toggleFont() {{
-                isTraditional = !isTraditional;
-                var data = isTraditional ? dataTrad : dataSim;
-                document.getElementById('title').innerText = data.title;
-                document.getElementById('author').innerText = data.author;
-                document.getElementById('content').innerHTML = data.content_html;
-                document.querySelector('.font-btn').innerText = isTraditional ? '简' : '繁';
-            }}
-
-            function playSpeech() {{
-                stopSpeech();
-                var data = isTraditional ? dataTrad : dataSim;
-                var text = data.full_text;
-                
-                var utterance = new SpeechSynthesisUtterance(text);
-                utterance.lang = "zh-CN";
-                utterance.rate = 0.9;
-                
-                // 尝试选择中文语音
-                var voices = synth.getVoices();
-                var zhVoice = voices.find(v => v.lang.includes('zh') || v.lang.includes('CN'));
-                if (zhVoice) {{
-                    utterance.voice = zhVoice;
-                }}
-                
-                currentUtterance = utterance;
-                synth.speak(utterance);
-            }}
-            
-            function stopSpeech() {{
-                if (synth.speaking) {{
-                    synth.cancel();
-                }}
-            }}
-            
-            // 加载语音列表
-            if (speechSynthesis.onvoiceschanged !== undefined) {{
-                speechSynthesis.onvoiceschanged = function() {{
-                    window.speechSynthesis.getVoices(); 
-                }};
-            }}
-        </script>
-    </body>
-    </html>
-    """
-    
     ai_enabled = st.session_state.get('ai_enabled', False)
     
     # 只有当 AI 开启 且 允许显示 AI UI 时才分栏显示
@@ -1086,6 +1025,31 @@ def display_poem(poem, simple=False, unique_id=None, show_ai_ui=True):
         # 否则只显示诗词卡片 (AI 未开启 或 显式不显示 AI UI)
         components.html(html_content, height=total_height, scrolling=scrolling) 
 
+    # 笔记模式下是字典，没有在数据集中的位置
+    if isinstance(poem, Poem) and show_ai_ui:
+        key_suffix = unique_id if unique_id is not None else f"{poem.dataset}_{poem.pid}"
+        ready = similar_available()
+        help_text = "按字与词的 TF-IDF 向量查找用字相近的作品" if ready else \
+            "相似作品索引尚未建立：后台预热完成后即可使用，也可预先运行 python -m loader.similar"
+        if st.button("🔗 相似作品", key=f"similar_{key_suffix}", help=help_text, disabled=not ready):
+            with st.spinner("正在查找相似作品..."):
+                found = similar_poems(get_loader(), [poem], k=8)[0]
+            for other, score in found:
+                preview = other.lines[0] if other.lines else ""
+                st.caption(f"{score:.2f} · {loader_name(other.dataset)} · {other.display_title} · "
+                           f"{other.author or '佚名'}：{preview}")
+        if st.button("🎵 同韵作品", key=f"rhyme_{key_suffix}", help="按平水韵查找押同一韵部的作品，共有韵脚字多的在前"):
+            with st.spinner("正在查找同韵作品..."):
+                group, chars, found = same_rhyme_poems(get_loader(), poem, limit=8)
+            if group is None:
+                st.info("未能判断这首作品所押的韵部")
+            else:
+                st.markdown(f"**{group}** · 韵脚：{'、'.join(chars)}")
+                for other, shared in found:
+                    preview = other.lines[0] if other.lines else ""
+                    st.caption(f"同韵脚 {shared} 字 · {loader_name(other.dataset)} · {other.display_title} · "
+                               f"{other.author or '佚名'}：{preview}")
+
 
 if __name__ == "__main__":
     main()
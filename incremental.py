@@ -0,0 +1,105 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from loader.metrics import record_cache, registry
+from results import ResultSet, result_cache
+from search import iter_search_poems, search_key
+
+logger = logging.getLogger(__name__)
+
+# 工作线程数与防抖间隔（秒）：连续输入时，间隔内被新查询取代的任务不做任何搜索
+SEARCH_WORKERS = 2
+DEBOUNCE = 0.2
+
+_jobs = registry.counter("incremental_search_jobs_total", "Incremental search jobs by outcome")
+
+
+class SearchJob():
+    """ 一次边输入边搜索的任务：结果按文集逐批追加，可随时读取已有的部分 """
+
+    def __init__(self, key: str, args: tuple) -> None:
+        self.key = key
+        self.args = args
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.poems = []
+        self.datasets = 0  # 已搜索完的文集数
+        self.total = 0  # 需要搜索的文集数，开始搜索前为 0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    @property
+    def done(self) -> bool:
+        return self.finished.is_set()
+
+    def snapshot(self) -> tuple:
+        """ (目前的结果, 已搜索的文集数) """
+        with self._lock:
+            return list(self.poems), self.datasets
+
+    def _extend(self, poems: list) -> None:
+        with self._lock:
+            self.poems += poems
+            self.datasets += 1
+
+    def results(self) -> ResultSet:
+        """ 完成后的全部结果 """
+        return ResultSet.from_poems(self.key, self.poems)
+
+
+class IncrementalSearch():
+    """ 边输入边搜索：任务在线程池中执行，不占用界面脚本的线程
+
+    新的查询提交时取消同一会话的上一个任务；任务先等待 DEBOUNCE 秒，期间被取消则不做任何搜索，
+    搜索中被取消时至多再核对 search.CANCEL_CHECK 个候选。结果完整时写入共享的结果缓存，命中缓存的查询立即完成。
+    """
+
+    def __init__(self, workers: int = SEARCH_WORKERS, debounce: float = DEBOUNCE) -> None:
+        self.debounce = debounce
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+
+    def submit(self, loader, dataset_id, query, filter_author=None, filter_title=None, limit=2000, facets=None,
+               previous: SearchJob = None) -> SearchJob:
+        if previous is not None:
+            previous.cancel()
+        key = search_key(dataset_id, query, filter_author, filter_title, limit, facets)
+        job = SearchJob(key, (dataset_id, query, filter_author, filter_title, limit, facets))
+        cached = result_cache.get(loader, key)
+        record_cache("search_shared", cached is not None)
+        if cached is not None:
+            job.poems = cached.page(loader, 0, len(cached))
+            job.datasets = job.total = 1
+            job.finished.set()
+            _jobs.inc(outcome="cached")
+            return job
+        self._pool.submit(self._run, loader, job)
+        return job
+
+    def _run(self, loader, job: SearchJob) -> None:
+        try:
+            if job.cancelled.wait(self.debounce):
+                _jobs.inc(outcome="skipped")
+                return
+            dataset_id = job.args[0]
+            job.total = len(loader.datasets) if dataset_id == "all" else 1
+            for _, found, _ in iter_search_poems(loader, *job.args, cancel=job.cancelled):
+                job._extend(found)
+            if job.cancelled.is_set():
+                _jobs.inc(outcome="cancelled")
+                return
+            job.datasets = job.total
+            result_cache.put(loader, job.results())
+            _jobs.inc(outcome="completed")
+        except Exception as e:
+            job.error = str(e)
+            logger.warning("incremental search failed: %s", e)
+            _jobs.inc(outcome="failed")
+        finally:
+            job.finished.set()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,223 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
+
+# 纯文字相似度在此区间内视为缺字/错字，用新数据覆盖
+UPDATE_RATIO = 0.9
+# 候选重排时最多比较的候选数
+TOP_CANDIDATES = 8
+CI_FILE_PATTERN = re.compile(r"ci\.song\.\d+\.json")
+
+
+def only_text(text: str) -> str:
+    """ 去除标点只保留文字 """
+    return re.sub(r"[，。、《》…（）·・\s]", "", text)
+
+
+def record_text(record: dict, tag: str = "paragraphs") -> str:
+    return only_text("".join(record.get(tag) or []))
+
+
+def record_key(text: str) -> str:
+    """ 纯文字的哈希键，用于精确匹配 """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def bigrams(text: str) -> set:
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class AlignIndex():
+    """ 新数据的对齐索引：哈希键精确匹配 + 二元组倒排索引模糊召回 """
+
+    def __init__(self, records: list, tag: str = "paragraphs") -> None:
+        self.records = records
+        self.tag = tag
+        self.texts = [record_text(r, tag) for r in records]
+        # 哈希键 -> 文本相同的全部下标，重复的文本可以分别对上
+        self.by_key = defaultdict(list)
+        self.postings = defaultdict(list)
+        for i, text in enumerate(self.texts):
+            self.by_key[record_key(text)].append(i)
+            for gram in bigrams(text):
+                self.postings[gram].append(i)
+
+    def candidates(self, text: str, limit: int = TOP_CANDIDATES, exclude=()) -> list:
+        """ 按共享二元组数量召回候选，返回 [(下标, 共享数)]；exclude 中的下标不召回 """
+        counts = defaultdict(int)
+        grams = bigrams(text)
+        # 跳过过于常见的二元组，避免单次召回退化为全表扫描
+        cutoff = max(50, len(self.records) // 20)
+        skipped = []
+        for gram in grams:
+            posting = self.postings.get(gram, ())
+            if len(posting) > cutoff:
+                skipped.append(posting)
+                continue
+            for i in posting:
+                if i not in exclude:
+                    counts[i] += 1
+        if not counts:
+            # 全由常见二元组组成的短词：只能用被跳过的倒排表召回
+            for posting in skipped:
+                for i in posting:
+                    if i not in exclude:
+                        counts[i] += 1
+        # 共享数相同时长度相近的在前
+        ranked = sorted(counts.items(), key=lambda kv: (-kv[1], abs(len(self.texts[kv[0]]) - len(text))))
+        return ranked[:limit]
+
+    def exact(self, record: dict) -> list:
+        """ 纯文字完全相同的新数据下标 """
+        return self.by_key.get(record_key(record_text(record, self.tag)), [])
+
+    def scored(self, record: dict, exclude=()) -> list:
+        """ 模糊召回的候选按 (相似度, 同作者/词牌数) 降序排列，返回 [(相似度, 同作者/词牌数, 下标)] """
+        text = record_text(record, self.tag)
+        found = [(SequenceMatcher(a=text, b=self.texts[i], autojunk=False).ratio(), self._same_meta(record, i), i)
+                 for i, _ in self.candidates(text, exclude=exclude)]
+        found.sort(key=lambda item: (-item[0], -item[1], item[2]))
+        return found
+
+    def match(self, record: dict) -> tuple:
+        """ 返回 (新数据下标, 相似度)，找不到时下标为 None """
+        hits = self.exact(record)
+        if hits:
+            return hits[0], 1.0
+        found = self.scored(record)
+        return (found[0][2], found[0][0]) if found else (None, 0.0)
+
+    def _same_meta(self, record: dict, i: int) -> int:
+        other = self.records[i]
+        return sum(record.get(k) == other.get(k) for k in ("author", "rhythmic"))
+
+
+def assign(old_data: list, index: AlignIndex) -> dict:
+    """ 一一对齐：每条新数据至多对应一条旧数据，返回 {旧下标: (新下标, 相似度)}
+
+    先按顺序分配文字完全相同的，其余的候选对按相似度从高到低贪心分配，已被占用的新数据不再分配。
+    """
+    assigned, used = {}, set()
+    for i, record in enumerate(old_data):
+        for j in index.exact(record):
+            if j not in used:
+                assigned[i] = (j, 1.0)
+                used.add(j)
+                break
+    pairs = []
+    for i, record in enumerate(old_data):
+        if i not in assigned:
+            pairs += [(-ratio, -meta, i, j) for ratio, meta, j in index.scored(record, used)]
+    pairs.sort()
+    for ratio, _, i, j in pairs:
+        if i not in assigned and j not in used:
+            assigned[i] = (j, -ratio)
+            used.add(j)
+    return assigned
+
+
+def merge_records(old_data: list, index: AlignIndex, threshold: float = UPDATE_RATIO) -> dict:
+    """ 按一一对齐的结果更新 old_data，返回差异报告 """
+    report = {"same": 0, "updated": [], "conflicts": [], "missing": []}
+    assigned = assign(old_data, index)
+    for i, record in enumerate(old_data):
+        if i not in assigned:
+            report["missing"].append({"index": i, "text": record_text(record, index.tag)})
+            continue
+        j, ratio = assigned[i]
+        new = index.records[j]
+        if ratio >= 1.0:
+            report["same"] += 1
+            if record.get("author") != new.get("author"):
+                report["updated"].append({"index": i, "ratio": 1.0, "author": [record.get("author"), new.get("author")]})
+            record["author"] = new.get("author")
+        elif ratio >= threshold:
+            # 假定此范围内说明缺字，需要更新
+            report["updated"].append({
+                "index": i, "ratio": round(ratio, 4),
+                "old": record.get(index.tag), "new": new.get(index.tag),
+            })
+            record["author"] = new.get("author")
+            record[index.tag] = new.get(index.tag)
+        else:
+            # 异常情况只记录，不更新
+            report["conflicts"].append({
+                "index": i, "ratio": round(ratio, 4),
+                "old": record_text(record, index.tag), "new": index.texts[j],
+            })
+    return report
+
+
+def dump_ci(data: list) -> str:
+    """ 原文件中逗号后有空格，这里保持一致 """
+    return json.dumps(data, indent=2, ensure_ascii=False).replace(",", ", ")
+
+
+_index = None
+
+
+def _init_worker(new_path: str, tag: str) -> None:
+    global _index
+    with open(new_path, "r", encoding="utf-8") as f:
+        _index = AlignIndex(json.load(f), tag)
+
+
+def _align_file(path: str, threshold: float, write: bool, transform=None) -> tuple:
+    with open(path, "r", encoding="utf-8") as f:
+        old_data = json.load(f)
+    report = merge_records(old_data, _index, threshold)
+    # transform 在合并后原地修改数据（如字形规范化），返回是否有改动
+    changed = transform(old_data) if transform is not None else False
+    if write and (report["updated"] or changed):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(dump_ci(old_data))
+        os.replace(tmp, path)
+    return os.path.basename(path), report
+
+
+def align_directory(new_path: str, directory: str, tag: str = "paragraphs",
+                    threshold: float = UPDATE_RATIO, write: bool = True, workers: int = None,
+                    transform=None) -> dict:
+    """ 并行对齐目录下所有 ci.song.*.json，返回 {文件名: 报告}
+
+    transform 为可 pickle 的模块级函数，合并后对每个文件的数据调用一次，与合并结果一起原子写回。
+    """
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if CI_FILE_PATTERN.fullmatch(f))
+    reports = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(new_path, tag)) as pool:
+        futures = [pool.submit(_align_file, path, threshold, write, transform) for path in files]
+        for future in futures:
+            name, report = future.result()
+            reports[name] = report
+            logging.info("%s: same %d, updated %d, conflicts %d, missing %d", name, report["same"],
+                         len(report["updated"]), len(report["conflicts"]), len(report["missing"]))
+    return reports
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)-9s %(filename)-15s[:%(lineno)d]\t%(message)s")
+    parser = argparse.ArgumentParser(description="将新爬取的数据与现有 ci.song.*.json 对齐合并")
+    parser.add_argument("new_data", help="新爬取的数据，如 all.json")
+    parser.add_argument("--dir", default="./宋词", help="ci.song.*.json 所在目录")
+    parser.add_argument("--report", default="align_report.json", help="差异报告输出路径")
+    parser.add_argument("--threshold", type=float, default=UPDATE_RATIO)
+    parser.add_argument("--dry-run", action="store_true", help="只生成报告，不改写文件")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    reports = align_directory(args.new_data, args.dir, threshold=args.threshold,
+                              write=not args.dry_run, workers=args.workers)
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write(json.dumps(reports, indent=2, ensure_ascii=False))
+    logging.info("Report saved to " + args.report)
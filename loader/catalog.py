@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import json
+import os
+
+from loader.codec import load_file
+from loader.poem import Poem
+
+# 目录结构变化时递增，旧目录随之作废
+CATALOG_VERSION = 1
+CATALOG_NAME = "catalog.json"
+
+
+def catalog_path(loader) -> str:
+    """ 与 datas.json 放在同一目录 """
+    return os.path.join(os.path.dirname(os.path.abspath(loader._path)), CATALOG_NAME)
+
+
+def _sources(loader, target: str) -> list:
+    """ [相对路径, 大小, 修改时间(ns)] """
+    root = loader.top_level_path
+    entries = []
+    for path in loader.dataset_files(target):
+        st = os.stat(path)
+        entries.append([os.path.relpath(path, root).replace(os.sep, "/"), st.st_size, st.st_mtime_ns])
+    return entries
+
+
+def content_hash(paths: list) -> str:
+    """ 各文件内容依次拼接的摘要 """
+    content = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                content.update(chunk)
+    return content.hexdigest()
+
+
+def _type_name(value) -> str:
+    name = type(value).__name__
+    if isinstance(value, list) and value:
+        inner = {type(item).__name__ for item in value}
+        name += f"[{inner.pop() if len(inner) == 1 else 'mixed'}]"
+    return name
+
+
+def dataset_entry(loader, target: str) -> dict:
+    """ 逐个文件读取数据集，统计首数、行数、字数、文件数、字节数，推断各键的类型并计算内容摘要
+
+    首数与行数的计法与 get_records 一致；schema 为 {键: 类型}，类型不止一种时以 | 连接，并非每条都有的键带 ?。
+    """
+    poems = lines = chars = 0
+    types, seen = {}, {}
+    errors = 0
+    paths = loader.dataset_files(target)
+    for path in paths:
+        try:
+            data = load_file(path)
+        except Exception as e:
+            print(f"Error reading {path}: {e}")
+            errors += 1
+            continue
+        items = data if isinstance(data, list) else [data]
+        for item in items:
+            if not hasattr(item, "get"):
+                continue
+            poem = Poem.from_dict(item, target, poems)
+            poems += 1
+            lines += len(poem.lines)
+            chars += sum(len(line) for line in poem.lines)
+            for key, value in item.items():
+                types.setdefault(key, set()).add(_type_name(value))
+                seen[key] = seen.get(key, 0) + 1
+    schema = {key: "|".join(sorted(names)) + ("" if seen[key] == poems else "?")
+              for key, names in sorted(types.items())}
+    sources = _sources(loader, target)
+    return {
+        "name": loader.datasets[target].get("name", target),
+        "poems": poems,
+        "lines": lines,
+        "chars": chars,
+        "files": len(paths),
+        "bytes": sum(size for _, size, _ in sources),
+        "schema": schema,
+        "content_hash": content_hash(paths),
+        "errors": errors,
+        "sources": sources,
+    }
+
+
+def read_catalog(loader) -> dict:
+    """ 目录文件中的全部条目 {数据集: 条目}，文件不存在或版本不符时为空 """
+    try:
+        with open(catalog_path(loader), "r", encoding="utf-8") as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if catalog.get("version") != CATALOG_VERSION:
+        return {}
+    return catalog.get("datasets", {})
+
+
+def write_catalog(loader, datasets: dict) -> str:
+    path = catalog_path(loader)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": CATALOG_VERSION, "datasets": datasets}, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+    return path
+
+
+def _check(loader, target: str, entry: dict) -> str:
+    """ 条目的状态："valid" 仍然有效；"touched" 只有修改时间变化而内容相同（如重新检出）；"stale" 已失效
+
+    路径或大小不同即失效；只有修改时间不同时重新计算内容摘要确认，就地等宽替换字符等改动不会被误认为有效。
+    """
+    recorded = entry.get("sources") or []
+    current = _sources(loader, target)
+    if [source[:2] for source in recorded] != [source[:2] for source in current]:
+        return "stale"
+    if recorded == current:
+        return "valid"
+    paths = [os.path.join(loader.top_level_path, source[0]) for source in current]
+    if content_hash(paths) != entry.get("content_hash"):
+        return "stale"
+    entry["sources"] = current
+    return "touched"
+
+
+def load_catalog(loader) -> dict:
+    """ 仍然有效的条目；通常只读取文件属性，修改时间变化的数据集才重新计算摘要，确认后写回新的修改时间 """
+    catalog = {target: entry for target, entry in read_catalog(loader).items() if target in loader.datasets}
+    states = {target: _check(loader, target, entry) for target, entry in catalog.items()}
+    if "touched" in states.values():
+        try:
+            write_catalog(loader, catalog)
+        except OSError:
+            pass
+    return {target: entry for target, entry in catalog.items() if states[target] != "stale"}
+
+
+def build_catalog(loader, targets: list = None, force: bool = False) -> dict:
+    """ 重建缺失或失效的条目（force 时重建 targets 中的全部）并写回，返回全部有效条目 """
+    catalog = {target: entry for target, entry in read_catalog(loader).items() if target in loader.datasets}
+    fresh = load_catalog(loader)
+    rebuilt = {target: dataset_entry(loader, target) for target in targets or list(loader.datasets)
+               if force or target not in fresh}
+    valid = {**fresh, **rebuilt}
+    catalog.update(valid)
+    write_catalog(loader, {target: catalog[target] for target in loader.datasets if target in catalog})
+    return {target: valid[target] for target in loader.datasets if target in valid}
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+if __name__ == "__main__":
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+
+    parser = argparse.ArgumentParser(description="构建或查看数据集目录（首数、行数、字数、文件、大小、字段与内容摘要）")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--dataset", action="append", help="只处理这些数据集，可重复")
+    parser.add_argument("--rebuild", action="store_true", help="重建条目，即使仍然有效")
+    parser.add_argument("--show", action="store_true", help="只显示，不构建缺失或失效的条目")
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    if args.show:
+        catalog = load_catalog(loader)
+    else:
+        catalog = build_catalog(loader, args.dataset, args.rebuild)
+    for target in loader.datasets:
+        entry = catalog.get(target)
+        if entry is None:
+            print(f"{target}: (无有效条目)")
+            continue
+        print(f"{target}: {entry['poems']} 首 {entry['lines']} 行 {entry['chars']} 字, "
+              f"{entry['files']} 个文件 {format_size(entry['bytes'])}, {entry['content_hash']}")
+        print(f"  schema: {entry['schema']}")
@@ -0,0 +1,139 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+
+import aiohttp
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString
+
+
+BASE_URL = "http://qsc.zww.cn/getdata.asp"
+PAGE_COUNT = 1239
+
+
+def parse_index_page(text: str) -> list:
+    """ 解析目录页，返回 [{rhythmic, author, param}]，param 为获取正文的参数 """
+    content = []
+    soup = BeautifulSoup(re.search(r"filllist\('·(.*?)'\);", text).group(1), features="lxml")
+    for i, a in enumerate(soup.find_all(name="a")):
+        if i % 2 == 0:
+            content.append({
+                "rhythmic": a.string.split("（")[0],
+                "param": re.search(r"doseek2\((.*?)\);", a["onclick"]).group(1).split(",")
+            })
+        else:
+            content[-1]["author"] = a.string
+    return content
+
+
+def parse_paragraphs(text: str) -> list:
+    """ 解析正文页，返回词的内容段落 """
+    paragraphs = []
+    soup = BeautifulSoup(re.search(r"fillbody\('(.*?)'\);", text).group(1), features="lxml")
+    for child in soup.find(name="p", align=None).contents:
+        if isinstance(child, NavigableString):
+            paragraphs.append(str(child))
+    return paragraphs
+
+
+class CiCrawler():
+    """ 基于 aiohttp 的并发爬虫：连接池复用、并发上限、失败重试与按页断点续爬 """
+
+    def __init__(self, checkpoint_dir: str, base_url: str = BASE_URL, concurrency: int = 8,
+                 retries: int = 5, backoff: float = 1.0, timeout: float = 30) -> None:
+        self.checkpoint_dir = checkpoint_dir
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def checkpoint_path(self, page: int) -> str:
+        return os.path.join(self.checkpoint_dir, f"page.{page}.json")
+
+    async def fetch(self, session: aiohttp.ClientSession, seek_type: int, seek_value, page_no: int) -> str:
+        """ 带指数退避的 POST 请求，返回 gbk 解码后的文本 """
+        data = {"seektype": seek_type, "seekvalue": seek_value, "pageno": page_no}
+        for attempt in range(self.retries):
+            try:
+                async with self._semaphore:
+                    async with session.post(self.base_url, data=data) as r:
+                        if r.status >= 500:
+                            raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status)
+                        r.raise_for_status()
+                        return (await r.read()).decode("gbk", errors="replace")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries - 1:
+                    raise
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                logging.warning("Retry %s in %.1fs: %s", data, delay, e)
+                await asyncio.sleep(delay)
+
+    async def crawl_page(self, session: aiohttp.ClientSession, page: int) -> list:
+        """ 爬取目录页及其中每首词的正文，完成后写入该页的检查点 """
+        content = parse_index_page(await self.fetch(session, 2, "", page))
+        bodies = await asyncio.gather(*[
+            self.fetch(session, int(c["param"][0]), int(c["param"][1]), 1) for c in content
+        ])
+        for c, body in zip(content, bodies):
+            c["paragraphs"] = parse_paragraphs(body)
+            del c["param"]
+        path = self.checkpoint_path(page)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(json.dumps(content, ensure_ascii=False))
+        os.replace(path + ".tmp", path)
+        logging.info("Success: save page {0}".format(page))
+        return content
+
+    async def crawl(self, pages) -> list:
+        """ 爬取所有尚无检查点的页，失败的页留待下次续爬，返回失败页码 """
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        todo = [p for p in pages if not os.path.exists(self.checkpoint_path(p))]
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+            results = await asyncio.gather(*[self.crawl_page(session, p) for p in todo], return_exceptions=True)
+        failed = []
+        for page, result in zip(todo, results):
+            if isinstance(result, BaseException):
+                logging.error("Failed: page %d: %r", page, result)
+                failed.append(page)
+        return failed
+
+    def merge(self, pages, output: str) -> list:
+        """ 按页码顺序合并检查点为一个文件 """
+        all_data = []
+        for page in pages:
+            with open(self.checkpoint_path(page), "r", encoding="utf-8") as f:
+                all_data.extend(json.load(f))
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(json.dumps(all_data, indent=2, ensure_ascii=False))
+        return all_data
+
+
+def crawl_all(output: str, checkpoint_dir: str, **kwargs) -> list:
+    """ 爬取全部目录页并合并，返回失败页码（为空时已写出 output） """
+    crawler = CiCrawler(checkpoint_dir, **kwargs)
+    pages = range(1, PAGE_COUNT + 1)
+    failed = asyncio.run(crawler.crawl(pages))
+    if not failed:
+        crawler.merge(pages, output)
+    return failed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)-9s %(filename)-15s[:%(lineno)d]\t%(message)s")
+    parser = argparse.ArgumentParser(description="并发爬取全宋词，可中断后续爬")
+    parser.add_argument("--output", default="./宋词/all.json")
+    parser.add_argument("--checkpoints", default="./宋词/.crawl")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=5)
+    args = parser.parse_args()
+    failed = crawl_all(args.output, args.checkpoints, concurrency=args.concurrency, retries=args.retries)
+    if failed:
+        logging.error("%d page(s) failed, run again to resume: %s", len(failed), failed)
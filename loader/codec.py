@@ -0,0 +1,240 @@
+import argparse
+import gzip
+import json
+import os
+
+from loader.jsonbackend import get_backend
+from loader.jsonstyle import detect_style, dumps_style
+
+
+# 存储格式名 -> 文件扩展名。json 为原始的缩进格式，其余为紧凑格式
+FORMATS = {
+    "json": ".json",
+    "minjson": ".min.json",
+    "jsonl": ".jsonl",
+    "json.gz": ".json.gz",
+    "minjson.gz": ".min.json.gz",
+    "jsonl.gz": ".jsonl.gz",
+    "json.zst": ".json.zst",
+    "minjson.zst": ".min.json.zst",
+    "jsonl.zst": ".jsonl.zst",
+}
+# 按扩展名长度倒序匹配，避免 .json 抢先匹配 .min.json
+_EXTS = sorted(FORMATS.values(), key=len, reverse=True)
+COMPACT_EXTS = tuple(ext for ext in _EXTS if ext != ".json")
+# 记录原始格式参数的清单，放在数据文件所在目录，用于还原出逐字节一致的原文件
+MANIFEST_NAME = ".codec.json"
+
+
+def split_ext(filename: str) -> tuple:
+    """ 拆分为 (主干, 扩展名)，不是已知格式时扩展名为空 """
+    for ext in _EXTS:
+        if filename.endswith(ext):
+            return filename[:-len(ext)], ext
+    return filename, ""
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd 压缩格式需要安装 zstandard: pip install zstandard")
+    return zstandard
+
+
+def compress(raw: bytes, compression: str) -> bytes:
+    if compression == "gz":
+        return gzip.compress(raw, mtime=0)
+    if compression == "zst":
+        return _zstd().ZstdCompressor(level=10).compress(raw)
+    return raw
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == "gz":
+        return gzip.decompress(data)
+    if compression == "zst":
+        return _zstd().ZstdDecompressor().decompress(data)
+    return data
+
+
+def read_bytes(filepath: str) -> bytes:
+    """ 读取文件并按扩展名解压 """
+    with open(filepath, "rb") as f:
+        data = f.read()
+    return decompress(data, filepath.rpartition(".")[2])
+
+
+def decode(raw: bytes, ext: str, fields: tuple = None):
+    """ 用当前的解码后端解析，给出 fields 时每条记录只保留这些字段（见 loader/jsonbackend.py） """
+    if ext.startswith(".jsonl"):
+        # 每行都是不含换行的紧凑 JSON，拼成一个数组交给一次解码，比逐行解析快
+        raw = raw.strip()
+        if not raw:
+            return []
+        raw = b"[" + raw.replace(b"\n", b",") + b"]"
+    backend = get_backend()
+    return backend.decode_fields(raw, fields) if fields else backend.loads(raw)
+
+
+def load_file(filepath: str, fields: tuple = None):
+    """ 按扩展名透明地读取任一存储格式 """
+    return decode(read_bytes(filepath), split_ext(os.path.basename(filepath))[1] or ".json", fields)
+
+
+def encode(data, fmt: str) -> bytes:
+    """ 编码为指定的紧凑格式（含压缩） """
+    encoding, _, compression = fmt.partition(".")
+    if encoding == "jsonl":
+        if not isinstance(data, list):
+            raise ValueError("jsonl requires a top-level list")
+        text = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in data)
+    elif encoding == "minjson":
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        raise ValueError(f"unknown encoding {encoding}")
+    return compress(text.encode("utf-8"), compression)
+
+
+def select_files(filenames, fmt: str = "json") -> list:
+    """ 同一主干存在多种格式时只取一个：优先 fmt，其次回退格式，再次原始 json，最后任一其他格式 """
+    compression = fmt.partition(".")[2]
+    preferred = [FORMATS[fmt]]
+    if compression:
+        preferred.append(FORMATS["json." + compression])
+    preferred.append(".json")
+    best = {}
+    for filename in filenames:
+        if filename == MANIFEST_NAME:
+            continue
+        stem, ext = split_ext(filename)
+        rank = preferred.index(ext) if ext in preferred else len(preferred)
+        if stem not in best or rank < best[stem][0]:
+            best[stem] = (rank, filename)
+    return sorted((filename for _, filename in best.values()), key=lambda f: split_ext(f)[0])
+
+
+def _read_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(directory: str, manifest: dict) -> None:
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(json.dumps(manifest, indent=2, ensure_ascii=False, sort_keys=True))
+    os.replace(path + ".tmp", path)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def to_compact(filepath: str, fmt: str, keep_source: bool = False) -> str:
+    """ 将原始 json 转为紧凑格式，返回写出的文件路径
+
+    只有能从紧凑格式逐字节还原原文件时才使用 fmt，否则退回压缩原文（json.gz/json.zst），
+    没有压缩时保留原文件不动。
+    """
+    directory, filename = os.path.split(filepath)
+    stem, _ = split_ext(filename)
+    with open(filepath, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw)
+    style = detect_style(raw.decode("utf-8"))
+    compression = fmt.partition(".")[2]
+    out_fmt = fmt
+    try:
+        payload = encode(data, fmt)
+        restored = dumps_style(decode(decompress(payload, compression), FORMATS[fmt]), style)
+        if restored.encode("utf-8") != raw:
+            raise ValueError("style not reproducible")
+    except ValueError:
+        if not compression:
+            return filepath
+        out_fmt = "json." + compression
+        payload = compress(raw, compression)
+        style = None
+    out_path = os.path.join(directory, stem + FORMATS[out_fmt])
+    _write_atomic(out_path, payload)
+    manifest = _read_manifest(directory)
+    manifest[stem] = {"format": out_fmt, "style": style}
+    _write_manifest(directory, manifest)
+    if not keep_source:
+        os.remove(filepath)
+    return out_path
+
+
+def to_json(filepath: str, keep_source: bool = False) -> str:
+    """ 将紧凑格式还原为原始 json（与转换前逐字节一致） """
+    directory, filename = os.path.split(filepath)
+    stem, ext = split_ext(filename)
+    entry = _read_manifest(directory).get(stem)
+    if entry is None:
+        raise ValueError(f"{filepath} is not listed in {MANIFEST_NAME}")
+    raw = read_bytes(filepath)
+    if entry["style"] is not None:
+        raw = dumps_style(decode(raw, ext), entry["style"]).encode("utf-8")
+    out_path = os.path.join(directory, stem + ".json")
+    _write_atomic(out_path, raw)
+    if not keep_source:
+        os.remove(filepath)
+    return out_path
+
+
+def convert_files(files, fmt: str, keep_source: bool = False) -> list:
+    """ fmt 为 json 时还原，否则压缩；返回 (源文件, 目标文件) 列表 """
+    results = []
+    for filepath in files:
+        if os.path.basename(filepath) == MANIFEST_NAME:
+            continue
+        _, ext = split_ext(os.path.basename(filepath))
+        if fmt == "json":
+            if ext in COMPACT_EXTS:
+                results.append((filepath, to_json(filepath, keep_source)))
+        elif ext == ".json":
+            results.append((filepath, to_compact(filepath, fmt, keep_source)))
+    return results
+
+
+def _dataset_sources(loader, target: str) -> list:
+    """ 数据集当前所有格式的文件 """
+    configs = loader.datasets[target]
+    full_path = os.path.join(loader.top_level_path, configs["path"])
+    if not os.path.isdir(full_path):
+        directory, filename = os.path.split(full_path)
+        stem = split_ext(filename)[0]
+        return [os.path.join(directory, stem + ext) for ext in _EXTS
+                if os.path.exists(os.path.join(directory, stem + ext))]
+    excludes = configs.get("excludes", [])
+    return [os.path.join(full_path, f) for f in sorted(os.listdir(full_path))
+            if f not in excludes and split_ext(f)[1] and os.path.isfile(os.path.join(full_path, f))]
+
+
+if __name__ == "__main__":
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+
+    parser = argparse.ArgumentParser(description="在原始 json 与紧凑存储格式之间转换，可逐字节还原")
+    parser.add_argument("targets", nargs="+", help="datas.json 中的数据集名，或配合 --path 使用的文件/目录")
+    parser.add_argument("--to", default="jsonl.zst", choices=sorted(FORMATS), help="目标格式，json 表示还原")
+    parser.add_argument("--path", action="store_true", help="targets 为文件或目录路径")
+    parser.add_argument("--keep-source", action="store_true", help="保留转换前的文件")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    for target in args.targets:
+        if args.path:
+            files = [os.path.join(target, f) for f in sorted(os.listdir(target))] if os.path.isdir(target) else [target]
+        else:
+            files = _dataset_sources(loader, target)
+        results = convert_files(files, args.to, args.keep_source)
+        fallback = [dst for src, dst in results if not dst.endswith(FORMATS[args.to])]
+        print(f"{target}: {len(results)} file(s) converted, {len(fallback)} kept in fallback format")
+        if not args.path:
+            print(f'  set "format": "{args.to}" for {target} in datas.json to read the converted files')
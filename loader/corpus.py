@@ -0,0 +1,194 @@
+import threading
+import weakref
+
+import numpy as np
+
+from loader.folding import get_fold_table
+from loader.manifest import digest, source_manifest
+from loader.poem import LINE_SEP
+from loader.snapshot import load_cache, save_cache
+
+
+# 索引结构变化时递增，旧缓存随之失效
+CORPUS_VERSION = 2
+# 标点与空白：查询的行首行尾判断、近似搜索、字位、韵脚与相似度索引都按这一组字符忽略或断句
+PUNCTUATION = " \t\r\n，。！？；：、…—·,.!?;:\"'“”‘’「」『』《》〈〉（）()[]【】"
+PUNCTUATION_CODES = np.array(sorted(map(ord, PUNCTUATION)), dtype=np.uint32)
+
+
+def search_fields(poem) -> tuple:
+    """ 参与检索的全部文本：标题、作者、词牌、章节与正文，嵌套正文另含各章节标题 """
+    fields = (poem.title, poem.author, poem.rhythmic, poem.chapter, poem.section, poem.text)
+    if poem.body is not None:
+        fields += tuple(poem.headings())
+    return fields
+
+
+def build_postings(docs: list, fold=None) -> tuple:
+    """ 字 -> 含该字的文档编号（升序、去重），以 CSR 形式存放
+
+    返回 (chars, starts, gids)：chars 为升序的码位，第 i 个字的倒排表为 gids[starts[i]:starts[i + 1]]。
+    fold 为 FoldTable 时按折叠后的字建表（见 loader/folding.py）。
+    """
+    if not docs:
+        return np.zeros(0, np.uint32), np.zeros(1, np.int64), np.zeros(0, np.uint32)
+    lengths = np.fromiter((len(d) for d in docs), dtype=np.int64, count=len(docs))
+    codepoints = np.frombuffer("".join(docs).encode("utf-32-le"), dtype=np.uint32)
+    if fold is not None:
+        codepoints = fold.fold_codes(codepoints)
+    # (码位, 文档号) 拼成一个 64 位键，一次排序即同时完成按字分组与组内按文档号排序
+    keys = codepoints.astype(np.uint64) << np.uint64(32)
+    keys |= np.repeat(np.arange(len(docs), dtype=np.uint64), lengths)
+    keys.sort()
+    keep = np.empty(len(keys), dtype=bool)
+    keep[:1] = True
+    np.not_equal(keys[1:], keys[:-1], out=keep[1:])
+    keys = keys[keep]
+    chars_all = (keys >> np.uint64(32)).astype(np.uint32)
+    gids = (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+    bounds = np.flatnonzero(chars_all[1:] != chars_all[:-1]) + 1
+    starts = np.concatenate(([0], bounds, [len(keys)])).astype(np.int64)
+    return chars_all[starts[:-1]], starts, gids
+
+
+class CorpusIndex():
+    """ 全部数据集的记录按 datas.json 中的 id 顺序连续编号（全局编号 gid），并建字级倒排表
+
+    records[gid] 即 loader.get_records(dataset)[gid - offsets[dataset]]。
+    倒排表按简繁体与异体折叠后的字建立，查询的字也须先经 fold 折叠。
+    """
+
+    def __init__(self, loader, postings: tuple = None) -> None:
+        self.loader = loader
+        self.fold = get_fold_table()
+        self.targets = [loader.id_table[i] for i in sorted(loader.id_table)]
+        self.offsets = {}
+        self.records = []
+        for target in self.targets:
+            self.offsets[target] = len(self.records)
+            self.records += loader.get_records(target)
+        if postings is None:
+            postings = build_postings([LINE_SEP.join(search_fields(p)) for p in self.records], self.fold)
+        self.chars, self.starts, self.gids = postings
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def dataset_range(self, target: str) -> range:
+        start = self.offsets[target]
+        return range(start, start + len(self.loader.get_records(target)))
+
+    def posting(self, char: str) -> np.ndarray:
+        """ 含该字（或其任一变体）的 gid（升序）；不存在时为空数组 """
+        code = ord(self.fold.fold(char))
+        i = int(np.searchsorted(self.chars, code))
+        if i >= len(self.chars) or self.chars[i] != code:
+            return self.gids[:0]
+        return self.gids[self.starts[i]:self.starts[i + 1]]
+
+    def posting_size(self, char: str) -> int:
+        code = ord(self.fold.fold(char))
+        i = int(np.searchsorted(self.chars, code))
+        if i >= len(self.chars) or self.chars[i] != code:
+            return 0
+        return int(self.starts[i + 1] - self.starts[i])
+
+    def state(self) -> dict:
+        return {"postings": (self.chars, self.starts, self.gids), "size": len(self.records)}
+
+
+class LineTable():
+    """ 全部正文行：第 i 行的码位为 codepoints[starts[i]:starts[i + 1]]，属于 records[gids[i]] 的第 line_nos[i] 行 """
+
+    def __init__(self, index: CorpusIndex, state: dict = None) -> None:
+        self.index = index
+        if state is None:
+            state = self.build(index.records)
+        self.codepoints = state["codepoints"]
+        self.starts = state["starts"]
+        self.gids = state["gids"]
+        self.line_nos = state["line_nos"]
+
+    @staticmethod
+    def build(records: list) -> dict:
+        if not any(p.text for p in records):
+            empty = np.zeros(0, np.uint32)
+            return {"codepoints": empty, "starts": np.zeros(1, np.int64), "gids": empty, "line_nos": empty}
+        # 与 Poem.lines 一致：正文为空的记录没有行，不参与拼接
+        counts = np.fromiter((p.text.count(LINE_SEP) + 1 if p.text else 0 for p in records), dtype=np.int64,
+                             count=len(records))
+        codepoints = np.frombuffer(LINE_SEP.join(p.text for p in records if p.text).encode("utf-32-le"),
+                                   dtype=np.uint32)
+        breaks = np.flatnonzero(codepoints == ord(LINE_SEP))
+        # 去掉换行符后，第 i 行的起点前移 i 个位置
+        starts = np.concatenate(([0], breaks + 1, [len(codepoints) + 1])) - np.arange(len(breaks) + 2)
+        gids = np.repeat(np.arange(len(records), dtype=np.uint32), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        return {
+            "codepoints": codepoints[codepoints != ord(LINE_SEP)],
+            "starts": starts.astype(np.int64),
+            "gids": gids,
+            "line_nos": (np.arange(len(gids)) - first).astype(np.uint32),
+        }
+
+    def __len__(self) -> int:
+        return len(self.gids)
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.starts)
+
+    def line(self, i: int) -> str:
+        return self.index.records[self.gids[i]].lines[self.line_nos[i]]
+
+    def state(self) -> dict:
+        return {"codepoints": self.codepoints, "starts": self.starts, "gids": self.gids, "line_nos": self.line_nos}
+
+
+# 加载器 -> (构建时的源文件清单摘要, {名称: 派生结构})
+_derived = weakref.WeakKeyDictionary()
+_lock = threading.RLock()
+
+
+def derived(loader, name: str, version: int, factory, use_cache: bool = True):
+    """ 每个加载器只构建一次的派生结构，状态缓存在 cache_path 下并随源文件清单失效
+
+    factory(state) 在 state 为 None 时从头构建，返回的对象须提供 state() 以便写入缓存。
+    进程内的派生结构与加载器的记录按同一个清单摘要（loader.sources）失效：
+    摘要由 sync_sources 更新后，下次取用时与记录一起重建。
+    """
+    entry = _derived.get(loader)
+    if entry is not None and entry[0] == loader.sources and name in entry[1]:
+        return entry[1][name]
+    with _lock:
+        manifest = source_manifest(loader)
+        loader.sync_sources(digest(manifest))
+        entry = _derived.get(loader)
+        if entry is None or entry[0] != loader.sources:
+            entry = _derived[loader] = (loader.sources, {})
+        cache = entry[1]
+        if name not in cache:
+            state = load_cache(loader, name, version, manifest) if use_cache else None
+            value = factory(state)
+            if state is None and use_cache:
+                save_cache(loader, name, version, value.state(), manifest)
+            cache[name] = value
+    return cache[name]
+
+
+def cached_derived(loader, name: str):
+    """ 已构建的派生结构，尚未构建时为 None，不触发构建 """
+    entry = _derived.get(loader)
+    if entry is None or entry[0] != loader.sources:
+        return None
+    return entry[1].get(name)
+
+
+def get_corpus_index(loader, use_cache: bool = True) -> CorpusIndex:
+    # 折叠表随是否安装 opencc 而不同，倒排表的缓存按折叠表区分
+    return derived(loader, "corpus", f"{CORPUS_VERSION}.{get_fold_table().digest}",
+                   lambda state: CorpusIndex(loader, state["postings"] if state else None), use_cache)
+
+
+def get_line_table(loader, use_cache: bool = True) -> LineTable:
+    index = get_corpus_index(loader, use_cache)
+    return derived(loader, "lines", CORPUS_VERSION, lambda state: LineTable(index, state), use_cache)
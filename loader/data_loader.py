@@ -1,9 +1,23 @@
+import itertools
 import json
 import os
+import threading
+import time
+from array import array
+
+from loader.codec import load_file, select_files, split_ext
+from loader.jsonbackend import paused_gc
+from loader.metrics import record_cache, registry
+from loader.poem import RECORD_FIELDS, Poem
 
 
 DATAS_CONFIG = "./loader/datas.json"
 
+_parse_seconds = registry.histogram("loader_file_parse_seconds", "Time to read and decode one data file")
+_bytes_read = registry.counter("loader_bytes_read_total", "Bytes read from data files")
+_files_read = registry.counter("loader_files_read_total", "Data files read")
+_read_errors = registry.counter("loader_read_errors_total", "Data files that failed to load")
+
 
 class PlainDataLoader():
     def __init__(self, config_path: str=DATAS_CONFIG) -> None:
@@ -11,11 +25,57 @@ class PlainDataLoader():
         with open(config_path, 'r', encoding='utf-8') as config:
             data = json.load(config)
             self.top_level_path:str = data["cp_path"]
+            # 快照等派生数据的目录，见 loader/snapshot.py
+            self.cache_path:str = data.get("cache_path", "./.cache/")
             self.datasets:dict = data["datasets"]
             self.id_table = {
                 v["id"]: k for (k, v) in self.datasets.items()
             }
+        self._records = {}
+        self._records_lock = threading.Lock()
+        self._authors = {}
+        # 尚未取用的预构建记录来源：数据集 -> 无参函数，返回记录列表或 None（此时从数据文件构建）
+        self._record_sources = {}
+        # 数据集 -> [(文件路径, 记录数)]，在从数据文件构造记录时顺带记下，用于按文件定位记录
+        self._file_counts = {}
+        # 已载入的记录所依据的源文件清单摘要（见 loader/manifest.py），由 sync_sources 更新
+        self.sources = None
+
+    def dataset_files(self, target: str) -> list:
+        """数据集包含的所有文件路径（已排除 excludes，按文件名排序）"""
+        if target not in self.datasets:
+            print(f"{target} is not included in datas.json as a dataset")
+            return []
+        configs = self.datasets[target]
+        full_path = os.path.join(self.top_level_path, configs["path"])
+        # 存储格式，见 loader/codec.py；紧凑格式的文件与原文件同名不同扩展名
+        fmt = configs.get("format", "json")
+        if os.path.isdir(full_path):
+            # a dir, probably with a skip list
+            excludes = configs.get("excludes", [])
+            filenames = [
+                filename for filename in sorted(os.listdir(full_path))
+                if filename not in excludes and os.path.isfile(os.path.join(full_path, filename))
+            ]
+            return [os.path.join(full_path, f) for f in select_files(filenames, fmt)]
+        directory, filename = os.path.split(full_path)
+        if os.path.isdir(directory) and (fmt != "json" or not os.path.isfile(full_path)):
+            stem = split_ext(filename)[0]
+            candidates = [f for f in os.listdir(directory) if split_ext(f)[0] == stem]
+            return [os.path.join(directory, f) for f in select_files(candidates, fmt)]
+        if os.path.isfile(full_path):  # single file json
+            return [full_path]
+        return []
     
+    def _load_file(self, filepath: str, target: str, fields: tuple = None):
+        """读取单个文件，并记录耗时与读取字节数；fields 不为空时每条记录只解码这些字段"""
+        start = time.perf_counter()
+        data = load_file(filepath, fields)
+        _parse_seconds.observe(time.perf_counter() - start, dataset=target)
+        _bytes_read.inc(os.path.getsize(filepath), dataset=target)
+        _files_read.inc(dataset=target)
+        return data
+
     def body_extractor(self, target: str) -> list:
         if target not in self.datasets:
             print(f"{target} is not included in datas.json as a dataset")
@@ -23,29 +83,21 @@ class PlainDataLoader():
         configs = self.datasets[target]
         tag = configs["tag"]
         body = []  # may get a bit huge... 
-        full_path = os.path.join(self.top_level_path, configs["path"])
         
         def extract_from_file(filepath):
             local_body = []
             try:
-                with open(filepath, mode='r', encoding='utf-8') as file:
-                    data = json.load(file)
-                    for poem in data:
-                        if tag in poem:
-                            local_body += poem[tag]
+                data = self._load_file(filepath, target, (tag,))
+                for poem in data:
+                    if tag in poem:
+                        local_body += poem[tag]
             except Exception as e:
+                _read_errors.inc(dataset=target)
                 print(f"Error reading {filepath}: {e}")
             return local_body
 
-        if os.path.isfile(full_path):  # single file json
-            return extract_from_file(full_path)
-        
-        # a dir, probably with a skip list
-        subpaths = os.listdir(full_path)
-        for filename in subpaths:
-            if filename in configs.get("excludes", []):
-                continue
-            body += extract_from_file(os.path.join(full_path, filename))
+        for filepath in self.dataset_files(target):
+            body += extract_from_file(filepath)
         return body
 
     def get_poems(self, target: str) -> list:
@@ -53,36 +105,124 @@ class PlainDataLoader():
         if target not in self.datasets:
             print(f"{target} is not included in datas.json as a dataset")
             return []
-        configs = self.datasets[target]
-        poems = []
-        full_path = os.path.join(self.top_level_path, configs["path"])
-        
-        def load_file(filepath):
-            local_poems = []
-            try:
-                with open(filepath, mode='r', encoding='utf-8') as file:
-                    data = json.load(file)
-                    # 确保是列表
-                    if isinstance(data, list):
-                        local_poems.extend(data)
-                    elif isinstance(data, dict):
-                        local_poems.append(data)
-            except Exception as e:
-                print(f"Error reading {filepath}: {e}")
-            return local_poems
+        return list(self.iter_poems(target))
 
-        if os.path.isfile(full_path):
-            return load_file(full_path)
-        
-        if not os.path.isdir(full_path):
+    def iter_poems(self, target: str, fields: tuple = None):
+        """逐个文件读取并产出诗词对象，不一次性载入整个数据集；fields 见 _load_file"""
+        for filepath in self.dataset_files(target):
+            yield from self._iter_file(filepath, target, fields)
+
+    def _iter_file(self, filepath: str, target: str, fields: tuple = None):
+        try:
+            data = self._load_file(filepath, target, fields)
+        except Exception as e:
+            _read_errors.inc(dataset=target)
+            print(f"Error reading {filepath}: {e}")
+            return
+        # 确保是列表
+        if isinstance(data, list):
+            yield from data
+        elif hasattr(data, "get"):
+            # 单个对象；按字段解码时可能是类型化记录而非 dict
+            yield data
+
+    def get_records(self, target: str) -> list:
+        """数据集的 Poem 记录列表，首次调用时构造并缓存；记录的 pid 即其在列表中的下标"""
+        records = self._records.get(target)
+        record_cache("loader_records", records is not None)
+        if records is not None:
+            return records
+        if target not in self.datasets:
+            print(f"{target} is not included in datas.json as a dataset")
             return []
+        with self._records_lock:
+            records = self._records.get(target)
+            source = self._record_sources.pop(target, None)
+            if records is None and source is not None:
+                records = source()
+                if records is not None:
+                    self._records[target] = records
+                else:
+                    self._authors.pop(target, None)
+            if records is None:
+                records = []
+                counts = []
+                # 构造期间解码出的临时对象随即释放，暂停分代回收避免对已建好的记录反复扫描
+                with paused_gc():
+                    for filepath in self.dataset_files(target):
+                        start = len(records)
+                        for poem in self._iter_file(filepath, target, RECORD_FIELDS):
+                            if hasattr(poem, "get"):
+                                records.append(Poem.from_dict(poem, target, len(records)))
+                        counts.append((filepath, len(records) - start))
+                self._records[target] = records
+                self._file_counts[target] = counts
+        return records
+
+    def file_counts(self, target: str):
+        """[(文件路径, 记录数)]，与 dataset_files 的顺序一致；记录尚未构造或来自旧快照时为 None，不触发读取"""
+        counts = self._file_counts.get(target)
+        if counts is None or [path for path, _ in counts] != self.dataset_files(target):
+            return None
+        return counts
+
+    def sync_sources(self, current: str) -> bool:
+        """current 为源文件清单的最新摘要，与记录所依据的不同时丢弃已载入的记录与作者表，返回是否丢弃
+
+        首次调用只记下摘要。loader/corpus.py 的派生结构按同一摘要失效，与记录一起重建。
+        """
+        with self._records_lock:
+            changed = self.sources is not None and self.sources != current
+            if changed:
+                self._records.clear()
+                self._record_sources.clear()
+                self._authors.clear()
+                self._file_counts.clear()
+            self.sources = current
+        return changed
+
+    def author_table(self, target: str) -> dict:
+        """作者 -> 其诗词的 pid 数组（升序），首次调用时构造并缓存"""
+        table = self._authors.get(target)
+        if table is None:
+            table = {}
+            for poem in self.get_records(target):
+                pids = table.get(poem.author)
+                if pids is None:
+                    pids = table[poem.author] = array("I")
+                pids.append(poem.pid)
+            self._authors[target] = table
+        return table
+
+    def author_pids(self, target: str, author_part: str):
+        """作者名包含 author_part 的诗词 pid（升序）"""
+        table = self.author_table(target)
+        matched = [pids for author, pids in table.items() if author_part in author]
+        if len(matched) == 1:
+            return matched[0]
+        return sorted(itertools.chain.from_iterable(matched))
+
+    def export_state(self) -> dict:
+        """构建全部数据集的记录与作者表，返回可序列化的完整状态"""
+        for target in self.datasets:
+            self.author_table(target)
+        return {
+            "datasets": self.datasets,
+            "id_table": self.id_table,
+            "records": dict(self._records),
+            "authors": dict(self._authors),
+            "file_counts": dict(self._file_counts),
+        }
 
-        subpaths = os.listdir(full_path)
-        for filename in subpaths:
-            if filename in configs.get("excludes", []):
-                continue
-            poems.extend(load_file(os.path.join(full_path, filename)))
-        return poems
+    def import_state(self, state: dict, record_sources: dict = None) -> None:
+        """恢复 export_state 导出的状态；record_sources 中的数据集在首次取用时才载入记录"""
+        with self._records_lock:
+            self.datasets = state["datasets"]
+            self.id_table = state["id_table"]
+            self._records.update(state.get("records", {}))
+            self._record_sources.update(record_sources or {})
+            self._authors.update(state["authors"])
+            self._file_counts.update(state.get("file_counts", {}))
 
     def extract_from_multiple(self, targets: list) -> list:
         results = []
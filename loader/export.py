@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+from loader.jsonstyle import dumps_style
+
+
+# 与宋词目录下现有文件一致：缩进 2，逗号后保留空格，键按字母序
+CI_STYLE = {"indent": 2, "item_sep": ", ", "ensure_ascii": False, "newline": True}
+
+# 宋词/ci.db 的导出预设，对应原 宋词/main.py
+SQLITE_PRESETS = {
+    "ci": {
+        "sql": "SELECT rhythmic, author, content AS paragraphs FROM ci ORDER BY id;",
+        "split": ["paragraphs"],
+        "prefix": "ci.song",
+    },
+    "ciauthor": {
+        "sql": "SELECT name, long_desc AS description, short_desc AS short_description FROM ciauthor ORDER BY id;",
+        "split": [],
+        "prefix": "author.song",
+    },
+}
+
+
+def encode_json(records: list, style: dict) -> bytes:
+    return dumps_style(records, style).encode("utf-8")
+
+
+def encode_jsonl(records: list, style: dict) -> bytes:
+    return "".join(
+        json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records
+    ).encode("utf-8")
+
+
+# 格式名 -> (编码函数, 扩展名)
+WRITERS = {
+    "json": (encode_json, ".json"),
+    "jsonl": (encode_jsonl, ".jsonl"),
+}
+
+
+def iter_sqlite(db_path: str, sql: str, split: list = (), batch: int = 1000):
+    """ 用游标分批读取，不一次性载入全部行 """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(sql)
+        columns = [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                break
+            for row in rows:
+                record = dict(zip(columns, row))
+                for column in split:
+                    record[column] = (record[column] or "").split("\n")
+                yield record
+    finally:
+        conn.close()
+
+
+def write_shard(path: str, records: list, fmt: str, style: dict, sort_keys: bool) -> dict:
+    """ 编码并原子地写出一个分片，返回其清单条目 """
+    if sort_keys:
+        records = [dict(sorted(r.items())) for r in records]
+    encode, _ = WRITERS[fmt]
+    data = encode(records, style)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    return {
+        "file": os.path.basename(path),
+        "count": len(records),
+        "bytes": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def export(records, out_dir: str, prefix: str, fmt: str = "json", shard_size: int = 1000,
+           style: dict = None, sort_keys: bool = False, workers: int = None) -> dict:
+    """ 将记录流切分为分片并行写出，清单（含校验和）写入 {prefix}.manifest.json
+
+    shard_size 为 0 时写出单个文件 {prefix}{ext}。
+    """
+    style = style or CI_STYLE
+    _, ext = WRITERS[fmt]
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    shards, pending = [], deque()
+
+    def submit(pool, start, batch):
+        name = f"{prefix}{ext}" if not shard_size else f"{prefix}.{start}{ext}"
+        future = pool.submit(write_shard, os.path.join(out_dir, name), batch, fmt, style, sort_keys)
+        pending.append((start, future))
+        # 限制在途分片数量，保证内存占用有上限
+        while len(pending) > workers * 2:
+            drain_one()
+
+    def drain_one():
+        start, future = pending.popleft()
+        entry = future.result()
+        entry["start"] = start
+        shards.append(entry)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        batch, start, total = [], 0, 0
+        for record in records:
+            batch.append(record)
+            total += 1
+            if shard_size and len(batch) >= shard_size:
+                submit(pool, start, batch)
+                start, batch = total, []
+        if batch or not shards and not pending:
+            submit(pool, start, batch)
+        while pending:
+            drain_one()
+
+    manifest = {
+        "prefix": prefix,
+        "format": fmt,
+        "shard_size": shard_size,
+        "records": total,
+        "shards": shards,
+    }
+    with open(os.path.join(out_dir, f"{prefix}.manifest.json"), "w", encoding="utf-8") as f:
+        f.write(json.dumps(manifest, indent=2, ensure_ascii=False))
+    return manifest
+
+
+def verify(out_dir: str, prefix: str) -> list:
+    """ 按清单校验分片，返回校验失败的文件名 """
+    with open(os.path.join(out_dir, f"{prefix}.manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    bad = []
+    for shard in manifest["shards"]:
+        path = os.path.join(out_dir, shard["file"])
+        if not os.path.exists(path):
+            bad.append(shard["file"])
+            continue
+        with open(path, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() != shard["sha256"]:
+                bad.append(shard["file"])
+    return bad
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将数据集或 SQLite 表导出为分片 JSON/JSONL")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dataset", help="datas.json 中的数据集名")
+    source.add_argument("--sqlite", help="SQLite 数据库路径，配合 --preset 或 --sql 使用")
+    parser.add_argument("--preset", choices=sorted(SQLITE_PRESETS), help="内置的 SQLite 导出预设")
+    parser.add_argument("--sql", help="自定义查询，列名即字段名")
+    parser.add_argument("--split", nargs="*", default=None, help="按换行拆分为列表的列")
+    parser.add_argument("--out", default=".", help="输出目录")
+    parser.add_argument("--prefix", default=None, help="分片文件名前缀")
+    parser.add_argument("--format", default="json", choices=sorted(WRITERS))
+    parser.add_argument("--shard-size", type=int, default=1000, help="每个分片的记录数，0 表示不分片")
+    parser.add_argument("--indent", type=int, default=2)
+    parser.add_argument("--sort-keys", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    args = parser.parse_args()
+
+    style = dict(CI_STYLE, indent=args.indent or None)
+    if args.dataset:
+        records = PlainDataLoader(args.config).iter_poems(args.dataset)
+        prefix = args.prefix or args.dataset
+    else:
+        preset = SQLITE_PRESETS.get(args.preset, {})
+        sql = args.sql or preset.get("sql")
+        if not sql:
+            parser.error("--sqlite requires --preset or --sql")
+        records = iter_sqlite(args.sqlite, sql, args.split if args.split is not None else preset.get("split", []))
+        prefix = args.prefix or preset.get("prefix") or "export"
+
+    manifest = export(records, args.out, prefix, args.format, args.shard_size, style,
+                      args.sort_keys, args.workers)
+    print(f"{manifest['records']} records -> {len(manifest['shards'])} shard(s) in {args.out}")
@@ -0,0 +1,355 @@
+import argparse
+import json
+import math
+import os
+import statistics
+
+import numpy as np
+
+from loader.codec import load_file, split_ext
+from loader.corpus import derived, get_corpus_index
+from loader.forms import FORMS, find_forms, get_form_index
+
+try:
+    from pyroaring import BitMap
+except ImportError:
+    BitMap = None
+
+# 分面列的构建规则变化时递增，旧缓存随之失效
+FACET_VERSION = 1
+# 可筛选的分面，dataset 的取值为 datas.json 中的数据集键名
+FACETS = ("dataset", "dynasty", "form", "popularity", "author", "rhythmic")
+DYNASTIES = ("先秦", "汉", "魏晋", "南北朝", "隋", "唐", "五代", "宋", "元", "明", "清", "不详")
+# 文件名中表示朝代的片段，如 poet.tang.0.json、ci.song.0.json
+DYNASTY_TOKENS = {"tang": "唐", "song": "宋", "yuan": "元", "ming": "明", "qing": "清"}
+POPULARITY = ("名篇", "常见", "冷僻", "无数据")
+# 知名度分档：得分不低于该分位数的归入对应档
+POPULARITY_QUANTILES = (0.99, 0.9)
+# rank 目录中各搜索引擎的结果数
+ENGINES = ("baidu", "so360", "bing", "bing_en", "google")
+# 取值不多于此数的分面缓存每个取值的位图
+CACHED_VALUES = 256
+
+
+class IntBitmap():
+    """ 没有 pyroaring 时使用的位图：以 Python 整数为位串，第 gid 位为 1 表示包含该首 """
+
+    __slots__ = ("bits", "size")
+
+    def __init__(self, bits: int, size: int) -> None:
+        self.bits = bits
+        self.size = size
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "IntBitmap":
+        return cls(int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little"), len(mask))
+
+    def __and__(self, other: "IntBitmap") -> "IntBitmap":
+        return IntBitmap(self.bits & other.bits, self.size)
+
+    def __or__(self, other: "IntBitmap") -> "IntBitmap":
+        return IntBitmap(self.bits | other.bits, self.size)
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def to_array(self) -> np.ndarray:
+        raw = np.frombuffer(self.bits.to_bytes((self.size + 7) // 8, "little"), dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(raw, count=self.size, bitorder="little")).astype(np.uint32)
+
+
+def from_mask(mask: np.ndarray):
+    """ 布尔列转为位图，有 pyroaring 时为压缩的 BitMap """
+    if BitMap is not None:
+        return BitMap(np.flatnonzero(mask).tolist())
+    return IntBitmap.from_mask(mask)
+
+
+def to_gids(bitmap) -> np.ndarray:
+    """ 位图中的 gid（升序） """
+    if isinstance(bitmap, IntBitmap):
+        return bitmap.to_array()
+    return np.frombuffer(bitmap.to_array(), dtype=np.uint32)
+
+
+class FacetColumn():
+    """ 一个分面的取值表 values 与按 gid 排列的取值编号列 codes """
+
+    def __init__(self, values: list, codes: np.ndarray) -> None:
+        self.values = values
+        self.codes = codes
+        self.totals = np.bincount(codes, minlength=len(values))
+        self._ids = {value: i for i, value in enumerate(values)}
+
+    @classmethod
+    def from_strings(cls, strings: list) -> "FacetColumn":
+        ids = {}
+        codes = np.fromiter((ids.setdefault(s, len(ids)) for s in strings), dtype=np.int32, count=len(strings))
+        return cls(list(ids), codes)
+
+    def state(self) -> dict:
+        return {"values": self.values, "codes": self.codes}
+
+    def id(self, value: str) -> int:
+        return self._ids.get(value, -1)
+
+
+def rank_path(loader, target: str, path: str) -> str:
+    """ 数据文件对应的知名度文件，如 poet.tang.0.json -> rank/poet/poet.tang.rank.0.json """
+    directory = loader.datasets[target].get("rank")
+    if not directory:
+        return None
+    parts = split_ext(os.path.basename(path))[0].split(".")
+    parts.insert(max(len(parts) - 1, 1), "rank")
+    return os.path.join(loader.top_level_path, directory, ".".join(parts) + ".json")
+
+
+def file_spans(loader, target: str, span: range) -> list:
+    """ [(文件路径, gid 范围)]，按文件顺序排列
+
+    各文件的记录数取自加载器构造记录时的计数（见 PlainDataLoader.file_counts），
+    只有记录来自不含计数的来源时才逐个文件重新计数，计法与 get_records 一致。
+    """
+    files = loader.dataset_files(target)
+    if len(files) <= 1:
+        return [(path, span) for path in files]
+    counts = loader.file_counts(target)
+    if counts is None:
+        counts = []
+        for path in files:
+            try:
+                data = load_file(path, (loader.datasets[target]["tag"],))
+            except Exception:
+                data = []
+            counts.append((path, sum(1 for item in data if hasattr(item, "get")) if isinstance(data, list)
+                           else int(hasattr(data, "get"))))
+    spans, start = [], span.start
+    for path, count in counts:
+        spans.append((path, range(start, start + count)))
+        start += count
+    return spans
+
+
+def file_dynasty(path: str, default: str) -> str:
+    """ 从文件名推断朝代：含 tang、song 等片段，或以朝代名开头（如 唐诗三百首.json） """
+    stem = split_ext(os.path.basename(path))[0]
+    for token in stem.lower().split("."):
+        if token in DYNASTY_TOKENS:
+            return DYNASTY_TOKENS[token]
+    for name in DYNASTIES:
+        if stem.startswith(name):
+            return name
+    return default
+
+
+def _score(entry: dict) -> float:
+    # 每条只有几个数，逐条调用 np.median 的开销远大于计算本身
+    counts = [entry[e] for e in ENGINES if isinstance(entry.get(e), (int, float))]
+    return statistics.median(math.log10(c + 1) for c in counts) if counts else np.nan
+
+
+def _rank_key(entry) -> tuple:
+    return entry.get("author", ""), entry.get("title") or entry.get("rhythmic") or ""
+
+
+def build_file_facets(loader, index) -> dict:
+    """ 按数据文件推断的朝代与知名度两列
+
+    知名度来自数据集 "rank" 目录下与数据文件一一对应的搜索结果数（见 rank/README.md），
+    取各搜索引擎结果数对数的中位数为得分，按分位数分为 POPULARITY 各档。
+    同一文件内按 (作者, 标题或词牌) 对应，以免个别文件条目错位；
+    没有对应文件的诗按相同的作者与标题取任一已知的得分（如唐诗三百首）。
+    """
+    count = len(index)
+    dynasties = np.full(count, DYNASTIES.index("不详"), dtype=np.int8)
+    scores = np.full(count, np.nan)
+    unranked = []
+    known = {}
+    for target in index.targets:
+        span = index.dataset_range(target)
+        default = loader.datasets[target].get("dynasty", "不详")
+        default = default if default in DYNASTIES else "不详"
+        spans = file_spans(loader, target, span)
+        if not spans:
+            dynasties[span.start:span.stop] = DYNASTIES.index(default)
+        for path, gids in spans:
+            dynasties[gids.start:gids.stop] = DYNASTIES.index(file_dynasty(path, default))
+            rank = rank_path(loader, target, path)
+            if not rank or not os.path.isfile(rank):
+                unranked.append(gids)
+                continue
+            with open(rank, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            pending = {}
+            for entry in entries:
+                key = _rank_key(entry)
+                score = _score(entry)
+                pending.setdefault(key, []).append(score)
+                known.setdefault(key, score)
+            for gid in gids:
+                poem = index.records[gid]
+                queue = pending.get((poem.author, poem.title or poem.rhythmic))
+                if queue:
+                    scores[gid] = queue.pop(0)
+    for gids in unranked:
+        for gid in gids:
+            poem = index.records[gid]
+            scores[gid] = known.get((poem.author, poem.title or poem.rhythmic), np.nan)
+
+    popularity = np.full(count, POPULARITY.index("无数据"), dtype=np.int8)
+    scored = ~np.isnan(scores)
+    if scored.any():
+        popularity[scored] = len(POPULARITY_QUANTILES)
+        for level, cut in reversed(list(enumerate(np.quantile(scores[scored], POPULARITY_QUANTILES)))):
+            popularity[scored & (scores >= cut)] = level
+    return {"dynasty": dynasties, "popularity": popularity}
+
+
+class FacetIndex():
+    """ 数据集 × 朝代 × 体裁 × 知名度 × 作者 × 词牌 的分面筛选
+
+    每个分面是按 gid 排列的取值编号列，筛选时取值转为位图（有 pyroaring 时为压缩位图），
+    同一分面内的多个取值做或运算，不同分面之间做与运算；计数在选中的 gid 上对编号列 bincount。
+    """
+
+    def __init__(self, loader, use_cache: bool = True) -> None:
+        self.loader = loader
+        self.use_cache = use_cache
+        self.index = get_corpus_index(loader, use_cache)
+        self._columns = {}
+        self._bitmaps = {}
+        self._all = None
+
+    def column(self, facet: str) -> FacetColumn:
+        column = self._columns.get(facet)
+        if column is None:
+            column = self._columns[facet] = self._build(facet)
+        return column
+
+    def _build(self, facet: str) -> FacetColumn:
+        index = self.index
+        if facet == "dataset":
+            sizes = [len(index.dataset_range(t)) for t in index.targets]
+            return FacetColumn(list(index.targets), np.repeat(np.arange(len(sizes), dtype=np.int32), sizes))
+        if facet == "form":
+            return FacetColumn(list(FORMS), get_form_index(self.loader, self.use_cache).forms)
+        if facet in ("author", "rhythmic"):
+            return derived(self.loader, f"facet-{facet}", FACET_VERSION,
+                           lambda state: FacetColumn(**state) if state else FacetColumn.from_strings(
+                               [getattr(p, facet) for p in index.records]), self.use_cache)
+        if facet in ("dynasty", "popularity"):
+            files = derived(self.loader, "facet-files", FACET_VERSION,
+                            lambda state: _FileFacets(state or build_file_facets(self.loader, index)), self.use_cache)
+            return FacetColumn(list(DYNASTIES if facet == "dynasty" else POPULARITY), files.columns[facet])
+        raise ValueError(f"unknown facet {facet}, expected one of {FACETS}")
+
+    def ready(self, facets) -> bool:
+        """ 这些分面的列是否都已载入 """
+        return all(facet in self._columns for facet in facets)
+
+    def ids(self, facet: str, values) -> list:
+        """ 取值名称转为编号，不认识的名称忽略；体裁可用 "律诗" 等合称 """
+        if isinstance(values, str):
+            values = [values]
+        if facet == "form":
+            return sorted({i for value in values for i in find_forms(value)})
+        column = self.column(facet)
+        return [i for i in map(column.id, values) if i >= 0]
+
+    def find(self, facet: str, part: str) -> list:
+        """ 名称包含 part 的取值编号，如作者名中含 "李白" """
+        return [i for i, value in enumerate(self.column(facet).values) if part in value]
+
+    def all(self):
+        if self._all is None:
+            self._all = from_mask(np.ones(len(self.index), dtype=bool))
+        return self._all
+
+    def bitmap(self, facet: str, ids: list):
+        """ 取值为 ids 中任一个的位图 """
+        column = self.column(facet)
+        cache = len(column.values) <= CACHED_VALUES
+        result = None
+        if not cache:
+            return from_mask(np.isin(column.codes, ids))
+        for i in ids:
+            key = (facet, i)
+            bitmap = self._bitmaps.get(key)
+            if bitmap is None:
+                bitmap = self._bitmaps[key] = from_mask(column.codes == i)
+            result = bitmap if result is None else result | bitmap
+        return result if result is not None else from_mask(np.zeros(len(self.index), dtype=bool))
+
+    def select(self, filters: dict = None, scope: range = None):
+        """ filters 为 {分面: 取值或取值列表}，空值表示不限；scope 为 gid 范围。返回位图 """
+        result = None
+        if scope is not None:
+            mask = np.zeros(len(self.index), dtype=bool)
+            mask[scope.start:scope.stop] = True
+            result = from_mask(mask)
+        for facet, values in (filters or {}).items():
+            if not values:
+                continue
+            bitmap = self.bitmap(facet, self.ids(facet, values))
+            result = bitmap if result is None else result & bitmap
+        return self.all() if result is None else result
+
+    def gids(self, filters: dict = None, scope: range = None) -> np.ndarray:
+        return to_gids(self.select(filters, scope))
+
+    def counts(self, facet: str, filters: dict = None, scope: range = None) -> dict:
+        """ 在其余分面的筛选下，facet 各取值的首数 {取值: 首数}，只含非零的取值
+
+        计数时不计 facet 自身的筛选，侧栏里每个选项旁的数字即选中它之后的结果数。
+        """
+        column = self.column(facet)
+        others = {k: v for k, v in (filters or {}).items() if k != facet and v}
+        if not others and scope is None:
+            totals = column.totals
+        else:
+            totals = np.bincount(column.codes[self.gids(others, scope)], minlength=len(column.values))
+        return {column.values[i]: int(totals[i]) for i in np.flatnonzero(totals).tolist()}
+
+
+class _FileFacets():
+    """ 按数据文件推断的列，作为一个整体缓存 """
+
+    def __init__(self, columns: dict) -> None:
+        self.columns = columns
+
+    def state(self) -> dict:
+        return self.columns
+
+
+def get_facet_index(loader, use_cache: bool = True) -> FacetIndex:
+    # 各分面的列分别缓存，这里只在内存中每个加载器保留一个实例
+    return derived(loader, "facets", FACET_VERSION, lambda state: FacetIndex(loader, use_cache), use_cache=False)
+
+
+if __name__ == "__main__":
+    import time
+
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+    from loader.snapshot import load_snapshot
+
+    parser = argparse.ArgumentParser(description="按分面筛选并统计各取值的首数")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    for name in FACETS:
+        parser.add_argument(f"--{name}", action="append", default=[], help=f"按{name}筛选，可多次指定")
+    parser.add_argument("--counts", default="form", choices=FACETS, help="统计该分面的取值分布")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    load_snapshot(loader, lazy=True)
+    start = time.perf_counter()
+    facets = get_facet_index(loader)
+    facets.column(args.counts)
+    print(f"facet index ready in {time.perf_counter() - start:.2f}s ({'pyroaring' if BitMap else 'int'} bitmaps)")
+    filters = {name: getattr(args, name) for name in FACETS}
+    start = time.perf_counter()
+    total = len(facets.select(filters))
+    counts = facets.counts(args.counts, filters)
+    print(f"{total} poem(s), counts in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for value, n in sorted(counts.items(), key=lambda item: -item[1])[:args.limit]:
+        print(f"  {value}: {n}")
@@ -0,0 +1,123 @@
+import argparse
+import hashlib
+import json
+
+import numpy as np
+
+from loader.normalize import CHARMAP_PATH
+
+# 逐字转换的 OpenCC 配置：繁体及台湾、香港用字转简体
+OPENCC_CONFIGS = ("t2s", "tw2s", "hk2s")
+# 交给 OpenCC 逐字转换的码位范围：CJK 基本区、扩展 A–F 与兼容区
+CJK_RANGES = ((0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0x20000, 0x2A6DF),
+              (0x2A700, 0x2EBEF), (0x2F800, 0x2FA1F))
+
+
+def opencc_pairs() -> list:
+    """ OpenCC 字表中一对一的 (原字, 简体) 对；没有安装 opencc 时为空 """
+    try:
+        import opencc
+    except ImportError:
+        return []
+    chars = [chr(c) for lo, hi in CJK_RANGES for c in range(lo, hi + 1)]
+    pairs = []
+    for config in OPENCC_CONFIGS:
+        # 以换行分隔逐字转换，一次调用即可，不会套用跨字的词组
+        converted = opencc.OpenCC(config).convert("\n".join(chars)).split("\n")
+        if len(converted) != len(chars):
+            continue
+        pairs += [(a, b) for a, b in zip(chars, converted) if a != b and len(b) == 1]
+    return pairs
+
+
+def charmap_pairs(path: str = CHARMAP_PATH) -> list:
+    """ charmap.json 各表中等长键值逐字对应的 (原字, 目标字) 对，如 崑崙 -> 昆仑 """
+    with open(path, "r", encoding="utf-8") as f:
+        tables = json.load(f)
+    return [pair for table in tables.values() for key, value in table["mapping"].items()
+            if len(key) == len(value) for pair in zip(key, value) if pair[0] != pair[1]]
+
+
+class FoldTable():
+    """ 简繁体与异体字的折叠表：互为变体的字归为一组，组内各字都折叠为码位最小的一个
+
+    建索引时正文按折叠后的字建倒排表，查询词也先折叠，一次查找即命中所有变体，不必逐个展开转换。
+    chars 为可折叠的码位（升序），targets 为其折叠后的码位。
+    """
+
+    def __init__(self, pairs) -> None:
+        parent = {}
+
+        def find(c):
+            root = c
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while c != root:
+                parent[c], c = root, parent[c]
+            return root
+
+        for a, b in pairs:
+            ra, rb = find(ord(a)), find(ord(b))
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+        mapping = {c: find(c) for c in parent}
+        mapping = {c: t for c, t in mapping.items() if c != t}
+        self.chars = np.array(sorted(mapping), dtype=np.uint32)
+        self.targets = np.array([mapping[c] for c in self.chars.tolist()], dtype=np.uint32)
+        self._table = mapping
+        self._members = set(mapping) | set(mapping.values())
+        self._dense = None
+        raw = self.chars.tobytes() + self.targets.tobytes()
+        self.digest = hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.chars)
+
+    def fold(self, text: str) -> str:
+        return text.translate(self._table)
+
+    def affects(self, text: str) -> bool:
+        """ text 中是否有属于某个变体组的字；没有时在原文中查找与在折叠后的文本中查找结果相同 """
+        return any(ord(c) in self._members for c in text)
+
+    def fold_codes(self, codes: np.ndarray) -> np.ndarray:
+        """ 码位数组逐个折叠 """
+        if self._dense is None:
+            dense = np.arange(0x110000, dtype=np.uint32)
+            dense[self.chars] = self.targets
+            self._dense = dense
+        return self._dense[codes]
+
+    def variants(self, char: str) -> str:
+        """ 与 char 同组的全部字（含自身），按码位排列 """
+        target = self._table.get(ord(char), ord(char))
+        members = self.chars[self.targets == target].tolist()
+        return "".join(chr(c) for c in sorted({target, *members}))
+
+
+_FOLD_TABLE = None
+
+
+def get_fold_table() -> FoldTable:
+    global _FOLD_TABLE
+    if _FOLD_TABLE is None:
+        _FOLD_TABLE = FoldTable(opencc_pairs() + charmap_pairs())
+    return _FOLD_TABLE
+
+
+def fold(text: str) -> str:
+    return get_fold_table().fold(text)
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="查看字的折叠结果与同组变体")
+    parser.add_argument("text", nargs="*", help="如 後 崑崙")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = get_fold_table()
+    print(f"{len(table)} foldable chars in {time.perf_counter() - start:.2f}s, digest {table.digest}")
+    for text in args.text:
+        print(f"{text} -> {table.fold(text)}  " + " ".join(table.variants(c) for c in text))
@@ -0,0 +1,147 @@
+import argparse
+
+import numpy as np
+
+from loader.corpus import derived, get_corpus_index
+from loader.positional import get_clause_table
+from loader.rhyme import get_rhyme_index
+
+# 分类规则变化时递增，旧缓存随之失效
+FORM_VERSION = 1
+# 体裁编号即在此元组中的下标，存为 uint8
+FORMS = ("其他", "五绝", "七绝", "五律", "七律", "五言排律", "七言排律", "五古", "七古", "四言", "词", "曲")
+# 常见的别称；一个名称可以对应多种体裁
+ALIASES = {
+    "杂言": ("其他",), "五言绝句": ("五绝",), "七言绝句": ("七绝",), "五言律诗": ("五律",), "七言律诗": ("七律",),
+    "五排": ("五言排律",), "七排": ("七言排律",), "五言古诗": ("五古",), "七言古诗": ("七古",),
+    "绝句": ("五绝", "七绝"), "律诗": ("五律", "七律"), "排律": ("五言排律", "七言排律"), "古体": ("五古", "七古"),
+    "近体": ("五绝", "七绝", "五律", "七律", "五言排律", "七言排律"), "散曲": ("曲",),
+}
+# 排律至少的句数（五言、七言的律诗为 8 句）
+MIN_PAILV = 10
+
+
+def find_forms(name: str) -> list:
+    """ 体裁名称（如 "七绝"、"七言绝句"、"律诗"）对应的编号，不认识时为空列表 """
+    name = name.strip()
+    names = ALIASES.get(name, (name,) if name in FORMS else ())
+    return [FORMS.index(n) for n in names]
+
+
+def classify(clauses, rhymes, dataset_forms: dict = None) -> np.ndarray:
+    """ 按句数、每句字数与标点切分出的句式给每首诗定体裁，返回按 gid 排列的 uint8 列
+
+    全部句子等长且每行都是整联或都只有一句时才算齐言：4 句为绝句，8 句为律诗，
+    10 句以上、偶数句且押平声韵的为排律，其余为古体；有词牌的记录为词。
+    dataset_forms 为 {数据集: 体裁名称}，整个数据集归为同一体裁（如元曲）。
+    """
+    table = clauses.table
+    index = table.index
+    count = len(index)
+    forms = np.zeros(count, dtype=np.uint8)
+    if not len(clauses):
+        return forms
+
+    gids = clauses.gids.astype(np.int64)
+    sizes = np.bincount(gids, minlength=count)
+    lines = np.bincount(table.gids.astype(np.int64), minlength=count)
+    firsts = np.searchsorted(gids, np.arange(count))
+    present = sizes > 0
+    shortest = np.zeros(count, dtype=np.int64)
+    longest = np.zeros(count, dtype=np.int64)
+    shortest[present] = np.minimum.reduceat(clauses.lengths, firsts[present])
+    longest[present] = np.maximum.reduceat(clauses.lengths, firsts[present])
+
+    width = np.where(present & (shortest == longest), shortest, 0)
+    # 每行都是整联（偶数句），或每行只有一句
+    per_line = np.bincount(clauses.lines.astype(np.int64), minlength=len(table))
+    split = np.bincount(table.gids.astype(np.int64), weights=per_line % 2, minlength=count)
+    couplets = (split == 0) | (sizes == lines)
+    tones = np.array([g["tone"] == "平" for g in rhymes.rhymes.groups] + [False])
+    level = tones[rhymes.poem_groups.astype(np.int64)]  # -1（未押韵）取到末尾的 False
+
+    for chars, (jue, lv, pailv, gu) in ((5, (1, 3, 5, 7)), (7, (2, 4, 6, 8))):
+        regular = (width == chars) & couplets
+        forms[regular & (sizes >= 4)] = gu
+        forms[regular & (sizes >= MIN_PAILV) & (sizes % 2 == 0) & level] = pailv
+        forms[regular & (sizes == 8)] = lv
+        forms[regular & (sizes == 4)] = jue
+    forms[(width == 4) & (sizes >= 4)] = FORMS.index("四言")
+
+    ci = FORMS.index("词")
+    for gid, poem in enumerate(index.records):
+        if poem.rhythmic:
+            forms[gid] = ci
+    for target, name in (dataset_forms or {}).items():
+        span = index.dataset_range(target)
+        forms[span.start:span.stop] = FORMS.index(name)
+    return forms
+
+
+class FormIndex():
+    """ 每首诗的体裁列（forms[gid]）及每种体裁的位图（np.packbits 压缩的布尔列） """
+
+    def __init__(self, index, state: dict) -> None:
+        self.index = index
+        self.forms = state["forms"]
+        self.bitmaps = [np.packbits(self.forms == i) for i in range(len(FORMS))]
+
+    def state(self) -> dict:
+        return {"forms": self.forms}
+
+    def form_of(self, poem) -> str:
+        return FORMS[self.forms[self.index.offsets[poem.dataset] + poem.pid]]
+
+    def mask(self, forms: list, scope: range = None) -> np.ndarray:
+        """ 属于 forms 中任一体裁（且在 scope 内）的布尔列，按位图做或运算 """
+        bits = np.zeros_like(self.bitmaps[0])
+        for form in forms:
+            bits |= self.bitmaps[form]
+        mask = np.unpackbits(bits, count=len(self.forms)).view(bool)
+        if scope is not None:
+            mask[:scope.start] = False
+            mask[scope.stop:] = False
+        return mask
+
+    def gids(self, forms: list, scope: range = None) -> np.ndarray:
+        """ 属于 forms 中任一体裁的 gid（升序） """
+        return np.flatnonzero(self.mask(forms, scope)).astype(np.uint32)
+
+    def counts(self, scope: range = None) -> dict:
+        """ {体裁: 首数}，只含出现过的体裁 """
+        forms = self.forms if scope is None else self.forms[scope.start:scope.stop]
+        counts = np.bincount(forms, minlength=len(FORMS))
+        return {FORMS[i]: int(n) for i, n in enumerate(counts.tolist()) if n}
+
+
+def get_form_index(loader, use_cache: bool = True) -> FormIndex:
+    def factory(state):
+        # 句表与韵脚索引只在分类时需要，体裁列已缓存时不必加载
+        if state is None:
+            dataset_forms = {target: cfg["form"] for target, cfg in loader.datasets.items() if cfg.get("form") in FORMS}
+            clauses = get_clause_table(loader, use_cache)
+            state = {"forms": classify(clauses, get_rhyme_index(loader, use_cache), dataset_forms)}
+        return FormIndex(get_corpus_index(loader, use_cache), state)
+
+    return derived(loader, "forms", FORM_VERSION, factory, use_cache)
+
+
+if __name__ == "__main__":
+    import time
+
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+    from loader.snapshot import load_snapshot
+
+    parser = argparse.ArgumentParser(description="各数据集的体裁分布")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--dataset", default=None)
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    load_snapshot(loader, lazy=True)
+    start = time.perf_counter()
+    forms = get_form_index(loader)
+    print(f"form index ready in {time.perf_counter() - start:.2f}s")
+    targets = [args.dataset] if args.dataset else forms.index.targets
+    for target in targets:
+        print(f"{target}: {forms.counts(forms.index.dataset_range(target))}")
@@ -0,0 +1,237 @@
+from collections import namedtuple
+
+import numpy as np
+
+from loader.corpus import CORPUS_VERSION, PUNCTUATION, PUNCTUATION_CODES, derived, get_line_table
+
+# 二元组索引结构变化时递增，旧缓存随之失效
+BIGRAM_VERSION = 1
+
+# 位并行算法用一个 64 位字表示查询的各个位置，更长的查询截断
+MAX_QUERY = 64
+# 送去计算编辑距离的候选行上限，超过时保留共有二元组最多的行
+MAX_CANDIDATES = 20000
+# 每批计算的候选行数；候选按长度排序后分批，批内补齐到最长的一行
+CHUNK = 4096
+
+Hit = namedtuple("Hit", "poem line_no line distance")
+
+
+def default_edits(length: int) -> int:
+    """ 允许的编辑次数随查询长度增加 """
+    if length <= 2:
+        return 0
+    if length <= 5:
+        return 1
+    if length <= 12:
+        return 2
+    return 3
+
+
+class BigramIndex():
+    """ 行级的字二元组倒排表：二元组编码为 dense[a] * len(chars) + dense[b]，dense 为字在 chars 中的序号
+
+    标点不参与二元组，"大江东去，浪淘尽" 中的 "去浪" 也是一个二元组。
+    """
+
+    def __init__(self, table, state: dict = None) -> None:
+        self.table = table
+        if state is None:
+            state = self.build(table)
+        self.chars = state["chars"]
+        self.grams = state["grams"]
+        self.starts = state["starts"]
+        self.lines = state["lines"]
+
+    @staticmethod
+    def build(table) -> dict:
+        text = ~np.isin(table.codepoints, PUNCTUATION_CODES)
+        codepoints = table.codepoints[text]
+        line_of = np.repeat(np.arange(len(table), dtype=np.uint64), table.lengths())[text]
+        present = np.zeros(0x110000, dtype=bool)
+        present[codepoints] = True
+        chars = np.flatnonzero(present).astype(np.uint32)
+        dense = np.zeros(0x110000, dtype=np.uint64)
+        dense[chars] = np.arange(len(chars), dtype=np.uint64)
+        ids = dense[codepoints]
+        # 相邻两字属于同一行才构成二元组
+        pair = line_of[1:] == line_of[:-1]
+        keys = (ids[:-1][pair] * np.uint64(len(chars)) + ids[1:][pair]) << np.uint64(32)
+        keys |= line_of[1:][pair]
+        keys.sort()
+        keep = np.empty(len(keys), dtype=bool)
+        keep[:1] = True
+        np.not_equal(keys[1:], keys[:-1], out=keep[1:])
+        keys = keys[keep]
+        grams_all = keys >> np.uint64(32)
+        bounds = np.flatnonzero(grams_all[1:] != grams_all[:-1]) + 1
+        starts = np.concatenate(([0], bounds, [len(keys)])).astype(np.int64)
+        return {
+            "chars": chars,
+            "grams": grams_all[starts[:-1]],
+            "starts": starts,
+            "lines": (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32),
+        }
+
+    def state(self) -> dict:
+        return {"chars": self.chars, "grams": self.grams, "starts": self.starts, "lines": self.lines}
+
+    def query_grams(self, query: str) -> np.ndarray:
+        """ 查询中（去重后）的二元组编码，含语料中未出现的字的二元组被跳过 """
+        codes = np.fromiter(map(ord, query), dtype=np.uint32, count=len(query))
+        pos = np.searchsorted(self.chars, codes)
+        pos[pos == len(self.chars)] = 0
+        known = self.chars[pos] == codes
+        ids = pos.astype(np.uint64)
+        both = known[:-1] & known[1:]
+        grams = ids[:-1][both] * np.uint64(len(self.chars)) + ids[1:][both]
+        return np.unique(grams)
+
+    def candidates(self, grams: np.ndarray, threshold: int, scope: range = None) -> tuple:
+        """ 至少共有 threshold 个二元组的行及共有数，共有数多的在前，最多 MAX_CANDIDATES 行 """
+        pos = np.searchsorted(self.grams, grams)
+        pos[pos == len(self.grams)] = 0
+        pos = pos[self.grams[pos] == grams]
+        if not len(pos):
+            return np.zeros(0, np.uint32), np.zeros(0, np.int64)
+        lines = np.concatenate([self.lines[self.starts[i]:self.starts[i + 1]] for i in pos.tolist()])
+        lines.sort()
+        bounds = np.flatnonzero(np.diff(lines)) + 1
+        firsts = np.concatenate(([0], bounds))
+        counts = np.diff(np.concatenate((firsts, [len(lines)])))
+        lines = lines[firsts]
+        keep = counts >= threshold
+        if scope is not None:
+            gids = self.table.gids[lines]
+            keep &= (gids >= scope.start) & (gids < scope.stop)
+        lines, counts = lines[keep], counts[keep]
+        if len(lines) > MAX_CANDIDATES:
+            top = np.argpartition(-counts, MAX_CANDIDATES)[:MAX_CANDIDATES]
+            lines, counts = lines[top], counts[top]
+        order = np.argsort(-counts, kind="stable")
+        return lines[order], counts[order]
+
+
+def semiglobal_distances(query: str, texts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """ 查询与每行任意子串之间的最小编辑距离（Myers 位并行算法，按列在全部行上同时推进）
+
+    texts 为 (最大行长, 行数) 的码位矩阵，超出各行长度的位置不参与比较。
+    """
+    m = len(query)
+    full = np.uint64((1 << m) - 1)
+    high = np.uint64(1 << (m - 1))
+    one = np.uint64(1)
+    chars = sorted(set(query))
+    masks = np.array([sum(1 << i for i, c in enumerate(query) if c == ch) for ch in chars], dtype=np.uint64)
+    codes = np.array([ord(c) for c in chars], dtype=np.uint32)
+    pos = np.searchsorted(codes, texts)
+    pos[pos == len(codes)] = 0
+    eqs = np.where(codes[pos] == texts, masks[pos], np.uint64(0))
+
+    count = texts.shape[1]
+    pv = np.full(count, full, dtype=np.uint64)
+    mv = np.zeros(count, dtype=np.uint64)
+    score = np.full(count, m, dtype=np.int64)
+    best = score.copy()
+    for j in range(texts.shape[0]):
+        eq = eqs[j]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        score += (ph & high) != 0
+        score -= (mh & high) != 0
+        # 文本中的匹配可以从任意位置开始，第 0 行恒为 0，因此左移后不补 1
+        ph = (ph << one) & full
+        mh = (mh << one) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+        np.minimum(best, np.where(j < lengths, score, m), out=best)
+    return best
+
+
+def _distances(table, query: str, ids: np.ndarray) -> np.ndarray:
+    """ 查询与 ids 各行（去掉标点后）的 semiglobal_distances """
+    starts = table.starts[ids]
+    sizes = table.starts[ids + 1] - starts
+    cols = np.arange(int(sizes.max()) if len(sizes) else 0)[:, None]
+    texts = table.codepoints[np.minimum(starts[None, :] + cols, max(len(table.codepoints) - 1, 0))]
+    # 与建索引时一致，比较前去掉标点：标点移到各列末尾并从行长中扣除
+    punct = np.isin(texts, PUNCTUATION_CODES) & (cols < sizes)
+    texts = np.take_along_axis(texts, np.argsort(punct, axis=0, kind="stable"), axis=0)
+    return semiglobal_distances(query, texts, sizes - punct.sum(axis=0))
+
+
+def _poems(table, hits: list, floor: int) -> int:
+    """ hits 中距离不超过 floor 的行分属多少首诗 """
+    if not hits:
+        return 0
+    gids = np.concatenate([table.gids[lines[d <= floor]] for lines, d, _ in hits])
+    gids.sort()
+    return int(len(gids) and np.count_nonzero(np.diff(gids)) + 1)
+
+
+def _normalize(query: str) -> str:
+    return "".join(c for c in query if c not in PUNCTUATION)[:MAX_QUERY]
+
+
+def get_bigram_index(loader, use_cache: bool = True) -> BigramIndex:
+    table = get_line_table(loader, use_cache)
+    return derived(loader, "bigrams", f"{CORPUS_VERSION}.{BIGRAM_VERSION}", lambda state: BigramIndex(table, state), use_cache)
+
+
+def fuzzy_lines(loader, query: str, max_edits: int = None, limit: int = 50, scope: str = None,
+                converters=None) -> list:
+    """ 近似查找与查询最接近的正文行，返回按编辑距离排序的 [Hit]，每首诗只保留最接近的一行
+
+    先用二元组倒排表按 q-gram 引理筛出候选（k 次编辑至多破坏 2k 个二元组），再批量计算编辑距离。
+    scope 为数据集键时只在该数据集中查找；converters 为 (s2t, t2s) 时简繁体变体都会尝试。
+    """
+    index = get_bigram_index(loader)
+    table = index.table
+    records = table.index.records
+    scope_range = table.index.dataset_range(scope) if scope else None
+    variants = {_normalize(query)}
+    if converters:
+        variants |= {_normalize(c.convert(query)) for c in converters}
+    variants.discard("")
+
+    found = []  # 每批命中的 (行号, 距离, 共有二元组数)
+    for variant in variants:
+        k = default_edits(len(variant)) if max_edits is None else max_edits
+        grams = index.query_grams(variant)
+        # 阈值不为正时筛选失去保证，退化为按共有二元组数取前若干行
+        lines, counts = index.candidates(grams, max(len(grams) - 2 * k, 1), scope_range)
+        hits = []
+        # 与查询共有 c 个二元组的行距离至少为 ceil((G - c) / 2)。按共有数从多到少分组验证，
+        # 已有 limit 首诗的距离不超过余下各行的下界时提前结束
+        for group in np.split(np.arange(len(lines)), np.flatnonzero(np.diff(counts)) + 1):
+            floor = (len(grams) - int(counts[group[0]]) + 1) // 2 if len(group) else k + 1
+            if floor > k or _poems(table, hits, floor) >= limit:
+                break
+            ids = lines[group]
+            group = group[np.argsort(table.starts[ids + 1] - table.starts[ids], kind="stable")]
+            for offset in range(0, len(group), CHUNK):
+                chunk = group[offset:offset + CHUNK]
+                distances = _distances(table, variant, lines[chunk])
+                ok = distances <= k
+                hits.append((lines[chunk][ok], distances[ok], counts[chunk][ok]))
+                if _poems(table, hits, floor) >= limit:
+                    break
+        found += hits
+    if not found:
+        return []
+
+    lines, distances, counts = (np.concatenate(column) for column in zip(*found))
+    results, seen = [], set()
+    for i in np.lexsort((lines, -counts, distances)).tolist():
+        gid = int(table.gids[lines[i]])
+        if gid in seen:
+            continue
+        seen.add(gid)
+        line_no = int(table.line_nos[lines[i]])
+        poem = records[gid]
+        results.append(Hit(poem, line_no, poem.lines[line_no], int(distances[i])))
+        if len(results) >= limit:
+            break
+    return results
@@ -0,0 +1,139 @@
+import gc
+import json
+import os
+import typing
+from contextlib import contextmanager
+
+
+# 环境变量可指定解码后端，未指定时按 PREFERENCE 顺序取第一个已安装的
+BACKEND_ENV = "JSON_BACKEND"
+PREFERENCE = ("msgspec", "orjson", "json")
+
+
+@contextmanager
+def paused_gc():
+    """ 解码产生大量容器对象却不会形成循环引用，期间暂停分代回收可省去反复的全量扫描 """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class StdlibBackend():
+    name = "json"
+
+    def loads(self, raw: bytes):
+        with paused_gc():
+            return self._loads(raw)
+
+    def decode_fields(self, raw: bytes, fields: tuple):
+        """ 解码只需 fields 中字段的记录；记录可能是 dict，也可能是支持 get/in/[] 的类型化记录
+
+        fields 只是提示，返回的记录可能含其余字段：只有 msgspec 能在解析时跳过不需要的字段，
+        json 与 orjson 总要解码整棵树，事后裁剪只会多花时间，因此直接返回完整记录。
+        """
+        with paused_gc():
+            return self._decode_fields(raw, tuple(fields))
+
+    def _loads(self, raw: bytes):
+        return json.loads(raw)
+
+    def _decode_fields(self, raw: bytes, fields: tuple):
+        return self._loads(raw)
+
+
+class OrjsonBackend(StdlibBackend):
+    """ orjson 解析更快，但同样解码整棵树，峰值内存与 stdlib 相当 """
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+        self._loads = orjson.loads
+
+
+class MsgspecBackend(StdlibBackend):
+    """ msgspec 按字段集生成 Struct 类型直接解码，不需要的字段在解析时跳过，不会分配 """
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        class Record(msgspec.Struct, gc=False):
+            # 与 dict 相同的只读访问方式，缺失的字段为 None
+            def get(self, key, default=None):
+                value = getattr(self, key, None)
+                return default if value is None else value
+
+            def __getitem__(self, key):
+                value = getattr(self, key, None)
+                if value is None:
+                    raise KeyError(key)
+                return value
+
+            def __contains__(self, key):
+                return getattr(self, key, None) is not None
+
+        self._msgspec = msgspec
+        self._record = Record
+        self._loads = msgspec.json.Decoder().decode
+        self._typed = {}
+
+    def _typed_decoder(self, fields: tuple):
+        decoder = self._typed.get(fields)
+        if decoder is None:
+            msgspec = self._msgspec
+            record = msgspec.defstruct("Record", [(f, object, None) for f in fields], bases=(self._record,))
+            decoder = self._typed[fields] = msgspec.json.Decoder(typing.Union[typing.List[record], record]).decode
+        return decoder
+
+    def _decode_fields(self, raw: bytes, fields: tuple):
+        try:
+            return self._typed_decoder(fields)(raw)
+        except self._msgspec.ValidationError:
+            # 列表中混有非对象元素等不规则数据时退回通用解码
+            return self._loads(raw)
+
+
+BACKENDS = {
+    "msgspec": MsgspecBackend,
+    "orjson": OrjsonBackend,
+    "json": StdlibBackend,
+}
+
+
+def _try(name: str):
+    try:
+        return BACKENDS[name]()
+    except ImportError:
+        return None
+
+
+def available_backends() -> list:
+    """ 已安装的后端名，按优先顺序 """
+    return [name for name in PREFERENCE if _try(name) is not None]
+
+
+_backend = None
+
+
+def get_backend(name: str = None):
+    """ 按名称取解码后端；不传名称时使用 JSON_BACKEND 环境变量或已安装的最快后端（进程内只选择一次） """
+    global _backend
+    if name:
+        try:
+            return BACKENDS[name]()
+        except KeyError:
+            raise ValueError(f"unknown json backend {name}, expected one of {sorted(BACKENDS)}")
+        except ImportError:
+            raise ImportError(f"json backend {name} is not installed: pip install {name}")
+    if _backend is None:
+        requested = os.environ.get(BACKEND_ENV)
+        if requested:
+            _backend = get_backend(requested)
+        else:
+            _backend = next(b for b in (_try(n) for n in PREFERENCE) if b is not None)
+    return _backend
+
@@ -0,0 +1,25 @@
+import json
+import re
+
+
+# 仓库中的 JSON 文件格式并不统一：缩进有 2 也有 4，部分文件逗号后保留空格
+DEFAULT_STYLE = {"indent": 2, "item_sep": ",", "ensure_ascii": False, "newline": False}
+
+
+def detect_style(raw: str) -> dict:
+    """ 从原始文本推断 json.dumps 的格式参数 """
+    style = dict(DEFAULT_STYLE)
+    m = re.search(r"\n( +)\S", raw)
+    style["indent"] = len(m.group(1)) if m else None
+    style["item_sep"] = ", " if re.search(r", \n", raw) else ","
+    style["ensure_ascii"] = raw.isascii() and "\\u" in raw
+    style["newline"] = raw.endswith("\n")
+    return style
+
+
+def dumps_style(data, style: dict) -> str:
+    """ 按 detect_style 得到的格式重新序列化 """
+    item_sep = style.get("item_sep", ",")
+    text = json.dumps(data, indent=style.get("indent"), ensure_ascii=style.get("ensure_ascii", False),
+                      separators=(item_sep, ": "))
+    return text + "\n" if style.get("newline") else text
@@ -0,0 +1,32 @@
+import hashlib
+import json
+import os
+
+
+def file_entry(path: str, root: str = ".") -> list:
+    """ [相对路径, 大小, 修改时间(ns)]，文件内容改动通常会改变后两者 """
+    st = os.stat(path)
+    return [os.path.relpath(path, root), st.st_size, st.st_mtime_ns]
+
+
+def source_manifest(loader) -> dict:
+    """ 加载器读取的全部源文件：datas.json 本身与各数据集的数据文件 """
+    root = loader.top_level_path
+    return {
+        "config": file_entry(loader._path, root),
+        "datasets": {
+            target: [file_entry(path, root) for path in loader.dataset_files(target)]
+            for target in loader.datasets
+        },
+    }
+
+
+def digest(value) -> str:
+    """ 任意可 JSON 序列化对象的稳定摘要 """
+    raw = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def dataset_digests(manifest: dict) -> dict:
+    """ 每个数据集单独的摘要，用于只重建发生变化的数据集 """
+    return {target: digest([manifest["config"][0], files]) for target, files in manifest["datasets"].items()}
@@ -0,0 +1,190 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# 默认的耗时分桶（秒），覆盖从单次 SQLite 调用到全库扫描
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter():
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str) -> None:
+        self.name = name
+        self.doc = doc
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+
+class Histogram():
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [各桶计数..., 总数, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state):
+                    out.append((self.name + "_bucket", key + (("le", repr(float(bound))),), count))
+                out.append((self.name + "_bucket", key + (("le", "+Inf"),), state[-2]))
+                out.append((self.name + "_count", key, state[-2]))
+                out.append((self.name + "_sum", key, state[-1]))
+        return out
+
+    def summary(self) -> dict:
+        """ 各标签组合的调用次数、总耗时与平均耗时，供调试面板展示 """
+        with self._lock:
+            return {
+                key: {"count": s[-2], "sum": s[-1], "avg": s[-1] / s[-2] if s[-2] else 0.0}
+                for key, s in self._values.items()
+            }
+
+
+class MetricsRegistry():
+    """ 进程内指标注册表，同名指标只创建一次 """
+
+    def __init__(self) -> None:
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, doc: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, doc, **kwargs)
+            return metric
+
+    def counter(self, name: str, doc: str = "") -> Counter:
+        return self._get(Counter, name, doc)
+
+    def histogram(self, name: str, doc: str = "", buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, doc, buckets=buckets)
+
+    def metrics(self) -> list:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def cache_ratios(self) -> dict:
+        """ 各缓存的命中率 {cache: (命中, 总数, 命中率)} """
+        counter = self._metrics.get("cache_requests_total")
+        if counter is None:
+            return {}
+        totals = {}
+        for _, key, value in counter.samples():
+            labels = dict(key)
+            hit, total = totals.get(labels["cache"], (0, 0))
+            totals[labels["cache"]] = (hit + (value if labels["result"] == "hit" else 0), total + value)
+        return {cache: (hit, total, hit / total if total else 0.0) for cache, (hit, total) in totals.items()}
+
+    def render_prometheus(self) -> str:
+        """ Prometheus 文本格式 """
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.doc}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        ratios = self.cache_ratios()
+        if ratios:
+            lines.append("# HELP cache_hit_ratio Cache hits over lookups")
+            lines.append("# TYPE cache_hit_ratio gauge")
+        for cache, (_, _, ratio) in sorted(ratios.items()):
+            lines.append(f"cache_hit_ratio{_format_labels((('cache', cache),))} {ratio}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    registry.counter("cache_requests_total", "Cache lookups by result").inc(
+        cache=cache, result="hit" if hit else "miss")
+
+
+def timed(name: str, doc: str = "", **labels):
+    """ 装饰器：以函数名为 op 标签记录调用耗时 """
+    def decorator(func):
+        histogram = registry.histogram(name, doc)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(op=func.__name__, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """ 在后台线程中提供 /metrics，供 Prometheus 抓取 """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
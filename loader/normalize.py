@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+from loader.jsonstyle import detect_style, dumps_style
+
+
+CHARMAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "charmap.json")
+
+
+def load_table(name: str, path: str = CHARMAP_PATH) -> dict:
+    """ 读取 charmap.json 中的一张映射表 """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)[name]["mapping"]
+
+
+class AhoCorasick():
+    """ 多字键的 Aho-Corasick 自动机，按最左最长原则做不重叠替换 """
+
+    def __init__(self, keys) -> None:
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]  # 以该状态结尾的全部键长度，含沿失败链可达的较短键
+        for key in keys:
+            state = 0
+            for ch in key:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                    self.goto[state][ch] = nxt
+                state = nxt
+            self.out[state] = tuple(sorted({*self.out[state], len(key)}, reverse=True))
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def finditer(self, text: str):
+        """ 产出不重叠的 (起点, 终点) """
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for length in self.out[state]:
+                matches.append((i + 1 - length, i + 1))
+        matches.sort(key=lambda m: (m[0], -m[1]))
+        pos = 0
+        for start, end in matches:
+            if start >= pos:
+                yield start, end
+                pos = end
+
+
+class Normalizer():
+    """ 单字用 str.translate，多字键用 Aho-Corasick，一次线性扫描完成替换 """
+
+    def __init__(self, mapping: dict) -> None:
+        self.mapping = mapping
+        self.table = str.maketrans({k: v for k, v in mapping.items() if len(k) == 1})
+        multi = [k for k in mapping if len(k) > 1]
+        self.automaton = AhoCorasick(multi) if multi else None
+        self.first_chars = frozenset(k[0] for k in multi)
+
+    def __call__(self, text: str) -> str:
+        if self.automaton is None or self.first_chars.isdisjoint(text):
+            return text.translate(self.table)
+        parts, pos = [], 0
+        for start, end in self.automaton.finditer(text):
+            parts.append(text[pos:start].translate(self.table))
+            parts.append(self.mapping[text[start:end]])
+            pos = end
+        parts.append(text[pos:].translate(self.table))
+        return "".join(parts)
+
+    def apply(self, data, fields: tuple, inside: bool = False) -> bool:
+        """ 递归处理 fields 字段下的所有字符串，原地修改，返回是否有改动 """
+        changed = False
+        if isinstance(data, list):
+            items = enumerate(data)
+        elif isinstance(data, dict):
+            items = data.items()
+        else:
+            return False
+        for key, value in list(items):
+            in_field = inside or key in fields
+            if isinstance(value, str):
+                if in_field:
+                    new = self(value)
+                    if new != value:
+                        data[key] = new
+                        changed = True
+            elif self.apply(value, fields, in_field):
+                changed = True
+        return changed
+
+
+_normalizer = None
+
+
+def _init_worker(mapping: dict) -> None:
+    global _normalizer
+    _normalizer = Normalizer(mapping)
+
+
+def normalize_file(filepath: str, fields: tuple, dry_run: bool = False) -> bool:
+    """ 处理单个文件，有改动时原子地改写（保持原有缩进与逗号格式） """
+    with open(filepath, "r", encoding="utf-8") as f:
+        raw = f.read()
+    data = json.loads(raw)
+    if not _normalizer.apply(data, fields):
+        return False
+    if not dry_run:
+        tmp = filepath + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(dumps_style(data, detect_style(raw)))
+        os.replace(tmp, filepath)
+    return True
+
+
+def normalize_dataset(loader: PlainDataLoader, target: str, mapping: dict,
+                      fields: tuple = None, dry_run: bool = False, workers: int = None) -> list:
+    """ 并行处理数据集的所有文件，返回有改动的文件列表 """
+    fields = tuple(fields or (loader.datasets[target]["tag"],))
+    files = loader.dataset_files(target)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(mapping,)) as pool:
+        results = pool.map(normalize_file, files, [fields] * len(files), [dry_run] * len(files))
+        return [f for f, changed in zip(files, results) if changed]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按 charmap.json 中的映射表规范化数据集用字")
+    parser.add_argument("datasets", nargs="+", help="datas.json 中的数据集名")
+    parser.add_argument("--table", default=None, help="映射表名，默认取数据集配置中的 normalize")
+    parser.add_argument("--fields", nargs="*", default=None, help="要处理的字段，默认为数据集的 tag")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    for target in args.datasets:
+        table = args.table or loader.datasets.get(target, {}).get("normalize")
+        if not table:
+            print(f"{target} has no normalize table, use --table")
+            continue
+        changed = normalize_dataset(loader, target, load_table(table), args.fields, args.dry_run)
+        print(f"{target}: {len(changed)} file(s) changed")
+        for filepath in changed:
+            print(f"  {filepath}")
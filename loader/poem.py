@@ -0,0 +1,153 @@
+import sys
+
+
+# 各数据集存放正文的字段名
+CONTENT_FIELDS = ("paragraphs", "content", "para")
+META_FIELDS = ("title", "author", "rhythmic", "chapter", "section")
+# 构造 Poem 只需要这些字段，加载时可只解码它们
+RECORD_FIELDS = META_FIELDS + CONTENT_FIELDS
+# 正文各行在 text 中的分隔符（数据中没有跨行的字符串）
+LINE_SEP = "\n"
+_intern = sys.intern
+
+
+def _intern_str(value) -> str:
+    return _intern(value) if value and value.__class__ is str else ""
+
+
+def flatten_lines(content) -> tuple:
+    """ 将正文（字符串、字符串列表或嵌套的章节字典列表）展开为行元组 """
+    if not content:
+        return ()
+    if isinstance(content, str):
+        return (content,)
+    if isinstance(content, list):
+        if all(isinstance(x, str) for x in content):
+            return tuple(content)
+        lines = []
+        for item in content:
+            if isinstance(item, str):
+                lines.append(item)
+            elif isinstance(item, dict):
+                for field in CONTENT_FIELDS:
+                    if item.get(field):
+                        lines.extend(flatten_lines(item[field]))
+                        break
+        return tuple(lines)
+    return (str(content),)
+
+
+class Poem():
+    """ 统一的诗词记录，由 PlainDataLoader 在加载时一次性从原始 dict 构造
+
+    正文展开后以换行拼接为一个字符串 text 保存（比逐行保存的字符串列表省内存，
+    也便于一次子串查找），lines 按需切分。只有正文不是扁平的字符串列表（如按章节
+    嵌套的蒙学、正文为单个字符串的幽梦影）时才在 body 中保留原始结构，供分章节展示。
+    id、notes 等其余字段不保留，需要时用 get_poems 读取原始 dict。
+    """
+    __slots__ = ("dataset", "pid", "title", "author", "rhythmic", "chapter", "section", "field", "text", "body")
+
+    def __init__(self, dataset, pid, title, author, rhythmic, chapter, section, field, text, body=None) -> None:
+        self.dataset = dataset
+        self.pid = pid
+        self.title = title
+        self.author = author
+        self.rhythmic = rhythmic
+        self.chapter = chapter
+        self.section = section
+        self.field = field
+        self.text = text
+        self.body = body
+
+    @classmethod
+    def from_dict(cls, data, dataset: str = "", pid: int = -1) -> "Poem":
+        """ data 为原始 dict，或解码后端按字段解码出的记录（见 loader/jsonbackend.py） """
+        get = data.get
+        field, content = "", None
+        for name in CONTENT_FIELDS:
+            value = get(name)
+            if value:
+                field, content = name, value
+                break
+        body = None
+        if content.__class__ is list:
+            try:
+                # 绝大多数正文是扁平的字符串列表
+                text = LINE_SEP.join(content)
+            except TypeError:
+                text, body = LINE_SEP.join(flatten_lines(content)), content
+        elif content:
+            text, body = LINE_SEP.join(flatten_lines(content)), content
+        else:
+            text = ""
+        return cls(
+            _intern_str(dataset), pid,
+            _intern_str(get("title")), _intern_str(get("author")), _intern_str(get("rhythmic")),
+            _intern_str(get("chapter")), _intern_str(get("section")),
+            field, text, body,
+        )
+
+    def __reduce__(self):
+        return (Poem, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self) -> str:
+        return f"Poem({self.dataset}#{self.pid} {self.display_title} - {self.author})"
+
+    @property
+    def display_title(self) -> str:
+        return self.title or self.rhythmic or self.chapter or "无题"
+
+    @property
+    def lines(self) -> list:
+        return self.text.split(LINE_SEP) if self.text else []
+
+    @property
+    def content(self):
+        """ 原始结构的正文，嵌套的章节或字符串原样返回，否则为行列表 """
+        return self.body if self.body is not None else self.lines
+
+    def headings(self) -> list:
+        """ 嵌套正文中的章节标题 """
+        out = []
+
+        def walk(items):
+            if not isinstance(items, list):
+                return
+            for item in items:
+                if isinstance(item, dict):
+                    for key in ("chapter", "title", "section", "type"):
+                        if isinstance(item.get(key), str):
+                            out.append(item[key])
+                    walk(next((item[f] for f in CONTENT_FIELDS if item.get(f)), None))
+        walk(self.body)
+        return out
+
+    def to_dict(self) -> dict:
+        """ 还原为与原始数据同形的 dict """
+        data = {k: getattr(self, k) for k in META_FIELDS if getattr(self, k)}
+        if self.field:
+            data[self.field] = self.content
+        return data
+
+    # 兼容按 dict 访问的旧代码
+    def get(self, key, default=None):
+        if key in META_FIELDS:
+            return getattr(self, key) or default
+        if key in CONTENT_FIELDS:
+            return self.content if key == self.field else default
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self):
+        return self.to_dict().keys()
+
+
+_MISSING = object()
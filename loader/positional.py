@@ -0,0 +1,199 @@
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from loader.corpus import CORPUS_VERSION, PUNCTUATION_CODES, derived, get_line_table
+
+# 句表结构变化时递增，旧缓存随之失效
+CLAUSE_VERSION = 1
+# 字矩阵的列数：诗词的句子绝大多数不超过 11 字，更长的句子只存前 WIDTH 个字
+WIDTH = 12
+# 模式中的通配符
+WILDCARDS = "?？*＊_＿"
+
+
+Clause = namedtuple("Clause", "poem line_no text")
+
+
+class ClauseTable():
+    """ 按标点把正文行切成句，每句一行存成定宽的字编号矩阵，用于按字位与同句共现的向量化查询
+
+    columns[j, i] 为第 i 句第 j 个字在 chars 中的序号加 1（0 表示空位），lengths 为句长，
+    starts 为句首在 LineTable.codepoints 中的位置，lines 为所在的正文行。
+    """
+
+    def __init__(self, table, state: dict = None) -> None:
+        self.table = table
+        if state is None:
+            state = self.build(table)
+        self.chars = state["chars"]
+        self.columns = state["columns"]
+        self.lengths = state["lengths"]
+        self.starts = state["starts"]
+        self.lines = state["lines"]
+        # 句按全局编号有序，数据集范围可以二分得到
+        self.gids = table.gids[self.lines]
+
+    @staticmethod
+    def build(table) -> dict:
+        codepoints = table.codepoints
+        text = ~np.isin(codepoints, PUNCTUATION_CODES)
+        positions = np.flatnonzero(text)
+        line_start = np.zeros(len(codepoints) + 1, dtype=bool)
+        line_start[table.starts[:-1]] = True
+        # 前一个位置不是字（标点）或本位置是行首时开始新的一句
+        new = np.ones(len(positions), dtype=bool)
+        new[1:] = (positions[1:] != positions[:-1] + 1) | line_start[positions[1:]]
+        clause = np.cumsum(new) - 1
+        firsts = np.flatnonzero(new)
+        lengths = np.diff(np.append(firsts, len(positions)))
+        column = np.arange(len(positions)) - firsts[clause]
+
+        present = np.zeros(0x110000, dtype=bool)
+        present[codepoints[positions]] = True
+        chars = np.flatnonzero(present).astype(np.uint32)
+        dtype = np.uint16 if len(chars) < 0xFFFF else np.uint32
+        dense = np.zeros(0x110000, dtype=dtype)
+        dense[chars] = np.arange(1, len(chars) + 1)
+        # 按列存放，单列的比较是连续内存上的向量运算
+        columns = np.zeros((WIDTH, len(firsts)), dtype=dtype)
+        keep = column < WIDTH
+        columns[column[keep], clause[keep]] = dense[codepoints[positions[keep]]]
+        starts = positions[firsts].astype(np.int64)
+        return {
+            "chars": chars,
+            "columns": columns,
+            "lengths": np.minimum(lengths, 0xFFFF).astype(np.uint16),
+            "starts": starts,
+            "lines": (np.searchsorted(table.starts, starts, side="right") - 1).astype(np.uint32),
+        }
+
+    def state(self) -> dict:
+        return {"chars": self.chars, "columns": self.columns, "lengths": self.lengths,
+                "starts": self.starts, "lines": self.lines}
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def char_id(self, char: str) -> int:
+        """ 字在矩阵中的编号，语料中没有的字为 -1 """
+        code = ord(char)
+        i = int(np.searchsorted(self.chars, code))
+        return i + 1 if i < len(self.chars) and self.chars[i] == code else -1
+
+    def text(self, i: int) -> str:
+        start = int(self.starts[i])
+        return self.table.codepoints[start:start + int(self.lengths[i])].tobytes().decode("utf-32-le")
+
+    def span(self, gids: range) -> slice:
+        lo, hi = np.searchsorted(self.gids, [gids.start, gids.stop])
+        return slice(int(lo), int(hi))
+
+    def select(self, pattern: str = None, contains: str = "", length: int = None,
+               positions: dict = None, scope: range = None) -> np.ndarray:
+        """ 满足全部条件的句编号（升序）
+
+        pattern 如 "??月????"：通配符之外的字须在对应位置，句长默认等于模式长度；
+        positions 如 {3: "月", -1: "花"}：位置从 1 起，负数从句末倒数；
+        contains 中的每个字都须出现在句中；scope 为全局编号范围时只查其中的句。
+        """
+        positions = dict(positions or {})
+        if pattern:
+            for i, char in enumerate(pattern, 1):
+                if char not in WILDCARDS:
+                    positions[i] = char
+            if length is None:
+                length = len(pattern)
+        required = [c for c in dict.fromkeys(contains) if c not in WILDCARDS and c.strip()]
+        empty = np.zeros(0, dtype=np.int64)
+        window = self.span(scope) if scope is not None else slice(0, len(self))
+        columns, lengths = self.columns[:, window], self.lengths[window]
+
+        fixed, from_end = [], []
+        for pos, char in positions.items():
+            cid = self.char_id(char)
+            if cid < 0 or pos == 0 or (length and abs(pos) > length):
+                return empty
+            # 句长已知时倒数的位置就是固定位置
+            if pos < 0 and length:
+                pos += length + 1
+            if pos > WIDTH:
+                raise ValueError(f"只能按前 {WIDTH} 个字的位置查询")
+            (fixed if pos > 0 else from_end).append((pos, cid))
+        ids = [self.char_id(c) for c in required]
+        if min(ids, default=0) < 0:
+            return empty
+
+        # 先按整列做句长与字位的筛选，共现再逐字在矩阵的前 width 列中查找
+        mask = np.ones(len(lengths), dtype=bool)
+        if length:
+            mask &= lengths == length
+        for pos, cid in fixed:
+            mask &= columns[pos - 1] == cid
+        for pos, cid in from_end:
+            # 句长未知时倒数第 k 字落在第 j 列（从 0 起）当且仅当句长为 j + k
+            found = lengths > WIDTH
+            for j, column in enumerate(columns):
+                hits = np.flatnonzero(column == cid)
+                found[hits[lengths[hits] == j - pos]] = True
+            mask &= found
+        width = min(length, WIDTH) if length else WIDTH
+        for cid in ids:
+            found = lengths > WIDTH
+            for column in columns[:width]:
+                found |= column == cid
+            mask &= found
+        candidates = np.flatnonzero(mask)
+        candidates = candidates + window.start
+
+        # 超出矩阵宽度的长句按原文核对，保证结果准确
+        long = np.flatnonzero(self.lengths[candidates] > WIDTH)
+        if len(long):
+            keep = np.ones(len(candidates), dtype=bool)
+            for k in long.tolist():
+                text = self.text(int(candidates[k]))
+                keep[k] = all(c in text for c in required) and all(
+                    abs(p) <= len(text) and text[p - 1 if p > 0 else p] == c for p, c in positions.items())
+            candidates = candidates[keep]
+        return candidates
+
+    def clauses(self, ids) -> list:
+        """ [Clause(poem, line_no, text)] """
+        records = self.table.index.records
+        result = []
+        for i in np.asarray(ids).tolist():
+            line = int(self.lines[i])
+            result.append(Clause(records[self.table.gids[line]], int(self.table.line_nos[line]), self.text(i)))
+        return result
+
+
+def get_clause_table(loader, use_cache: bool = True) -> ClauseTable:
+    table = get_line_table(loader, use_cache)
+    return derived(loader, "clauses", f"{CORPUS_VERSION}.{CLAUSE_VERSION}", lambda state: ClauseTable(table, state), use_cache)
+
+
+if __name__ == "__main__":
+    import time
+
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+    from loader.snapshot import load_snapshot
+
+    parser = argparse.ArgumentParser(description="按字位与同句共现查句，如 飞花令")
+    parser.add_argument("pattern", nargs="?", default=None, help="如 ??月????，? 为任意字")
+    parser.add_argument("--contains", default="", help="句中须同时出现的字，如 花酒")
+    parser.add_argument("--length", type=int, default=None, help="句长，如 5 或 7")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    load_snapshot(loader, lazy=True)
+    start = time.perf_counter()
+    clauses = get_clause_table(loader)
+    print(f"{len(clauses)} clauses ready in {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    found = clauses.select(args.pattern, args.contains, args.length)
+    print(f"{len(found)} match(es) in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for clause in clauses.clauses(found[:args.limit]):
+        print(f"  {clause.text}  —— {clause.poem.display_title} · {clause.poem.author or '佚名'}")
@@ -0,0 +1,480 @@
+import re
+
+import numpy as np
+
+from loader.corpus import PUNCTUATION, search_fields
+from loader.facets import get_facet_index
+from loader.forms import find_forms, get_form_index
+from loader.rhyme import get_rhyme_index
+
+
+# 字段前缀 -> Poem 属性；dataset、rhyme、form、line 与 FACETS 中的分面单独处理
+FIELDS = {"author": "author", "title": "title", "rhythmic": "rhythmic"}
+KEYWORDS = ("AND", "OR", "NOT")
+# 按分面位图筛选的前缀（见 loader/facets.py）
+FACETS = ("dynasty", "popularity")
+# 交集缩小到这个规模后，余下的条件直接逐首验证，不再读取更大的倒排表
+VERIFY_THRESHOLD = 256
+# 执行时每批验证的候选数
+BATCH = 4096
+
+_TOKEN = re.compile(r'\s*(\(|\)|-?(?:[a-z]+:(?:-?\d+:)?)?\^?"[^"]*"\$?|[^\s()]+)')
+_PREFIX = re.compile(r'([a-z]+):(?:(-?\d+):)?')
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+def _intersect(small: np.ndarray, big: np.ndarray) -> np.ndarray:
+    """ 两个升序去重数组的交集，代价与较小的一个成正比 """
+    if len(small) > len(big):
+        small, big = big, small
+    if not len(small):
+        return small
+    pos = np.searchsorted(big, small)
+    pos[pos == len(big)] = 0
+    return small[big[pos] == small]
+
+
+class Term():
+    """ 子串条件。field 为 None 时在全部检索字段中查找；line 为行号（从 1 起，负数从末行倒数）；
+    anchor 为 "^"（以之开头）或 "$"（以之结尾），对正文按行判断，对指定字段按整个字段判断
+    """
+
+    def __init__(self, text: str, field: str = None, line: int = None, anchor: str = None) -> None:
+        self.text = text
+        self.field = field
+        self.line = line
+        self.anchor = anchor
+        self.variants = (text,)
+        self.fold = False
+        self._estimate = None
+        self._candidates = None
+
+    def __repr__(self) -> str:
+        prefix = f"{self.field}:" if self.field else ""
+        if self.line is not None:
+            prefix += f"line:{self.line}:"
+        text = f"^{self.text}" if self.anchor == "^" else f"{self.text}$" if self.anchor == "$" else self.text
+        return f'{prefix}"{text}"'
+
+    def prepare(self, index, converters=None) -> None:
+        """ 按折叠表归并简繁体与异体（见 loader/folding.py）、按需转小写，并按最稀有的字估计候选数
+
+        倒排表已按折叠后的字建立，一个折叠后的查询词即可命中全部变体；converters 不再需要，保留以兼容调用方。
+        """
+        text = index.fold.fold(self.text)
+        # 查询词不含变体组中的字时，逐首核对不必折叠原文
+        self._fold = index.fold.fold if index.fold.affects(text) else None
+        self.fold = text.upper() != text
+        self.variants = (text.lower() if self.fold else text,)
+        # 有大小写之分的字不能直接查倒排表，只用其余的字定位候选
+        self._plans = [sorted({c for c in v if c.upper() == c.lower()}, key=index.posting_size)
+                       for v in self.variants]
+        if any(not chars for chars in self._plans):
+            self._estimate = len(index)
+        else:
+            self._estimate = min(len(index), sum(index.posting_size(chars[0]) for chars in self._plans))
+
+    def estimate(self, index) -> int:
+        return self._estimate
+
+    def candidates(self, index):
+        """ 可能命中的 gid（升序）；无法用倒排表缩小范围时返回 None """
+        if any(not chars for chars in self._plans):
+            return None
+        if self._candidates is None:
+            found = []
+            for chars in self._plans:
+                current = index.posting(chars[0])
+                for char in chars[1:]:
+                    if len(current) <= VERIFY_THRESHOLD:
+                        break
+                    current = _intersect(current, index.posting(char))
+                found.append(current)
+            self._candidates = found[0] if len(found) == 1 else np.union1d(*found) if len(found) == 2 \
+                else np.unique(np.concatenate(found))
+        return self._candidates
+
+    def _contains(self, value: str) -> bool:
+        if self._fold is not None:
+            value = self._fold(value)
+        if self.fold:
+            value = value.lower()
+        if self.anchor == "^":
+            value = value.lstrip(PUNCTUATION)
+            return any(value.startswith(v) for v in self.variants)
+        if self.anchor == "$":
+            value = value.rstrip(PUNCTUATION)
+            return any(value.endswith(v) for v in self.variants)
+        return any(v in value for v in self.variants)
+
+    def matches(self, poem) -> bool:
+        if self.field is not None:
+            return self._contains(getattr(poem, FIELDS[self.field]))
+        if self.line is not None:
+            lines = poem.lines
+            i = self.line - 1 if self.line > 0 else self.line
+            return -len(lines) <= i < len(lines) and self._contains(lines[i])
+        if self.anchor is not None:
+            return any(self._contains(line) for line in poem.lines)
+        return any(self._contains(value) for value in search_fields(poem))
+
+
+class Dataset():
+    """ dataset:名称，名称可以是 datas.json 的键、id 或 name """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.target = None
+
+    def __repr__(self) -> str:
+        return f"dataset:{self.target or self.name}"
+
+    def prepare(self, index, converters=None) -> None:
+        datasets = index.loader.datasets
+        for target, cfg in datasets.items():
+            if self.name in (target, str(cfg.get("id")), cfg.get("name")):
+                self.target = target
+                break
+        else:
+            raise QuerySyntaxError(f"未知的数据集: {self.name}")
+        self._range = index.dataset_range(self.target)
+
+    def estimate(self, index) -> int:
+        return len(self._range)
+
+    def candidates(self, index):
+        return np.arange(self._range.start, self._range.stop, dtype=np.uint32)
+
+    def matches(self, poem) -> bool:
+        return poem.dataset == self.target
+
+
+class Rhyme():
+    """ rhyme:韵部，如 rhyme:东、rhyme:下平七阳（平水韵，见 loader/rhyme.py） """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.group = -1
+
+    def __repr__(self) -> str:
+        return f"rhyme:{self.name}"
+
+    def prepare(self, index, converters=None) -> None:
+        self._rhymes = get_rhyme_index(index.loader)
+        self.group = self._rhymes.rhymes.find(self.name)
+        if self.group < 0:
+            raise QuerySyntaxError(f"未知的韵部: {self.name}")
+        self._offsets = index.offsets
+
+    def estimate(self, index) -> int:
+        return len(self._rhymes.poems(self.group))
+
+    def candidates(self, index):
+        return self._rhymes.poems(self.group)
+
+    def matches(self, poem) -> bool:
+        return self._rhymes.poem_groups[self._offsets[poem.dataset] + poem.pid] == self.group
+
+
+class Form():
+    """ form:体裁，如 form:七绝、form:律诗（见 loader/forms.py） """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f"form:{self.name}"
+
+    def prepare(self, index, converters=None) -> None:
+        self.forms = find_forms(self.name)
+        if not self.forms:
+            raise QuerySyntaxError(f"未知的体裁: {self.name}")
+        self._index = get_form_index(index.loader)
+        self._gids = self._index.gids(self.forms)
+        self._offsets = index.offsets
+
+    def estimate(self, index) -> int:
+        return len(self._gids)
+
+    def candidates(self, index):
+        return self._gids
+
+    def matches(self, poem) -> bool:
+        return self._index.forms[self._offsets[poem.dataset] + poem.pid] in self.forms
+
+
+class Facet():
+    """ dynasty:唐、popularity:名篇 等分面条件（见 loader/facets.py） """
+
+    def __init__(self, facet: str, name: str) -> None:
+        self.facet = facet
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f"{self.facet}:{self.name}"
+
+    def prepare(self, index, converters=None) -> None:
+        facets = get_facet_index(index.loader)
+        self.ids = facets.ids(self.facet, self.name)
+        if not self.ids:
+            raise QuerySyntaxError(f"未知的{self.facet}取值: {self.name}")
+        self._codes = facets.column(self.facet).codes
+        self._gids = facets.gids({self.facet: self.name})
+        self._offsets = index.offsets
+
+    def estimate(self, index) -> int:
+        return len(self._gids)
+
+    def candidates(self, index):
+        return self._gids
+
+    def matches(self, poem) -> bool:
+        return self._codes[self._offsets[poem.dataset] + poem.pid] in self.ids
+
+
+class Not():
+    def __init__(self, child) -> None:
+        self.child = child
+
+    def __repr__(self) -> str:
+        return f"NOT {self.child!r}"
+
+    def prepare(self, index, converters=None) -> None:
+        self.child.prepare(index, converters)
+
+    def estimate(self, index) -> int:
+        return max(len(index) - self.child.estimate(index), 0)
+
+    def candidates(self, index):
+        # 取反不缩小候选范围，只在验证时过滤
+        return None
+
+    def matches(self, poem) -> bool:
+        return not self.child.matches(poem)
+
+
+class And():
+    def __init__(self, children: list) -> None:
+        self.children = children
+
+    def __repr__(self) -> str:
+        return "(" + " AND ".join(map(repr, self.children)) + ")"
+
+    def prepare(self, index, converters=None) -> None:
+        for child in self.children:
+            child.prepare(index, converters)
+        # 最可能不满足的条件排在前面，验证时尽早短路
+        self.children.sort(key=lambda c: c.estimate(index))
+
+    def estimate(self, index) -> int:
+        return min(c.estimate(index) for c in self.children)
+
+    def candidates(self, index):
+        """ 按候选数从小到大求交集；集合足够小后余下的条件留给 matches 验证 """
+        current = None
+        for child in self.children:
+            if current is not None and (len(current) <= VERIFY_THRESHOLD
+                                        or child.estimate(index) > len(current) * 64):
+                break
+            found = child.candidates(index)
+            if found is None:
+                continue
+            current = found if current is None else _intersect(current, found)
+        return current
+
+    def matches(self, poem) -> bool:
+        return all(c.matches(poem) for c in self.children)
+
+
+class Or():
+    def __init__(self, children: list) -> None:
+        self.children = children
+
+    def __repr__(self) -> str:
+        return "(" + " OR ".join(map(repr, self.children)) + ")"
+
+    def prepare(self, index, converters=None) -> None:
+        for child in self.children:
+            child.prepare(index, converters)
+        # 最可能满足的条件排在前面
+        self.children.sort(key=lambda c: -c.estimate(index))
+
+    def estimate(self, index) -> int:
+        return min(len(index), sum(c.estimate(index) for c in self.children))
+
+    def candidates(self, index):
+        found = []
+        for child in self.children:
+            current = child.candidates(index)
+            if current is None:
+                return None
+            found.append(current)
+        return np.unique(np.concatenate(found))
+
+    def matches(self, poem) -> bool:
+        return any(c.matches(poem) for c in self.children)
+
+
+def _term(token: str):
+    """ 解析单个检索词：[字段:][行号:][^]词[$]，词可以用双引号括起以包含空格或关键字 """
+    field = line = anchor = None
+    prefix = _PREFIX.match(token)
+    if prefix and (prefix.group(1) in FIELDS or prefix.group(1) in ("dataset", "rhyme", "form", "line", *FACETS)):
+        name, number = prefix.groups()
+        if name == "line":
+            if number is None or int(number) == 0:
+                raise QuerySyntaxError(f"行号应为非零整数，如 line:1:明月 或 line:-1:故乡: {token}")
+            line = int(number)
+        elif number is not None:
+            raise QuerySyntaxError(f"只有 line: 可以带行号: {token}")
+        else:
+            field = name
+        token = token[prefix.end():]
+    if token.startswith("^"):
+        anchor, token = "^", token[1:]
+    if token.endswith("$"):
+        if anchor:
+            # 同时以 ^ 开头、以 $ 结尾即整行（或整个字段）相等，按两个条件的合取处理
+            anchor = "="
+        else:
+            anchor = "$"
+        token = token[:-1]
+    if len(token) >= 2 and token[0] == token[-1] == '"':
+        token = token[1:-1]
+    else:
+        token = token.strip('"')
+    if not token:
+        raise QuerySyntaxError("检索词为空")
+    if field == "dataset":
+        return Dataset(token)
+    if field == "rhyme":
+        return Rhyme(token)
+    if field == "form":
+        return Form(token)
+    if field in FACETS:
+        return Facet(field, token)
+    if anchor == "=":
+        return And([Term(token, field, line, "^"), Term(token, field, line, "$")])
+    return Term(token, field, line, anchor)
+
+
+class _Parser():
+    """ 递归下降：or := and (OR and)*；and := unary ([AND] unary)*；unary := (NOT|-) unary | ( or ) | 检索词 """
+
+    def __init__(self, text: str) -> None:
+        self.tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            match = _TOKEN.match(text, pos)
+            self.tokens.append(match.group(1))
+            pos = match.end()
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("查询为空")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"多余的 {self.peek()}")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == "OR":
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_unary()]
+        while self.peek() not in (None, ")", "OR"):
+            if self.peek() == "AND":
+                self.take()
+            children.append(self.parse_unary())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_unary(self):
+        token = self.take()
+        if token is None:
+            raise QuerySyntaxError("查询不完整")
+        if token == "NOT":
+            return Not(self.parse_unary())
+        if token == "(":
+            node = self.parse_or()
+            if self.take() != ")":
+                raise QuerySyntaxError("括号不匹配")
+            return node
+        if token == ")" or token in KEYWORDS:
+            raise QuerySyntaxError(f"{token} 的位置不对")
+        if token.startswith("-") and len(token) > 1:
+            return Not(_term(token[1:]))
+        return _term(token)
+
+
+def parse_query(text: str):
+    """ 把查询字符串解析为条件树，语法错误时抛出 QuerySyntaxError """
+    return _Parser(text).parse()
+
+
+class QueryPlan():
+    """ 绑定到语料索引的查询：先用倒排表求出候选，再按 gid 顺序逐首验证，结果按需产生 """
+
+    def __init__(self, root, index, scope: range = None) -> None:
+        self.root = root
+        self.index = index
+        self.scope = scope
+        self.scanned = 0
+
+    def explain(self) -> str:
+        lines = []
+
+        def walk(node, depth):
+            children = getattr(node, "children", None) or ([node.child] if isinstance(node, Not) else [])
+            label = type(node).__name__ if children else repr(node)
+            lines.append(f"{'  ' * depth}{label}  ~{node.estimate(self.index)}")
+            for child in children:
+                walk(child, depth + 1)
+        walk(self.root, 0)
+        return "\n".join(lines)
+
+    def _candidates(self) -> np.ndarray:
+        candidates = self.root.candidates(self.index)
+        start, stop = (self.scope.start, self.scope.stop) if self.scope is not None else (0, len(self.index))
+        if candidates is None:
+            return np.arange(start, stop, dtype=np.uint32)
+        if self.scope is not None:
+            lo, hi = np.searchsorted(candidates, [start, stop])
+            candidates = candidates[lo:hi]
+        return candidates
+
+    def __iter__(self):
+        records = self.index.records
+        matches = self.root.matches
+        candidates = self._candidates()
+        for offset in range(0, len(candidates), BATCH):
+            for gid in candidates[offset:offset + BATCH].tolist():
+                self.scanned += 1
+                poem = records[gid]
+                if matches(poem):
+                    yield poem
+
+
+def compile_query(text: str, index, converters=None, scope: str = None) -> QueryPlan:
+    """ 解析并绑定查询；scope 为数据集键时只在该数据集中查找 """
+    root = parse_query(text)
+    root.prepare(index, converters)
+    return QueryPlan(root, index, index.dataset_range(scope) if scope else None)
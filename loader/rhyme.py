@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from loader.corpus import CORPUS_VERSION, PUNCTUATION_CODES, derived, get_line_table
+
+PINGSHUI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pingshui.json")
+# 韵表或索引结构变化时递增，旧缓存随之失效
+RHYME_VERSION = 1
+# 一首诗至少有这么多行的韵脚落在同一韵部，才认为它押该韵
+MIN_RHYMES = 2
+
+
+
+class RhymeTable():
+    """ pingshui.json 中的平水韵表：groups[i] 为第 i 个韵部，一个字可属多个韵部（多音字）
+
+    chars 为升序码位，第 k 个字所属的韵部为 members[starts[k]:starts[k + 1]]，按韵表顺序排列。
+    """
+
+    def __init__(self, path: str = PINGSHUI_PATH) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            self.groups = json.load(f)["groups"]
+        pairs = sorted({(ord(c), i) for i, group in enumerate(self.groups) for c in group["chars"]})
+        codes = np.array([c for c, _ in pairs], dtype=np.uint32)
+        self.members = np.array([i for _, i in pairs], dtype=np.int16)
+        first = np.ones(len(codes), dtype=bool)
+        first[1:] = codes[1:] != codes[:-1]
+        self.chars = codes[first]
+        self.starts = np.append(np.flatnonzero(first), len(codes)).astype(np.int64)
+        self._names = {}
+        for i, group in enumerate(self.groups):
+            for name in (group["name"], group["alias"]):
+                self._names.setdefault(name, i)
+                self._names.setdefault(name[-1], i)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def find(self, name: str) -> int:
+        """ 韵部名称（如 "东"、"一東"、"下平七阳"、"东韵"）对应的序号，不认识时为 -1 """
+        name = name.strip().rstrip("韵韻")
+        for section in ("上平", "下平", "上声", "去声", "入声", "上聲", "去聲", "入聲"):
+            if name.startswith(section) and len(name) > len(section):
+                name = name[len(section):]
+        return self._names.get(name, -1)
+
+    def label(self, group: int) -> str:
+        """ 如 "下平七陽" """
+        group = self.groups[group]
+        section = group["section"] if group["tone"] == "平" else group["section"] + "聲"
+        return section + group["name"]
+
+    def lookup(self, codes: np.ndarray) -> tuple:
+        """ 每个码位在 chars 中的位置与是否在韵表中 """
+        pos = np.searchsorted(self.chars, codes)
+        pos[pos == len(self.chars)] = 0
+        return pos, self.chars[pos] == codes
+
+    def groups_of(self, char: str) -> list:
+        pos, known = self.lookup(np.array([ord(char)], dtype=np.uint32))
+        if not known[0]:
+            return []
+        return self.members[self.starts[pos[0]]:self.starts[pos[0] + 1]].tolist()
+
+
+class RhymeIndex():
+    """ 正文各行的韵脚（行末去掉标点后的最后一字）及其韵部，并按韵部建诗的倒排表
+
+    finals[i] 为第 i 行韵脚的码位（无字时为 0），groups[i] 为其韵部（不在韵表中时为 -1），
+    poem_groups[gid] 为全诗押的韵部；押第 g 部的诗为 gids[starts[g]:starts[g + 1]]（升序）；
+    by_final 为按韵脚码位排序的行号，同一韵脚字的行是其中连续的一段。
+    多音字的韵部取与全诗一致的那个，全诗的韵部取韵脚最多落入的一部，数目相同时取韵表中靠前的（平声优先）。
+    """
+
+    def __init__(self, table, rhymes: RhymeTable, state: dict = None) -> None:
+        self.table = table
+        self.rhymes = rhymes
+        if state is None:
+            state = self.build(table, rhymes)
+        self.finals = state["finals"]
+        self.groups = state["groups"]
+        self.poem_groups = state["poem_groups"]
+        self.starts = state["starts"]
+        self.gids = state["gids"]
+        self.by_final = state["by_final"]
+        self._sorted_finals = self.finals[self.by_final]
+
+    @staticmethod
+    def build(table, rhymes: RhymeTable) -> dict:
+        codepoints = table.codepoints
+        lengths = table.lengths()
+        count = len(table.index)
+        # 每行最后一个非标点字的位置，整行都是标点时落在行首之前
+        marks = np.where(np.isin(codepoints, PUNCTUATION_CODES), -1, np.arange(len(codepoints)))
+        last = np.full(len(table), -1, dtype=np.int64)
+        nonempty = lengths > 0
+        if len(codepoints):
+            last[nonempty] = np.maximum.reduceat(marks, table.starts[:-1][nonempty])
+        has_final = last >= table.starts[:-1]
+        finals = np.where(has_final, codepoints[np.maximum(last, 0)] if len(codepoints) else 0, 0).astype(np.uint32)
+
+        pos, known = rhymes.lookup(finals)
+        known &= has_final
+        # 展开为 (gid, 韵部) 对，一个多音字的韵脚为它所属的每一部各计一票
+        lines = np.flatnonzero(known)
+        sizes = rhymes.starts[pos[lines] + 1] - rhymes.starts[pos[lines]]
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        members = rhymes.members[np.repeat(rhymes.starts[pos[lines]], sizes) + offsets].astype(np.int64)
+        keys = table.gids[np.repeat(lines, sizes)].astype(np.int64) * len(rhymes) + members
+        keys.sort()
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        votes = np.diff(np.append(np.flatnonzero(first), len(keys)))
+        keys = keys[first]
+        pair_gids, pair_groups = keys // len(rhymes), keys % len(rhymes)
+        # 每首诗取票数最多的韵部，同票时取序号小的
+        order = np.lexsort((pair_groups, -votes, pair_gids))
+        best = order[np.r_[True, pair_gids[order][1:] != pair_gids[order][:-1]]] if len(order) else order
+        poem_groups = np.full(count, -1, dtype=np.int16)
+        chosen = votes[best] >= MIN_RHYMES
+        poem_groups[pair_gids[best][chosen]] = pair_groups[best][chosen]
+
+        # 行的韵部：属于全诗韵部时取之，否则取该字在韵表中的第一部
+        groups = np.full(len(table), -1, dtype=np.int16)
+        groups[lines] = rhymes.members[rhymes.starts[pos[lines]]]
+        line_pairs = np.repeat(lines, sizes)
+        agree = members == poem_groups[table.gids[line_pairs]]
+        groups[line_pairs[agree]] = members[agree]
+
+        rhymed = np.flatnonzero(poem_groups >= 0)
+        order = np.argsort(poem_groups[rhymed], kind="stable")
+        starts = np.searchsorted(poem_groups[rhymed][order], np.arange(len(rhymes) + 1)).astype(np.int64)
+        return {"finals": finals, "groups": groups, "poem_groups": poem_groups, "starts": starts,
+                "gids": rhymed[order].astype(np.uint32),
+                "by_final": np.argsort(finals, kind="stable").astype(np.uint32)}
+
+    def state(self) -> dict:
+        return {"finals": self.finals, "groups": self.groups, "poem_groups": self.poem_groups,
+                "starts": self.starts, "gids": self.gids, "by_final": self.by_final}
+
+    def poems(self, group: int) -> np.ndarray:
+        """ 押第 group 部的 gid（升序） """
+        if not 0 <= group < len(self.rhymes):
+            return self.gids[:0]
+        return self.gids[self.starts[group]:self.starts[group + 1]]
+
+    def _lines(self, gid: int) -> np.ndarray:
+        lo, hi = np.searchsorted(self.table.gids, [gid, gid + 1])
+        return np.arange(lo, hi)
+
+    def rhyme_chars(self, gid: int) -> str:
+        """ 全诗押韵的韵脚字（按出现顺序去重） """
+        group = int(self.poem_groups[gid])
+        lines = self._lines(gid)
+        lines = lines[self.groups[lines] == group] if group >= 0 else lines[:0]
+        return "".join(dict.fromkeys(chr(c) for c in self.finals[lines].tolist()))
+
+    def same_rhyme(self, gid: int, limit: int = 20, scope: range = None) -> list:
+        """ 与 gid 同押一部的诗，按共有韵脚字数从多到少排列，返回 [(gid, 共有韵脚字数)]
+
+        共有韵脚越多越可能是唱和之作（次韵、用韵）。
+        """
+        group = int(self.poem_groups[gid])
+        if group < 0:
+            return []
+        chars = np.array(sorted(map(ord, self.rhyme_chars(gid))), dtype=np.uint32)
+        bounds = np.searchsorted(self._sorted_finals, np.stack([chars, chars + 1]))
+        lines = np.concatenate([self.by_final[lo:hi] for lo, hi in bounds.T.tolist()] or [self.by_final[:0]])
+        lines = lines[self.groups[lines] == group]
+        gids = self.table.gids[lines].astype(np.int64)
+        keep = gids != gid
+        if scope is not None:
+            keep &= (gids >= scope.start) & (gids < scope.stop)
+        # 同一首诗中重复的韵脚字只计一次
+        keys = np.unique(gids[keep] << np.int64(21) | self.finals[lines[keep]].astype(np.int64))
+        found, shared = np.unique(keys >> np.int64(21), return_counts=True)
+        order = np.lexsort((found, -shared))[:limit]
+        return list(zip(found[order].tolist(), shared[order].tolist()))
+
+
+_RHYME_TABLE = None
+
+
+def get_rhyme_table() -> RhymeTable:
+    global _RHYME_TABLE
+    if _RHYME_TABLE is None:
+        _RHYME_TABLE = RhymeTable()
+    return _RHYME_TABLE
+
+
+def get_rhyme_index(loader, use_cache: bool = True) -> RhymeIndex:
+    table = get_line_table(loader, use_cache)
+    rhymes = get_rhyme_table()
+    return derived(loader, "rhymes", f"{CORPUS_VERSION}.{RHYME_VERSION}", lambda state: RhymeIndex(table, rhymes, state), use_cache)
+
+
+if __name__ == "__main__":
+    import time
+
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+    from loader.snapshot import load_snapshot
+
+    parser = argparse.ArgumentParser(description="按平水韵查押某韵的诗，或与某首诗同韵的诗")
+    parser.add_argument("group", nargs="?", default=None, help="韵部，如 东、一東、下平七阳")
+    parser.add_argument("--poem", default=None, help="数据集/编号，如 tangsong/0，列出与之同韵的诗")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    load_snapshot(loader, lazy=True)
+    start = time.perf_counter()
+    index = get_rhyme_index(loader)
+    records = index.table.index.records
+    print(f"rhyme index ready in {time.perf_counter() - start:.2f}s, "
+          f"{np.count_nonzero(index.poem_groups >= 0)}/{len(records)} poems rhymed")
+    if args.group:
+        group = index.rhymes.find(args.group)
+        if group < 0:
+            print(f"未知的韵部: {args.group}")
+        else:
+            found = index.poems(group)
+            print(f"{index.rhymes.label(group)}: {len(found)} poems")
+            for gid in found[:args.limit].tolist():
+                print(f"  {records[gid].display_title} · {records[gid].author or '佚名'}  {index.rhyme_chars(gid)}")
+    if args.poem:
+        target, pid = args.poem.split("/")
+        gid = index.table.index.offsets[target] + int(pid)
+        group = int(index.poem_groups[gid])
+        print(f"{records[gid].display_title}: {index.rhymes.label(group) if group >= 0 else '未押韵'} "
+              f"{index.rhyme_chars(gid)}")
+        for other, shared in index.same_rhyme(gid, args.limit):
+            print(f"  {shared}  {records[other].display_title} · {records[other].author or '佚名'}  "
+                  f"{index.rhyme_chars(other)}")
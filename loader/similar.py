@@ -0,0 +1,393 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from loader.corpus import PUNCTUATION_CODES, derived
+from loader.manifest import dataset_digests, source_manifest
+
+# 特征为字与相邻二字的哈希，维数固定，各数据集可以独立构建
+FEATURE_BITS = 18
+DIMENSIONS = 1 << FEATURE_BITS
+# 截断 SVD 的维数，0 表示不降维、直接在稀疏向量上计算
+DEFAULT_DIMS = 64
+# 拟合 SVD 时抽样的诗词数
+SVD_SAMPLE = 40000
+# 降维检索后用精确的稀疏余弦重排的候选倍数
+RERANK_FACTOR = 4
+# 分块处理时每块的非零元素数，控制临时内存
+CHUNK_NNZ = 1 << 20
+STORE_DIR = "similar"
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _hash(codes: np.ndarray) -> np.ndarray:
+    """ 乘法哈希到 [0, DIMENSIONS) """
+    return ((codes * _GOLDEN) >> np.uint64(64 - FEATURE_BITS)).astype(np.int32)
+
+
+def term_counts(texts: list) -> tuple:
+    """ 每篇文本的字与二字组合计数，返回 CSR 形式的 (indptr, indices, counts)
+
+    标点与换行不参与，去掉后相邻的两字即构成二字组合。
+    """
+    codepoints = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    docs = np.repeat(np.arange(len(texts), dtype=np.uint64), [len(t) for t in texts])
+    keep = ~np.isin(codepoints, PUNCTUATION_CODES)
+    codepoints, docs = codepoints[keep], docs[keep]
+    pair = docs[1:] == docs[:-1]
+    # 二字组合的编码不小于 2^21，与单字编码不会重合
+    bigrams = (codepoints[:-1][pair] << np.uint64(21)) | codepoints[1:][pair]
+    features = np.concatenate((_hash(codepoints), _hash(bigrams))).astype(np.uint64)
+    keys = (np.concatenate((docs, docs[1:][pair])) << np.uint64(FEATURE_BITS)) | features
+    keys.sort()
+    if len(keys):
+        first = np.concatenate(([True], keys[1:] != keys[:-1]))
+        starts = np.flatnonzero(first)
+        counts = np.diff(np.append(starts, len(keys))).astype(np.float32)
+        keys = keys[starts]
+    else:
+        counts = np.zeros(0, np.float32)
+    rows = (keys >> np.uint64(FEATURE_BITS)).astype(np.int64)
+    indptr = np.searchsorted(rows, np.arange(len(texts) + 1)).astype(np.int64)
+    return indptr, (keys & np.uint64(DIMENSIONS - 1)).astype(np.int32), counts
+
+
+def _weights(indices: np.ndarray, counts: np.ndarray, indptr: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    """ 次线性 tf 乘 idf，并按行归一化 """
+    weights = (1 + np.log(counts)) * idf[indices]
+    lengths = np.diff(indptr)
+    norms = np.sqrt(np.add.reduceat(weights * weights, indptr[:-1])) if len(weights) else np.zeros(0)
+    norms = np.where(lengths > 0, norms, 1)
+    return (weights / np.repeat(norms, lengths)).astype(np.float32)
+
+
+def _project(indptr, indices, weights, basis) -> np.ndarray:
+    """ 稀疏行乘以稠密矩阵 basis（DIMENSIONS × k），按非零元素分块 """
+    rows = len(indptr) - 1
+    out = np.zeros((rows, basis.shape[1]), dtype=np.float32)
+    row = 0
+    while row < rows:
+        end = int(np.searchsorted(indptr, indptr[row] + CHUNK_NNZ, side="right")) - 1
+        end = min(max(end, row + 1), rows)
+        lo, hi = indptr[row], indptr[end]
+        if hi > lo:
+            contrib = weights[lo:hi, None] * basis[indices[lo:hi]]
+            lengths = np.diff(indptr[row:end + 1])
+            nonempty = lengths > 0
+            sums = np.add.reduceat(contrib, indptr[row:end][nonempty] - lo)
+            out[row:end][nonempty] = sums
+        row = end
+    return out
+
+
+def _transpose_project(indptr, indices, weights, dense, order: np.ndarray = None) -> np.ndarray:
+    """ 稀疏矩阵的转置乘以稠密矩阵 dense（行数 × k），结果为 DIMENSIONS × k
+
+    order 为按特征排序非零元素的下标（可复用），排序后同一特征的贡献相邻，分块用 reduceat 求和。
+    """
+    if order is None:
+        order = np.argsort(indices, kind="stable")
+    out = np.zeros((DIMENSIONS, dense.shape[1]), dtype=np.float64)
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    for lo in range(0, len(order), CHUNK_NNZ):
+        take = order[lo:lo + CHUNK_NNZ]
+        features = indices[take]
+        starts = np.flatnonzero(np.concatenate(([True], features[1:] != features[:-1])))
+        # 块内特征互不相同，可以直接按下标累加
+        out[features[starts]] += np.add.reduceat(weights[take, None] * dense[rows[take]], starts)
+    return out
+
+
+def truncated_svd(indptr, indices, weights, dims: int, oversample: int = 16, iterations: int = 2,
+                  seed: int = 0) -> np.ndarray:
+    """ 随机化截断 SVD（Halko 等），返回右奇异向量构成的 DIMENSIONS × dims 投影矩阵 """
+    rng = np.random.default_rng(seed)
+    k = dims + oversample
+    order = np.argsort(indices, kind="stable")
+    omega = rng.standard_normal((DIMENSIONS, k)).astype(np.float32)
+    q, _ = np.linalg.qr(_project(indptr, indices, weights, omega))
+    for _ in range(iterations):
+        z, _ = np.linalg.qr(_transpose_project(indptr, indices, weights, q, order))
+        q, _ = np.linalg.qr(_project(indptr, indices, weights, z.astype(np.float32)))
+    # B = Qᵀ X 为 k × DIMENSIONS，Bᵀ = Xᵀ Q
+    bt = _transpose_project(indptr, indices, weights, q, order)
+    u, s, vt = np.linalg.svd(bt.T @ bt)
+    # Bᵀ 的左奇异向量即 X 的右奇异向量
+    v = bt @ (u[:, :dims] / np.sqrt(np.maximum(s[:dims], 1e-12)))
+    return v.astype(np.float32)
+
+
+def _read_meta(root: str) -> dict:
+    try:
+        with open(os.path.join(root, "index.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return meta if meta.get("feature_bits") == FEATURE_BITS else {}
+
+
+def index_ready(loader, dims: int = DEFAULT_DIMS, root: str = None) -> bool:
+    """ 磁盘上的索引是否与当前源文件一致、打开时不必重建；只读取 index.json 与文件属性 """
+    root = root or os.path.join(loader.cache_path, STORE_DIR)
+    meta = _read_meta(root)
+    if not meta or meta.get("dims", 0) != dims:
+        return False
+    if dims and not os.path.exists(os.path.join(root, "basis.npy")):
+        return False
+    stored = meta.get("datasets", {})
+    name = "vectors.npy" if dims else "counts.npy"
+    return all(stored.get(target) == digest and os.path.exists(os.path.join(root, target, name))
+               for target, digest in dataset_digests(source_manifest(loader)).items())
+
+
+def _save(path: str, array: np.ndarray) -> None:
+    np.save(path + ".tmp.npy", array)
+    os.replace(path + ".tmp.npy", path + ".npy")
+
+
+class SimilarIndex():
+    """ 按字与二字组合的 TF-IDF 向量查找相似作品
+
+    存放在 cache_path/similar/ 下：每个数据集一个目录，保存词频（CSR）、文档频率与降维后的向量，
+    均为 .npy 并以内存映射方式读取。index.json 记录各数据集对应的源文件摘要，
+    源文件变化时只重建变化的数据集。SVD 投影矩阵与当时的 idf 一起保存，只在缺失或显式要求时重新拟合，
+    因此个别数据集更新后不必重算其余数据集的向量。
+    """
+
+    def __init__(self, loader, dims: int = DEFAULT_DIMS, root: str = None) -> None:
+        self.loader = loader
+        self.dims = dims
+        self.root = root or os.path.join(loader.cache_path, STORE_DIR)
+        self.targets = [loader.id_table[i] for i in sorted(loader.id_table)]
+        self._lock = threading.Lock()
+        self.rebuilt = self.refresh()
+
+    def _path(self, target: str, name: str) -> str:
+        return os.path.join(self.root, target, name)
+
+    def _read_meta(self) -> dict:
+        return _read_meta(self.root)
+
+    def _write_meta(self, meta: dict) -> None:
+        path = os.path.join(self.root, "index.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def refresh(self, refit: bool = False) -> list:
+        """ 重建源文件有变化的数据集，返回重建的数据集列表 """
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            meta = self._read_meta()
+            digests = dataset_digests(source_manifest(self.loader))
+            self._digests = digests
+            stored = meta.get("datasets", {})
+            rebuilt = [t for t in self.targets if stored.get(t) != digests[t]
+                       or not os.path.exists(self._path(t, "counts.npy"))]
+            for target in rebuilt:
+                self._build_counts(target)
+                stored[target] = digests[target]
+            for name in os.listdir(self.root):
+                if os.path.isdir(os.path.join(self.root, name)) and name not in self.targets:
+                    shutil.rmtree(os.path.join(self.root, name))
+            stored = {t: d for t, d in stored.items() if t in self.targets}
+            self._open()
+
+            basis_dims = meta.get("dims", 0)
+            if self.dims and (refit or basis_dims != self.dims or not os.path.exists(os.path.join(self.root, "basis.npy"))):
+                self._fit_basis()
+                rebuilt = list(self.targets)
+            if self.dims:
+                basis = np.load(os.path.join(self.root, "basis.npy"))
+                basis_idf = np.load(os.path.join(self.root, "basis_idf.npy"))
+                for target in rebuilt:
+                    self._embed(target, basis, basis_idf)
+            self._write_meta({"feature_bits": FEATURE_BITS, "dims": self.dims, "datasets": stored})
+            self._open()
+        return rebuilt
+
+    def ensure_fresh(self) -> list:
+        """ 源文件清单与上次检查时不同才调用 refresh，返回重建的数据集列表 """
+        if dataset_digests(source_manifest(self.loader)) == self._digests:
+            return []
+        self.rebuilt = self.refresh()
+        return self.rebuilt
+
+    def _build_counts(self, target: str) -> None:
+        os.makedirs(os.path.join(self.root, target), exist_ok=True)
+        indptr, indices, counts = term_counts([p.text for p in self.loader.get_records(target)])
+        _save(self._path(target, "indptr"), indptr)
+        _save(self._path(target, "indices"), indices)
+        _save(self._path(target, "counts"), counts)
+        _save(self._path(target, "df"), np.bincount(indices, minlength=DIMENSIONS).astype(np.int32))
+
+    def _open(self) -> None:
+        """ 以内存映射打开各数据集的数组，并由各数据集的文档频率汇总出当前的 idf """
+        self.data = {}
+        df = np.zeros(DIMENSIONS, dtype=np.int64)
+        total = 0
+        for target in self.targets:
+            arrays = {}
+            for name in ("indptr", "indices", "counts", "df", "vectors"):
+                path = self._path(target, name + ".npy")
+                if os.path.exists(path):
+                    arrays[name] = np.load(path, mmap_mode="r")
+            self.data[target] = arrays
+            if "df" in arrays:
+                df += arrays["df"]
+                total += len(arrays["indptr"]) - 1
+        self.idf = (np.log((1 + total) / (1 + df)) + 1).astype(np.float32)
+
+    def _fit_basis(self) -> None:
+        """ 从全部数据集按比例抽样拟合投影矩阵 """
+        rng = np.random.default_rng(0)
+        total = sum(len(self.data[t]["indptr"]) - 1 for t in self.targets)
+        parts = []
+        for target in self.targets:
+            arrays = self.data[target]
+            n = len(arrays["indptr"]) - 1
+            take = min(n, max(1, round(SVD_SAMPLE * n / max(total, 1)))) if n else 0
+            rows = np.sort(rng.choice(n, take, replace=False)) if take else np.zeros(0, np.int64)
+            parts.append(self._rows(target, rows, self.idf))
+        indptr, indices, weights = _stack(parts)
+        _save(os.path.join(self.root, "basis"), truncated_svd(indptr, indices, weights, self.dims))
+        _save(os.path.join(self.root, "basis_idf"), self.idf)
+
+    def _rows(self, target: str, rows: np.ndarray, idf: np.ndarray) -> tuple:
+        """ 指定行的归一化 TF-IDF 稀疏表示 (indptr, indices, weights) """
+        arrays = self.data[target]
+        indptr = arrays["indptr"]
+        starts, ends = indptr[rows], indptr[rows + 1]
+        lengths = ends - starts
+        take = np.repeat(starts - np.cumsum(np.concatenate(([0], lengths[:-1]))), lengths) + np.arange(lengths.sum())
+        sub_ptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        indices = np.asarray(arrays["indices"][take])
+        return sub_ptr, indices, _weights(indices, np.asarray(arrays["counts"][take]), sub_ptr, idf)
+
+    def _embed(self, target: str, basis: np.ndarray, idf: np.ndarray) -> None:
+        arrays = self.data[target]
+        indptr = np.asarray(arrays["indptr"])
+        weights = _weights(np.asarray(arrays["indices"]), np.asarray(arrays["counts"]), indptr, idf)
+        vectors = _project(indptr, arrays["indices"], weights, basis)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        _save(self._path(target, "vectors"), vectors / np.where(norms > 0, norms, 1))
+
+    def similar(self, items: list, k: int = 10) -> list:
+        """ 批量查询：items 为 [(数据集, pid)]，对每一项返回 [(数据集, pid, 余弦相似度)]，不含自身及正文相同的作品 """
+        if not items:
+            return []
+        want = k * RERANK_FACTOR + 1
+        if self.dims:
+            queries = np.stack([self.data[t]["vectors"][pid] for t, pid in items])
+            candidates = self._top(lambda arrays: queries @ np.asarray(arrays["vectors"]).T, len(items), want)
+        else:
+            dense = np.zeros((len(items), DIMENSIONS), dtype=np.float32)
+            for i, (t, pid) in enumerate(items):
+                _, indices, weights = self._rows(t, np.array([pid]), self.idf)
+                dense[i, indices] = weights
+            candidates = self._top(lambda arrays: self._sparse_scores(arrays, dense), len(items), want)
+        return [self._rerank(item, found, k) for item, found in zip(items, candidates)]
+
+    def _sparse_scores(self, arrays: dict, dense: np.ndarray) -> np.ndarray:
+        indptr = np.asarray(arrays["indptr"])
+        weights = _weights(np.asarray(arrays["indices"]), np.asarray(arrays["counts"]), indptr, self.idf)
+        return _project(indptr, arrays["indices"], weights, dense.T).T
+
+    def _top(self, score, batch: int, want: int) -> list:
+        """ 逐个数据集算出 (batch × 行数) 的得分，每个查询保留全库前 want 个 [(得分, 数据集, pid)] """
+        found = [[] for _ in range(batch)]
+        for target in self.targets:
+            arrays = self.data[target]
+            if "indptr" not in arrays or len(arrays["indptr"]) <= 1:
+                continue
+            scores = score(arrays)
+            take = min(want, scores.shape[1])
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            for i in range(batch):
+                rows = top[i]
+                found[i] += zip(scores[i, rows].tolist(), [target] * take, rows.tolist())
+                found[i] = sorted(found[i], reverse=True)[:want]
+        return found
+
+    def _rerank(self, item: tuple, found: list, k: int) -> list:
+        """ 用当前 idf 下精确的稀疏余弦重排，去掉自身与正文相同的作品 """
+        source = self.loader.get_records(item[0])[item[1]]
+        _, q_indices, q_weights = self._rows(item[0], np.array([item[1]]), self.idf)
+        query = np.zeros(DIMENSIONS, dtype=np.float32)
+        query[q_indices] = q_weights
+        by_target = {}
+        for _, target, pid in found:
+            if (target, pid) != tuple(item) and self.loader.get_records(target)[pid].text != source.text:
+                by_target.setdefault(target, []).append(pid)
+        scored = []
+        for target, pids in by_target.items():
+            indptr, indices, weights = self._rows(target, np.array(pids), self.idf)
+            lengths = np.diff(indptr)
+            sums = np.zeros(len(pids))
+            nonempty = lengths > 0
+            if nonempty.any():
+                sums[nonempty] = np.add.reduceat(query[indices] * weights, indptr[:-1][nonempty])
+            scored += zip(sums.tolist(), [target] * len(pids), pids)
+        scored.sort(key=lambda s: -s[0])
+        return [(target, pid, score) for score, target, pid in scored[:k]]
+
+
+def _stack(parts: list) -> tuple:
+    indptrs, indices, weights = [], [], []
+    offset = 0
+    for indptr, idx, w in parts:
+        indptrs.append(indptr[:-1] + offset)
+        offset += indptr[-1]
+        indices.append(idx)
+        weights.append(w)
+    indptrs.append(np.array([offset], dtype=np.int64))
+    return np.concatenate(indptrs), np.concatenate(indices), np.concatenate(weights)
+
+
+def get_similar_index(loader, dims: int = DEFAULT_DIMS) -> SimilarIndex:
+    """ 每个加载器只打开一次；打开时和之后每次取用时检查源文件清单，增量重建变化的数据集
+
+    全量构建较慢（完整语料约一两分钟），应由后台预热或 python -m loader.similar 预先完成，见 index_ready。
+    """
+    index = derived(loader, f"similar-{dims}", 0, lambda state: SimilarIndex(loader, dims), use_cache=False)
+    index.ensure_fresh()
+    return index
+
+
+if __name__ == "__main__":
+    import time
+
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+    from loader.snapshot import load_snapshot
+
+    parser = argparse.ArgumentParser(description="构建相似作品索引并查询")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--dims", type=int, default=DEFAULT_DIMS, help="SVD 维数，0 表示不降维")
+    parser.add_argument("--refit", action="store_true", help="重新拟合 SVD 投影并重算全部向量")
+    parser.add_argument("--query", nargs=2, action="append", metavar=("DATASET", "PID"), default=[])
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    load_snapshot(loader, lazy=True)
+    start = time.perf_counter()
+    index = SimilarIndex(loader, args.dims)
+    if args.refit:
+        index.refresh(refit=True)
+    print(f"ready in {time.perf_counter() - start:.2f}s, rebuilt: {index.rebuilt or 'none'}")
+    items = [(t, int(pid)) for t, pid in args.query]
+    if items:
+        start = time.perf_counter()
+        results = index.similar(items, args.k)
+        print(f"{len(items)} queries in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for (target, pid), found in zip(items, results):
+            poem = loader.get_records(target)[pid]
+            print(f"{target}/{pid} {poem.display_title} · {poem.author}")
+            for t, p, score in found:
+                other = loader.get_records(t)[p]
+                print(f"  {score:.3f} {t}/{p} {other.display_title} · {other.author}")
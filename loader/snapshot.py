@@ -0,0 +1,200 @@
+import argparse
+import functools
+import os
+import pickle
+import time
+
+from loader.jsonbackend import paused_gc
+from loader.manifest import digest, source_manifest
+from loader.metrics import record_cache, registry
+from loader.poem import Poem
+
+
+# 快照结构或 Poem 字段变化时递增，旧快照随之失效
+SNAPSHOT_VERSION = 2
+
+_seconds = registry.histogram("loader_snapshot_seconds", "Time to save or restore the loader snapshot")
+
+
+def snapshot_path(loader) -> str:
+    return os.path.join(loader.cache_path, f"loader.v{SNAPSHOT_VERSION}.pickle")
+
+
+def _header(manifest: dict) -> dict:
+    return {
+        "version": SNAPSHOT_VERSION,
+        "schema": list(Poem.__slots__),
+        "digest": digest(manifest),
+    }
+
+
+def save_snapshot(loader, path: str = None, manifest: dict = None) -> str:
+    """ 构建加载器的完整状态并写出快照
+
+    文件依次为：头部（版本与源文件清单摘要）、元数据（数据集配置、id 表、作者表与各段位置）、
+    各数据集记录的分段 pickle，分段使得恢复时可以按需载入单个数据集。
+    manifest 应在构建状态之前计算，构建期间源文件若有改动，快照会在下次加载时失效。
+    """
+    path = path or snapshot_path(loader)
+    manifest = manifest or source_manifest(loader)
+    with _seconds.time(op="save"):
+        state = loader.export_state()
+        sections, offset = {}, 0
+        payloads = []
+        for target, records in state.pop("records").items():
+            data = pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+            sections[target] = (offset, len(data))
+            offset += len(data)
+            payloads.append(data)
+        state["sections"] = sections
+        header = dict(_header(manifest), created=time.time(),
+                      records=sum(len(r) for r in loader._records.values()))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for data in payloads:
+                f.write(data)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def read_header(path: str):
+    """ 只读取快照头部，不存在或无法读取时返回 None """
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def is_valid(loader, header, manifest: dict = None) -> bool:
+    if not isinstance(header, dict):
+        return False
+    expected = _header(manifest or source_manifest(loader))
+    return all(header.get(key) == value for key, value in expected.items())
+
+
+def _load_section(path: str, stat: tuple, start: int, length: int):
+    """ 读取一个数据集的记录；快照文件在恢复后被替换时返回 None，由加载器从数据文件重建 """
+    try:
+        st = os.stat(path)
+        if (st.st_ino, st.st_mtime_ns) != stat:
+            return None
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(length)
+    except OSError:
+        return None
+    # 快照中的对象没有循环引用，恢复时暂停分代回收
+    with paused_gc():
+        return pickle.loads(data)
+
+
+def load_snapshot(loader, path: str = None, lazy: bool = False) -> bool:
+    """ 快照与当前源文件一致时恢复到 loader 并返回 True，否则不做改动并返回 False
+
+    lazy 为 True 时只恢复元数据与作者表，各数据集的记录在首次 get_records 时才从快照读取。
+    """
+    path = path or snapshot_path(loader)
+    with _seconds.time(op="load_lazy" if lazy else "load"):
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                header = pickle.load(f)
+                valid = is_valid(loader, header)
+                if valid:
+                    state = pickle.load(f)
+                    base = f.tell()
+                    sections = state.pop("sections")
+                    if not lazy:
+                        data = memoryview(f.read())
+                        with paused_gc():
+                            state["records"] = {
+                                target: pickle.loads(data[start:start + length])
+                                for target, (start, length) in sections.items()
+                            }
+        except (OSError, EOFError, pickle.UnpicklingError):
+            valid = False
+        if valid:
+            sources = None
+            if lazy:
+                stat = (st.st_ino, st.st_mtime_ns)
+                sources = {
+                    target: functools.partial(_load_section, path, stat, base + start, length)
+                    for target, (start, length) in sections.items()
+                }
+            # 恢复的记录依据快照头部的清单摘要，此后清单变化时随之失效
+            loader.sync_sources(header["digest"])
+            loader.import_state(state, sources)
+    record_cache("loader_snapshot", valid)
+    return valid
+
+
+def cache_file(loader, name: str, version: int) -> str:
+    return os.path.join(loader.cache_path, f"{name}.v{version}.pickle")
+
+
+def save_cache(loader, name: str, version: int, state, manifest: dict = None) -> str:
+    """ 写出由加载器派生的索引等状态，与快照一样以源文件清单摘要为有效性依据 """
+    path = cache_file(loader, name, version)
+    header = {"version": version, "digest": digest(manifest or source_manifest(loader)), "created": time.time()}
+    with _seconds.time(op=f"save:{name}"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def load_cache(loader, name: str, version: int, manifest: dict = None):
+    """ 读取 save_cache 写出的状态；缺失、版本不同或源文件已变化时返回 None """
+    path = cache_file(loader, name, version)
+    state = None
+    with _seconds.time(op=f"load:{name}"):
+        try:
+            with open(path, "rb") as f:
+                header = pickle.load(f)
+                if (isinstance(header, dict) and header.get("version") == version
+                        and header.get("digest") == digest(manifest or source_manifest(loader))):
+                    with paused_gc():
+                        state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            state = None
+    record_cache(f"cache_{name}", state is not None)
+    return state
+
+
+def warm(loader, path: str = None, lazy: bool = False) -> str:
+    """ 优先从快照恢复；快照缺失或过期时完整构建并重写快照。返回 "snapshot" 或 "built" """
+    if load_snapshot(loader, path, lazy):
+        return "snapshot"
+    save_snapshot(loader, path)
+    return "built"
+
+
+if __name__ == "__main__":
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+
+    parser = argparse.ArgumentParser(description="构建或检查加载器状态快照")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--path", default=None, help="快照路径，默认在 datas.json 的 cache_path 下")
+    parser.add_argument("--check", action="store_true", help="只检查快照是否有效")
+    parser.add_argument("--rebuild", action="store_true", help="忽略现有快照，重新构建")
+    parser.add_argument("--lazy", action="store_true", help="只恢复元数据，按需载入各数据集")
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    path = args.path or snapshot_path(loader)
+    if args.check:
+        valid = is_valid(loader, read_header(path))
+        print(f"{path}: {'valid' if valid else 'missing or stale'}")
+        raise SystemExit(0 if valid else 1)
+    start = time.perf_counter()
+    if args.rebuild:
+        save_snapshot(loader, path)
+        status = "built"
+    else:
+        status = warm(loader, path, args.lazy)
+    print(f"{path}: {status} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,200 @@
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from loader.corpus import CORPUS_VERSION, derived, get_line_table
+
+# 后缀数组结构变化时递增，旧缓存随之失效
+SUFFIX_VERSION = 1
+# 行与行之间的分隔符编号，小于任何字，模式串不会跨行匹配
+SEPARATOR = 0
+
+Occurrence = namedtuple("Occurrence", "dataset pid line_no offset")
+
+
+def suffix_array(text: np.ndarray) -> np.ndarray:
+    """ 前缀倍增法构造后缀数组（text 为非负整数编号，末尾之后视为最小）
+
+    先按前几个字打包成的 64 位键排序，之后每轮只对仍有并列的组按 (组号, 后移 h 位的组号) 细分，
+    组号取组在后缀数组中的起始下标，部分更新后仍保持全局次序。
+    """
+    n = len(text)
+    if n == 0:
+        return np.zeros(0, np.int32)
+    # 编号加 1 后打包，0 留给末尾之后的位置
+    bits = (int(text.max()) + 1).bit_length()
+    width = max(64 // bits, 1)
+    key = np.zeros(n, dtype=np.uint64)
+    for i in range(min(width, n)):
+        shifted = np.zeros(n, dtype=np.uint64)
+        shifted[:n - i] = text[i:].astype(np.uint64) + np.uint64(1)
+        key |= shifted << np.uint64(bits * (width - 1 - i))
+    sa = np.argsort(key, kind="stable").astype(np.int32)
+    key = key[sa]
+    boundary = np.empty(n, dtype=bool)
+    boundary[0] = True
+    np.not_equal(key[1:], key[:-1], out=boundary[1:])
+    del key
+    positions = np.arange(n, dtype=np.int32)
+    rank = np.empty(n, dtype=np.int32)
+    rank[sa] = np.maximum.accumulate(np.where(boundary, positions, 0))
+
+    h = width
+    while True:
+        starts = np.flatnonzero(boundary)
+        sizes = np.diff(np.append(starts, n))
+        tied = sizes > 1
+        if not tied.any():
+            break
+        idx = np.flatnonzero(np.repeat(tied, sizes)).astype(np.int32)
+        suffixes = sa[idx]
+        following = suffixes.astype(np.int64) + h
+        second = np.where(following < n, rank[np.minimum(following, n - 1)].astype(np.int64) + 1, 0)
+        key = (rank[suffixes].astype(np.uint64) << np.uint64(32)) | second.astype(np.uint64)
+        order = np.argsort(key, kind="stable")
+        suffixes, key = suffixes[order], key[order]
+        sa[idx] = suffixes
+        split = np.empty(len(idx), dtype=bool)
+        split[0] = True
+        np.not_equal(key[1:], key[:-1], out=split[1:])
+        # 先用本轮之前的组号算完所有键，再统一更新
+        rank[suffixes] = np.maximum.accumulate(np.where(split, idx, 0))
+        boundary[idx] = split
+        h *= 2
+    return sa
+
+
+class SuffixIndex():
+    """ 全部正文行拼接后的后缀数组，用于精确的子串计数与定位
+
+    text 为各行的字编号（按码位排序后从 1 起），每行之后跟一个分隔符 0；
+    编号以大端序存放，字节串比较即与编号比较一致。
+    """
+
+    def __init__(self, table, state: dict = None) -> None:
+        self.table = table
+        if state is None:
+            state = self.build(table)
+        self.chars = state["chars"]
+        self.text = state["text"]
+        self.sa = state["sa"]
+        self.line_starts = table.starts[:-1] + np.arange(len(table), dtype=np.int64)
+
+    @staticmethod
+    def build(table) -> dict:
+        codepoints = table.codepoints
+        present = np.zeros(0x110000, dtype=bool)
+        present[codepoints] = True
+        chars = np.flatnonzero(present).astype(np.uint32)
+        dtype = ">u2" if len(chars) < 0xFFFF else ">u4"
+        dense = np.zeros(0x110000, dtype=np.uint32)
+        dense[chars] = np.arange(1, len(chars) + 1, dtype=np.uint32)
+        text = np.full(len(codepoints) + len(table), SEPARATOR, dtype=dtype)
+        text[np.arange(len(codepoints)) + np.repeat(np.arange(len(table)), table.lengths())] = dense[codepoints]
+        return {"chars": chars, "text": text, "sa": suffix_array(text.astype(np.uint32))}
+
+    def state(self) -> dict:
+        return {"chars": self.chars, "text": self.text, "sa": self.sa}
+
+    def nbytes(self) -> int:
+        return self.text.nbytes + self.sa.nbytes + self.chars.nbytes
+
+    def encode(self, pattern: str):
+        """ 模式串的字编号字节串；含语料中没有的字时返回 None """
+        codes = np.fromiter(map(ord, pattern), dtype=np.uint32, count=len(pattern))
+        pos = np.searchsorted(self.chars, codes)
+        if not len(pos) or (pos >= len(self.chars)).any() or (self.chars[np.minimum(pos, len(self.chars) - 1)] != codes).any():
+            return None
+        return (pos + 1).astype(self.text.dtype).tobytes()
+
+    def _bound(self, key: bytes, upper: bool) -> int:
+        """ 第一个前缀大于（upper）或不小于 key 的后缀在后缀数组中的下标 """
+        text, sa = self.text, self.sa
+        m = len(key) // text.itemsize
+        lo, hi = 0, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = int(sa[mid])
+            prefix = text[start:start + m].tobytes()
+            if prefix < key or (upper and prefix == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, pattern: str) -> tuple:
+        """ 以 pattern 开头的后缀在后缀数组中的区间 [lo, hi) """
+        key = self.encode(pattern)
+        if key is None:
+            return 0, 0
+        lo = self._bound(key, False)
+        return lo, self._bound(key, True)
+
+    def count(self, pattern: str) -> int:
+        lo, hi = self.range(pattern)
+        return hi - lo
+
+    def positions(self, pattern: str, limit: int = None) -> tuple:
+        """ 出现位置对应的 (行号数组, 行内偏移数组)，按语料顺序排列 """
+        lo, hi = self.range(pattern)
+        found = np.sort(self.sa[lo:hi])
+        if limit is not None:
+            found = found[:limit]
+        lines = np.searchsorted(self.line_starts, found, side="right") - 1
+        return lines, found - self.line_starts[lines]
+
+    def locate(self, pattern: str, limit: int = None) -> list:
+        """ [Occurrence(dataset, pid, line_no, offset)]，pid 为记录在其数据集中的编号 """
+        lines, offsets = self.positions(pattern, limit)
+        records = self.table.index.records
+        result = []
+        for line, offset in zip(lines.tolist(), offsets.tolist()):
+            poem = records[self.table.gids[line]]
+            result.append(Occurrence(poem.dataset, poem.pid, int(self.table.line_nos[line]), offset))
+        return result
+
+    def count_by_dataset(self, pattern: str) -> dict:
+        """ 各数据集中的出现次数，只含出现过的数据集 """
+        lines, _ = self.positions(pattern)
+        index = self.table.index
+        gids = self.table.gids[lines]
+        counts = {}
+        for target in index.targets:
+            span = index.dataset_range(target)
+            n = int(np.count_nonzero((gids >= span.start) & (gids < span.stop)))
+            if n:
+                counts[target] = n
+        return counts
+
+
+def get_suffix_index(loader, use_cache: bool = True) -> SuffixIndex:
+    table = get_line_table(loader, use_cache)
+    return derived(loader, "suffix", f"{CORPUS_VERSION}.{SUFFIX_VERSION}", lambda state: SuffixIndex(table, state), use_cache)
+
+
+if __name__ == "__main__":
+    import time
+
+    from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+    from loader.snapshot import load_snapshot
+
+    parser = argparse.ArgumentParser(description="在全部正文中精确定位诗句")
+    parser.add_argument("patterns", nargs="+")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--limit", type=int, default=10, help="每个模式最多列出的位置")
+    args = parser.parse_args()
+
+    loader = PlainDataLoader(args.config)
+    load_snapshot(loader, lazy=True)
+    start = time.perf_counter()
+    index = get_suffix_index(loader)
+    print(f"index ready in {time.perf_counter() - start:.2f}s, {index.nbytes() / 2 ** 20:.0f} MB")
+    for pattern in args.patterns:
+        start = time.perf_counter()
+        total = index.count(pattern)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{pattern}: {total} occurrence(s) in {elapsed:.2f} ms {index.count_by_dataset(pattern)}")
+        for occ in index.locate(pattern, args.limit):
+            line = loader.get_records(occ.dataset)[occ.pid].lines[occ.line_no]
+            print(f"  {occ.dataset}/{occ.pid} line {occ.line_no + 1}+{occ.offset}: {line}")
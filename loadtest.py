@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+import aiohttp
+
+# 默认的请求组合：(权重, 路径)，{pid} 在运行时替换为随机编号
+DEFAULT_MIX = [
+    (4, "/api/poems/tangsong/{pid}"),
+    (2, "/api/gallery/songci?page={page}"),
+    (2, "/api/random?dataset=tangsong"),
+    (1, "/api/search?q=明月&dataset=5"),
+    (1, "/api/search?q=李白&limit=200"),
+    (1, "/api/datasets"),
+]
+
+
+def _percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class LoadTest():
+    """ 以固定并发在 keep-alive 连接上反复请求，统计吞吐、延迟与状态码 """
+
+    def __init__(self, base_url: str, mix: list, concurrency: int, use_etag: bool, seed: int = 0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.mix = mix
+        self.concurrency = concurrency
+        self.use_etag = use_etag
+        self.rng = random.Random(seed)
+        self.etags = {}
+        self.latencies = []
+        self.statuses = {}
+        self.bytes = 0
+
+    def next_path(self) -> str:
+        weights = [w for w, _ in self.mix]
+        path = self.rng.choices([p for _, p in self.mix], weights)[0]
+        return path.format(pid=self.rng.randrange(1000), page=self.rng.randrange(1, 50))
+
+    async def request(self, session, path: str) -> None:
+        headers = {}
+        if self.use_etag and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+        start = time.perf_counter()
+        async with session.get(self.base_url + path, headers=headers) as response:
+            body = await response.read()
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+        self.bytes += len(body)
+        if "ETag" in response.headers:
+            self.etags[path] = response.headers["ETag"]
+
+    async def worker(self, session, deadline: float, remaining: list) -> None:
+        while time.perf_counter() < deadline and remaining[0] > 0:
+            remaining[0] -= 1
+            try:
+                await self.request(session, self.next_path())
+            except aiohttp.ClientError:
+                self.statuses["error"] = self.statuses.get("error", 0) + 1
+
+    async def run(self, duration: float, requests: int) -> dict:
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(connector=connector, auto_decompress=True,
+                                         headers={"Accept-Encoding": "gzip"}) as session:
+            start = time.perf_counter()
+            remaining = [requests or sys.maxsize]
+            await asyncio.gather(*(self.worker(session, start + duration, remaining)
+                                   for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - start
+        total = len(self.latencies)
+        return {
+            "requests": total,
+            "seconds": round(elapsed, 3),
+            "rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "bytes": self.bytes,
+            "status": {str(k): v for k, v in sorted(self.statuses.items(), key=str)},
+            "latency_ms": {
+                "mean": round(statistics.fmean(self.latencies), 3) if total else 0.0,
+                "p50": round(_percentile(self.latencies, 0.5), 3),
+                "p90": round(_percentile(self.latencies, 0.9), 3),
+                "p99": round(_percentile(self.latencies, 0.99), 3),
+                "max": round(max(self.latencies), 3) if total else 0.0,
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="server.py 的压测客户端")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="最长运行秒数")
+    parser.add_argument("--requests", type=int, default=0, help="总请求数，0 表示只按时长")
+    parser.add_argument("--path", action="append", default=None, help="只请求这些路径（可多次指定）")
+    parser.add_argument("--etag", action="store_true", help="带上此前收到的 ETag，测 304 命中")
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    mix = [(1, p) for p in args.path] if args.path else DEFAULT_MIX
+    report = asyncio.run(LoadTest(args.url, mix, args.concurrency, args.etag).run(args.duration, args.requests))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
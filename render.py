@@ -0,0 +1,280 @@
+import json
+
+from loader.poem import Poem
+
+
+def render_poem(poem, converters, simple=False) -> dict:
+    """生成诗词卡片的 HTML（含简繁切换与朗读），不依赖 Streamlit
+
+    poem 为 Poem 记录，也接受原始 dict（如笔记中的记录）；converters 为 (s2t, t2s) 两个带 convert 方法的转换器。
+    返回 html、建议的 iframe 高度 height，以及简体的 title/author/full_text。
+    """
+    if not isinstance(poem, Poem):
+        poem = Poem.from_dict(poem)
+    raw_title = poem.display_title
+    raw_author = poem.author or '佚名'
+    # 扁平的正文直接取行列表，嵌套章节或字符串正文取原始结构
+    paragraphs = poem.content
+    
+    # 简繁转换准备
+    s2t, t2s = converters
+    
+    # 辅助函数：递归处理内容转换和 HTML 生成
+    def process_content(content_data, converter, level=0):
+        html_parts = []
+        text_parts = []
+        
+        if not content_data:
+            return "", ""
+            
+        if isinstance(content_data, list):
+            if not content_data:
+                return "", ""
+                
+            first_item = content_data[0]
+            
+            if isinstance(first_item, str):
+                # 字符串列表（最底层内容）
+                for line in content_data:
+                    if isinstance(line, str):
+                        converted_line = converter.convert(line)
+                        html_parts.append(f'<div>{converted_line}</div>')
+                        text_parts.append(converted_line)
+                        
+            elif isinstance(first_item, dict):
+                # 字典列表（嵌套章节/卷）
+                for item in content_data:
+                    if not isinstance(item, dict): continue
+                    
+                    # 尝试获取章节标题
+                    # 优先级：chapter > title > section
+                    chap_title = item.get('chapter') or item.get('title') or item.get('section') or ''
+                    
+                    if chap_title:
+                        conv_title = converter.convert(chap_title)
+                        # 根据层级调整标题样式，避免全是 h3
+                        font_size = max(16, 20 - level * 2)
+                        margin_top = 15 if level == 0 else 10
+                        html_parts.append(f'<h3 style="margin: {margin_top}px 0 10px 0; font-size: {font_size}px;">{conv_title}</h3>')
+                        text_parts.append(conv_title)
+                    
+                    # 递归获取下级内容
+                    sub_content = item.get('paragraphs') or item.get('content') or item.get('para') or []
+                    
+                    sub_html, sub_text = process_content(sub_content, converter, level + 1)
+                    html_parts.append(sub_html)
+                    if sub_text:
+                        text_parts.append(sub_text)
+                        
+        elif isinstance(content_data, str):
+            # 纯字符串
+            converted = converter.convert(content_data)
+            html_parts.append(f'<div>{converted}</div>')
+            text_parts.append(converted)
+            
+        return "".join(html_parts), "。".join(text_parts)
+
+    # 生成简体版
+    sim_title = t2s.convert(raw_title)
+    sim_author = t2s.convert(raw_author)
+    sim_content_html, sim_full_text = process_content(paragraphs, t2s)
+    
+    # 生成繁体版
+    trad_title = s2t.convert(sim_title)
+    trad_author = s2t.convert(sim_author)
+    trad_content_html, trad_full_text = process_content(paragraphs, s2t)
+    
+    # 构造数据对象
+    data_sim = json.dumps({
+        "title": sim_title,
+        "author": sim_author,
+        "content_html": sim_content_html,
+        "full_text": f"{sim_title}。{sim_author}。{sim_full_text}"
+    })
+    
+    data_trad = json.dumps({
+        "title": trad_title,
+        "author": trad_author,
+        "content_html": trad_content_html,
+        "full_text": f"{trad_title}。{trad_author}。{trad_full_text}"
+    })
+    
+    # 计算 iframe 高度 (粗略估计)
+    # 简单的行数估计不再准确，这里给一个更大的默认值或基于字符数估计
+    content_len = len(sim_full_text)
+    # 增加基础高度，并稍微放宽每行的估算
+    estimated_height = 200 + (content_len / 20) * 35 
+    if estimated_height < 300: estimated_height = 300
+    
+    total_height = int(estimated_height)
+    # 设置最大高度，超过则滚动
+    if total_height > 600:
+        total_height = 600
+    
+    # 始终启用滚动，防止估算错误导致内容被截断
+    scrolling = True
+
+    # HTML 模板
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+    <style>
+        body {{
+            font-family: "KaiTi", "SimKai", "Microsoft YaHei", serif;
+            text-align: center;
+            background-color: {'#ffffff' if simple else '#f9f9f9'};
+            padding: 10px;
+            margin: 0;
+            overflow-y: auto;  /* 始终允许滚动 */
+        }}
+        /* 隐藏滚动条但保留功能 (可选，这里为了用户体验保留默认滚动条) */
+        ::-webkit-scrollbar {{
+            width: 8px;
+        }}
+        ::-webkit-scrollbar-track {{
+            background: #f1f1f1; 
+        }}
+        ::-webkit-scrollbar-thumb {{
+            background: #888; 
+            border-radius: 4px;
+        }}
+        ::-webkit-scrollbar-thumb:hover {{
+            background: #555; 
+        }}
+        .poem-card {{
+            background-color: #fff;
+            padding: 20px;
+            border-radius: 10px;
+            box-shadow: {'none' if simple else '0 2px 4px rgba(0,0,0,0.05)'};
+        }}
+        .header {{
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            margin-bottom: 10px;
+        }}
+        .title {{
+            font-size: 24px;
+            font-weight: bold;
+            color: #2c3e50;
+            margin-right: 10px;
+        }}
+        .controls {{
+            display: flex;
+            align-items: center;
+        }}
+        .btn {{
+            cursor: pointer;
+            background: none;
+            border: none;
+            font-size: 24px;
+            margin: 0 5px;
+            transition: transform 0.2s;
+            padding: 0;
+            line-height: 1;
+        }}
+        .play-btn {{ color: #3498db; }}
+        .play-btn:hover {{ color: #2980b9; transform: scale(1.1); }}
+        .stop-btn {{ color: #e74c3c; }}
+        .stop-btn:hover {{ color: #c0392b; transform: scale(1.1); }}
+        .font-btn {{ 
+            color: #8e44ad; 
+            font-size: 16px; 
+            border: 1px solid #8e44ad; 
+            border-radius: 4px; 
+            padding: 2px 6px;
+            font-weight: bold;
+        }}
+        .font-btn:hover {{ background-color: #8e44ad; color: white; }}
+        
+        .author {{
+            font-size: 16px;
+            color: #7f8c8d;
+            margin-bottom: 20px;
+            font-style: italic;
+        }}
+        .content {{
+            font-size: 18px;
+            line-height: 2;
+            color: #34495e;
+        }}
+    </style>
+    </head>
+    <body>
+        <div class="poem-card">
+            <div class="header">
+                <span class="title" id="title">{sim_title}</span>
+                <div class="controls">
+                    <button class="btn play-btn" onclick="playSpeech()" title="朗读">🔊</button>
+                    <button class="btn stop-btn" onclick="stopSpeech()" title="停止">⏹</button>
+                    <button class="btn font-btn" onclick="toggleFont()" title="简/繁切换">繁</button>
+                </div>
+            </div>
+            <div class="author" id="author">{sim_author}</div>
+            <div class="content" id="content">
+                {sim_content_html}
+            </div>
+        </div>
+
+        <script>
+            var dataSim = {data_sim};
+            var dataTrad = {data_trad};
+            var isTraditional = false;
+            var synth = window.speechSynthesis;
+            var currentUtterance = null;
+
+            function toggleFont() {{
+                isTraditional = !isTraditional;
+                var data = isTraditional ? dataTrad : dataSim;
+                document.getElementById('title').innerText = data.title;
+                document.getElementById('author').innerText = data.author;
+                document.getElementById('content').innerHTML = data.content_html;
+                document.querySelector('.font-btn').innerText = isTraditional ? '简' : '繁';
+            }}
+
+            function playSpeech() {{
+                stopSpeech();
+                var data = isTraditional ? dataTrad : dataSim;
+                var text = data.full_text;
+                
+                var utterance = new SpeechSynthesisUtterance(text);
+                utterance.lang = "zh-CN";
+                utterance.rate = 0.9;
+                
+                // 尝试选择中文语音
+                var voices = synth.getVoices();
+                var zhVoice = voices.find(v => v.lang.includes('zh') || v.lang.includes('CN'));
+                if (zhVoice) {{
+                    utterance.voice = zhVoice;
+                }}
+                
+                currentUtterance = utterance;
+                synth.speak(utterance);
+            }}
+            
+            function stopSpeech() {{
+                if (synth.speaking) {{
+                    synth.cancel();
+                }}
+            }}
+            
+            // 加载语音列表
+            if (speechSynthesis.onvoiceschanged !== undefined) {{
+                speechSynthesis.onvoiceschanged = function() {{
+                    window.speechSynthesis.getVoices(); 
+                }};
+            }}
+        </script>
+    </body>
+    </html>
+    """
+
+    return {
+        "html": html_content,
+        "height": total_height,
+        "scrolling": scrolling,
+        "title": sim_title,
+        "author": sim_author,
+        "full_text": sim_full_text,
+    }
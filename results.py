@@ -0,0 +1,161 @@
+import bisect
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+
+from loader.manifest import digest, source_manifest
+
+# 共享结果缓存的默认上限：条目数、编号所占字节数、存活秒数；源文件清单至多每 MANIFEST_CHECK 秒检查一次
+CACHE_ENTRIES = 512
+CACHE_BYTES = 64 << 20
+CACHE_TTL = 600
+MANIFEST_CHECK = 30
+# 每个条目（句柄、分段）的固定开销估计
+ENTRY_OVERHEAD = 200
+SEGMENT_OVERHEAD = 64
+
+
+def fingerprint(*parts) -> str:
+    """查询条件的指纹，parts 为可 JSON 序列化的各项参数（顺序相关）"""
+    return digest(list(parts))
+
+
+class ResultSet():
+    """检索或浏览结果的句柄：查询指纹与按顺序排列的诗词编号，不持有诗词本身
+
+    编号分段存放，每段为 (数据集, pid 序列)，pid 序列是 range（整个数据集）或 array("I")，每首只占 4 字节；
+    翻页时才从加载器共享的记录表中取出当页的诗词，会话里保存的只有句柄。
+    """
+
+    __slots__ = ("fingerprint", "segments", "_ends")
+
+    def __init__(self, fingerprint: str, segments) -> None:
+        self.fingerprint = fingerprint
+        self.segments = tuple(segments)
+        self._ends = []
+        total = 0
+        for _, pids in self.segments:
+            total += len(pids)
+            self._ends.append(total)
+
+    @classmethod
+    def from_poems(cls, fingerprint: str, poems) -> "ResultSet":
+        """由 Poem 序列构造，相邻的同一数据集的诗合为一段"""
+        segments = []
+        for poem in poems:
+            if not segments or segments[-1][0] != poem.dataset:
+                segments.append((poem.dataset, array("I")))
+            segments[-1][1].append(poem.pid)
+        return cls(fingerprint, segments)
+
+    @classmethod
+    def dataset(cls, fingerprint: str, target: str, size: int) -> "ResultSet":
+        """整个数据集按编号顺序排列"""
+        return cls(fingerprint, [(target, range(size))])
+
+    def __len__(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    @property
+    def nbytes(self) -> int:
+        """编号占用的大致字节数，range 段只计固定开销"""
+        size = ENTRY_OVERHEAD
+        for _, pids in self.segments:
+            size += SEGMENT_OVERHEAD + (pids.itemsize * len(pids) if isinstance(pids, array) else 0)
+        return size
+
+    def page(self, loader, start: int, stop: int) -> list:
+        """第 start 到 stop（不含）条结果的 Poem 记录"""
+        stop = min(stop, len(self))
+        poems = []
+        i = bisect.bisect_right(self._ends, start)
+        while start < stop:
+            target, pids = self.segments[i]
+            begin = self._ends[i] - len(pids)
+            end = min(stop, self._ends[i])
+            records = loader.get_records(target)
+            poems += [records[pid] for pid in pids[start - begin:end - begin]]
+            start = end
+            i += 1
+        return poems
+
+
+class ResultCache():
+    """跨会话共享的查询结果缓存：指纹 -> ResultSet，按最近使用淘汰，并受条目数、字节数与存活时间限制
+
+    条目还按加载器源文件清单（见 loader/manifest.py）的摘要区分，清单变化后旧条目即被清除，
+    加载器的记录与派生索引也随之丢弃（见 PlainDataLoader.sync_sources），新结果由新的数据算出；
+    清单的检查有间隔，避免每次查找都遍历数据文件。
+    """
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES, max_bytes: int = CACHE_BYTES, ttl: float = CACHE_TTL,
+                 check_interval: float = MANIFEST_CHECK, clock=time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.clock = clock
+        self.nbytes = 0
+        # (清单摘要, 指纹) -> (写入时间, ResultSet)
+        self._entries = OrderedDict()
+        # 加载器 -> (检查时间, 清单摘要)
+        self._manifests = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _generation(self, loader, now: float) -> str:
+        checked = self._manifests.get(loader)
+        if checked is not None and now - checked[0] < self.check_interval:
+            return checked[1]
+        current = digest(source_manifest(loader))
+        loader.sync_sources(current)
+        if checked is not None and checked[1] != current:
+            for key in [key for key in self._entries if key[0] == checked[1]]:
+                self._drop(key)
+        self._manifests[loader] = (now, current)
+        return current
+
+    def _drop(self, key) -> None:
+        _, results = self._entries.pop(key)
+        self.nbytes -= results.nbytes
+
+    def get(self, loader, fingerprint: str):
+        """未命中或已过期时为 None"""
+        with self._lock:
+            now = self.clock()
+            key = (self._generation(loader, now), fingerprint)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, loader, results: ResultSet) -> None:
+        """写入结果，超过上限时从最久未用的条目开始淘汰；单个超过字节上限的结果不缓存"""
+        if results.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            now = self.clock()
+            key = (self._generation(loader, now), results.fingerprint)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (now, results)
+            self.nbytes += results.nbytes
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+# 进程内共享，界面的各个会话与 HTTP 服务的各个请求共用
+result_cache = ResultCache()
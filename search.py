@@ -0,0 +1,370 @@
+import time
+
+from loader.metrics import record_cache, registry
+from results import ResultSet, fingerprint, result_cache
+
+# 候选数、命中数的分桶
+COUNT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+# 可取消的搜索每核对这么多个候选检查一次是否已取消
+CANCEL_CHECK = 1000
+
+_latency = registry.histogram("search_latency_seconds", "search_poems latency by scope")
+_candidates = registry.histogram("search_candidates", "Poems examined per query", COUNT_BUCKETS)
+_hits = registry.histogram("search_hits", "Poems returned per query", COUNT_BUCKETS)
+
+
+def _facet_gids(loader, dataset_id, filter_author, facets):
+    """按分面位图求出候选 gid（升序），见 loader/facets.py"""
+    from loader.facets import get_facet_index, to_gids
+
+    index = get_facet_index(loader)
+    scope = None if dataset_id == "all" else index.index.dataset_range(loader.id_table[dataset_id])
+    bitmap = index.select(facets, scope)
+    if filter_author:
+        bitmap = bitmap & index.bitmap("author", index.find("author", filter_author))
+    return to_gids(bitmap)
+
+
+def _cached(loader, key, compute):
+    """先查跨会话共享的结果缓存（见 results.py），未命中时 compute() 求出结果并写入"""
+    found = result_cache.get(loader, key)
+    record_cache("search_shared", found is not None)
+    if found is not None:
+        return found.page(loader, 0, len(found))
+    results = compute()
+    result_cache.put(loader, ResultSet.from_poems(key, results))
+    return results
+
+
+def _facet_key(facets):
+    """分面筛选的规范形式，取值顺序不影响结果"""
+    return sorted((facet, value if isinstance(value, str) else sorted(value))
+                  for facet, value in (facets or {}).items() if value)
+
+
+def search_key(dataset_id, query, filter_author=None, filter_title=None, limit=2000, facets=None) -> str:
+    """search_poems 结果的缓存指纹：关键词按折叠后的形式，"靜夜思" 与 "静夜思" 相同"""
+    from loader.folding import fold
+
+    return fingerprint("search", dataset_id, fold(query or ""), filter_author or "", filter_title or "", limit,
+                       _facet_key(facets))
+
+
+def search_poems(loader, dataset_id, query, filter_author=None, filter_title=None, limit=2000, converters=None,
+                 facets=None):
+    """按关键词（简繁体、异体均可）及作者/标题筛选搜索诗词
+
+    关键词经折叠表归并简繁体与异体（见 loader/folding.py），由按折叠后的字建立的倒排表求出候选再逐首核对，
+    不再逐个展开简繁体转换；converters 保留以兼容旧调用。
+    facets 为 {分面: 取值或取值列表}（如 {"form": "七绝", "dynasty": "唐"}），与作者筛选一起由分面位图求出候选。
+    结果按 search_key 缓存在跨会话共享的结果缓存中。
+    """
+    key = search_key(dataset_id, query, filter_author, filter_title, limit, facets)
+    return _cached(loader, key, lambda: _search_poems(loader, dataset_id, query, filter_author, filter_title, limit,
+                                                      facets))
+
+
+def _search_poems(loader, dataset_id, query, filter_author, filter_title, limit, facets):
+    start = time.perf_counter()
+    results = []
+    scanned = 0
+    for _, found, examined in iter_search_poems(loader, dataset_id, query, filter_author, filter_title, limit, facets):
+        results += found
+        scanned += examined
+
+    scope = "all" if dataset_id == "all" else loader.id_table[dataset_id]
+    _latency.observe(time.perf_counter() - start, scope=scope)
+    _candidates.observe(scanned, scope=scope)
+    _hits.observe(len(results), scope=scope)
+    return results
+
+
+def iter_search_poems(loader, dataset_id, query, filter_author=None, filter_title=None, limit=2000, facets=None,
+                      cancel=None):
+    """与 search_poems 相同的搜索，按文集逐个产出 (数据集, [Poem], 核对的候选数)，不经结果缓存
+
+    供边输入边搜索逐步显示结果；cancel 为 threading.Event，置位后至多再核对 CANCEL_CHECK 个候选即停止。
+    """
+    # 依赖 numpy 的索引在此处才导入
+    import numpy as np
+    from loader.corpus import cached_derived, get_corpus_index
+    from loader.query import Term
+
+    if dataset_id != "all" and not any((facets or {}).values()) and cached_derived(loader, "corpus") is None:
+        # 倒排表尚未建立时，限定文集的搜索只载入该文集逐首核对，不为此载入全部文集
+        yield from _scan_dataset(loader, loader.id_table[dataset_id], query, filter_author, filter_title, limit,
+                                 cancel)
+        return
+
+    index = get_corpus_index(loader)
+
+    # 1. 关键词：倒排表给出含全部（折叠后）字的候选；只有大小写字母时无法缩小范围
+    term = None
+    candidates = None
+    if query:
+        term = Term(query)
+        term.prepare(index)
+        candidates = term.candidates(index)
+
+    # 2. 作者与分面：位图给出候选，与关键词的候选求交
+    if filter_author or any((facets or {}).values()):
+        selected = _facet_gids(loader, dataset_id, filter_author, facets)
+        candidates = selected if candidates is None else np.intersect1d(candidates, selected, assume_unique=True)
+
+    targets = index.targets if dataset_id == "all" else [loader.id_table[dataset_id]]
+    remaining = limit
+    for target in targets:
+        if remaining <= 0 or (cancel is not None and cancel.is_set()):
+            return
+        scope = index.dataset_range(target)
+        if candidates is None:
+            gids = scope
+        else:
+            lo, hi = np.searchsorted(candidates, [scope.start, scope.stop])
+            gids = candidates[lo:hi].tolist()
+
+        found = []
+        scanned = 0
+        for gid in gids:
+            if len(found) >= remaining:
+                break
+            if scanned % CANCEL_CHECK == 0 and cancel is not None and cancel.is_set():
+                return
+            poem = index.records[gid]
+            scanned += 1
+            # 3. 逐首核对标题筛选与关键词
+            if filter_title and filter_title not in poem.title:
+                continue
+            if term is not None and not term.matches(poem):
+                continue
+            found.append(poem)
+        remaining -= len(found)
+        yield target, found, scanned
+
+
+class _ScanIndex():
+    """逐首核对时 Term.prepare 所需的最小接口：只有折叠表，没有倒排表"""
+
+    def __init__(self, size: int) -> None:
+        from loader.folding import get_fold_table
+
+        self.fold = get_fold_table()
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def posting_size(self, char: str) -> int:
+        return self.size
+
+
+def _scan_dataset(loader, target, query, filter_author, filter_title, limit, cancel):
+    """不经倒排表，逐首核对单个文集；结果与按倒排表的搜索相同"""
+    from loader.query import Term
+
+    records = loader.get_records(target)
+    term = None
+    if query:
+        term = Term(query)
+        term.prepare(_ScanIndex(len(records)))
+    found = []
+    scanned = 0
+    for poem in records:
+        if len(found) >= limit:
+            break
+        if scanned % CANCEL_CHECK == 0 and cancel is not None and cancel.is_set():
+            return
+        scanned += 1
+        if filter_author and filter_author not in (poem.author or ""):
+            continue
+        if filter_title and filter_title not in poem.title:
+            continue
+        if term is not None and not term.matches(poem):
+            continue
+        found.append(poem)
+    yield target, found, scanned
+
+
+def query_poems(loader, dataset_id, query, limit=2000, converters=None):
+    """按查询语法搜索（见 loader/query.py），语法错误时抛出 QuerySyntaxError
+
+    支持 AND / OR / NOT（或前缀 -）、括号、"短语"、author: / title: / rhythmic: / dataset: 字段、rhyme: 韵部、form: 体裁、
+    dynasty: 朝代、popularity: 知名度，以及 line:N:词、^词（某行以之开头）、词$（某行以之结尾）等行位置条件。
+    结果按去掉首尾空白的查询缓存；语法错误不缓存。
+    """
+    key = fingerprint("query", dataset_id, query.strip(), limit)
+    return _cached(loader, key, lambda: _query_poems(loader, dataset_id, query, limit, converters))
+
+
+def _query_poems(loader, dataset_id, query, limit, converters):
+    # 依赖 numpy 的倒排索引只在使用查询语法时导入
+    from loader.corpus import get_corpus_index
+    from loader.query import compile_query
+
+    start = time.perf_counter()
+    scope = None if dataset_id == "all" else loader.id_table[dataset_id]
+    plan = compile_query(query, get_corpus_index(loader), converters, scope)
+    results = []
+    for poem in plan:
+        results.append(poem)
+        if len(results) >= limit:
+            break
+
+    scope = scope or "all"
+    _latency.observe(time.perf_counter() - start, scope=scope, mode="query")
+    _candidates.observe(plan.scanned, scope=scope, mode="query")
+    _hits.observe(len(results), scope=scope, mode="query")
+    return results
+
+
+def fuzzy_poems(loader, dataset_id, query, limit=50, converters=None, max_edits=None):
+    """近似搜索记不准的诗句，返回按编辑距离排序的 [Hit(poem, line_no, line, distance)]（见 loader/fuzzy.py）"""
+    from loader.fuzzy import fuzzy_lines
+
+    start = time.perf_counter()
+    scope = None if dataset_id == "all" else loader.id_table[dataset_id]
+    hits = fuzzy_lines(loader, query, max_edits, limit, scope, converters)
+
+    scope = scope or "all"
+    _latency.observe(time.perf_counter() - start, scope=scope, mode="fuzzy")
+    _hits.observe(len(hits), scope=scope, mode="fuzzy")
+    return hits
+
+
+def locate_quote(loader, query, limit=50, converters=None):
+    """精确定位诗句在全部正文中的出处（见 loader/suffix.py），简繁体变体合并计数
+
+    返回 (各数据集出现次数, [Occurrence(dataset, pid, line_no, offset)])，位置最多 limit 个。
+    """
+    from loader.suffix import get_suffix_index
+
+    start = time.perf_counter()
+    index = get_suffix_index(loader)
+    variants = {query}
+    if converters:
+        variants |= {c.convert(query) for c in converters}
+    counts, found = {}, []
+    for variant in sorted(v for v in variants if v):
+        for target, n in index.count_by_dataset(variant).items():
+            counts[target] = counts.get(target, 0) + n
+        found += index.locate(variant, limit)
+    found.sort(key=lambda occ: (loader.datasets[occ.dataset]["id"], occ.pid, occ.line_no, occ.offset))
+
+    _latency.observe(time.perf_counter() - start, scope="all", mode="locate")
+    _hits.observe(sum(counts.values()), scope="all", mode="locate")
+    return counts, found[:limit]
+
+
+def positional_lines(loader, dataset_id, pattern=None, contains="", length=None, limit=200):
+    """按字位与同句共现查句（见 loader/positional.py），如飞花令
+
+    pattern 如 "??月????"（? 为任意字），contains 为句中须同时出现的字，length 为句长。
+    返回 (命中句数, [Clause(poem, line_no, text)])，句子最多 limit 个。
+    """
+    from loader.positional import get_clause_table
+
+    start = time.perf_counter()
+    scope = None if dataset_id == "all" else loader.id_table[dataset_id]
+    table = get_clause_table(loader)
+    found = table.select(pattern, contains, length, scope=table.table.index.dataset_range(scope) if scope else None)
+    results = table.clauses(found[:limit])
+
+    scope = scope or "all"
+    _latency.observe(time.perf_counter() - start, scope=scope, mode="positional")
+    _hits.observe(len(found), scope=scope, mode="positional")
+    return len(found), results
+
+
+def similar_poems(loader, poems, k=10):
+    """为每首诗找出 k 首相似作品（见 loader/similar.py），返回 [[(Poem, 相似度)]]，与 poems 一一对应"""
+    from loader.similar import get_similar_index
+
+    start = time.perf_counter()
+    index = get_similar_index(loader)
+    found = index.similar([(poem.dataset, poem.pid) for poem in poems], k)
+    results = [[(loader.get_records(target)[pid], score) for target, pid, score in row] for row in found]
+
+    _latency.observe(time.perf_counter() - start, scope="all", mode="similar")
+    return results
+
+
+def similar_ready(loader):
+    """相似作品索引是否已可用：本进程已打开，或磁盘上的索引与当前源文件一致；不触发构建"""
+    from loader.corpus import cached_derived
+    from loader.similar import DEFAULT_DIMS, index_ready
+
+    return cached_derived(loader, f"similar-{DEFAULT_DIMS}") is not None or index_ready(loader)
+
+
+def warm_similar(loader):
+    """预先打开（必要时构建）相似作品索引"""
+    from loader.similar import get_similar_index
+
+    get_similar_index(loader)
+
+
+def warm_indexes(loader):
+    """预先打开（必要时构建）HTTP 服务各接口用到的全部索引"""
+    from loader.corpus import get_corpus_index
+    from loader.fuzzy import get_bigram_index
+    from loader.positional import get_clause_table
+    from loader.rhyme import get_rhyme_index
+    from loader.suffix import get_suffix_index
+
+    for get_index in (get_corpus_index, get_bigram_index, get_suffix_index, get_clause_table, get_rhyme_index):
+        get_index(loader)
+    warm_facets(loader, ("dataset", "form", "dynasty", "popularity"))
+    warm_similar(loader)
+
+
+def same_rhyme_poems(loader, poem, limit=20):
+    """与 poem 押同一平水韵部的作品（见 loader/rhyme.py），共有韵脚字多的在前
+
+    返回 (韵部名称, 本诗韵脚字, [(Poem, 共有韵脚字数)])；本诗不押韵时韵部名称为 None。
+    """
+    from loader.rhyme import get_rhyme_index
+
+    start = time.perf_counter()
+    index = get_rhyme_index(loader)
+    corpus = index.table.index
+    gid = corpus.offsets[poem.dataset] + poem.pid
+    group = int(index.poem_groups[gid])
+    found = [(corpus.records[other], shared) for other, shared in index.same_rhyme(gid, limit)]
+
+    _latency.observe(time.perf_counter() - start, scope="all", mode="rhyme")
+    _hits.observe(len(found), scope="all", mode="rhyme")
+    return (index.rhymes.label(group) if group >= 0 else None), index.rhyme_chars(gid), found
+
+
+def facet_counts(loader, dataset_id, facet, facets=None):
+    """在其余分面的筛选下 facet 各取值的首数（见 loader/facets.py），dataset_id 为 "all" 时统计全部文集"""
+    from loader.facets import get_facet_index
+
+    index = get_facet_index(loader)
+    scope = None if dataset_id == "all" else index.index.dataset_range(loader.id_table[dataset_id])
+    return index.counts(facet, facets, scope)
+
+
+def facets_ready(loader, facets):
+    """这些分面的列是否已载入，不触发构建；界面据此决定是否立即显示计数"""
+    from loader.corpus import cached_derived
+
+    index = cached_derived(loader, "facets")
+    return index is not None and index.ready(facets)
+
+
+def warm_facets(loader, facets):
+    """预先载入（必要时构建）这些分面的列"""
+    from loader.facets import get_facet_index
+
+    index = get_facet_index(loader)
+    for facet in facets:
+        index.column(facet)
+
+
+def poems_by_facets(loader, dataset_id, facets):
+    """满足分面筛选的全部作品，按文集与编号排列；体裁可以是 "律诗" 等合称"""
+    from loader.corpus import get_corpus_index
+
+    records = get_corpus_index(loader).records
+    return [records[gid] for gid in _facet_gids(loader, dataset_id, None, facets).tolist()]
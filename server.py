@@ -0,0 +1,500 @@
+import argparse
+import asyncio
+import gc
+import hashlib
+import json
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+from aiohttp import web
+
+# 将当前目录添加到路径中
+sys.path.append(os.getcwd())
+
+import database
+from loader.data_loader import DATAS_CONFIG, PlainDataLoader
+from loader.metrics import registry
+from loader.snapshot import warm
+from search import (facet_counts, fuzzy_poems, locate_quote, poems_by_facets, positional_lines, query_poems,
+                    same_rhyme_poems, search_poems, similar_poems, warm_indexes)
+
+# 小于该字节数的响应不压缩
+COMPRESS_MIN_BYTES = 1024
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+_requests = registry.histogram("http_request_seconds", "HTTP handler latency by route")
+_not_modified = registry.counter("http_not_modified_total", "Responses answered with 304 via ETag")
+
+
+def get_converters():
+    """有 opencc 时按简繁体同时搜索，与界面一致"""
+    try:
+        import opencc
+    except ImportError:
+        return None
+    return opencc.OpenCC('s2t'), opencc.OpenCC('t2s')
+
+
+class ServiceState():
+    """ 启动时一次性加载的只读状态，fork 出的各 worker 共享（写时复制）
+
+    preload 时除记录外还打开（必要时构建）各接口用到的索引，worker 不必各自构建或反序列化。
+    """
+
+    def __init__(self, config_path: str = DATAS_CONFIG, preload: bool = True, snapshot: bool = False) -> None:
+        self.loader = PlainDataLoader(config_path)
+        self.converters = get_converters()
+        self.started = time.time()
+        self.warmed = None
+        if snapshot:
+            # 从快照恢复，快照缺失或过期时完整构建并重写，见 loader/snapshot.py
+            self.warmed = warm(self.loader)
+        elif preload:
+            for target in self.loader.datasets:
+                self.loader.get_records(target)
+        if preload:
+            warm_indexes(self.loader)
+
+    def target(self, dataset: str) -> str:
+        """ 数据集参数可以是 datas.json 中的名称或数字 id """
+        if dataset in self.loader.datasets:
+            return dataset
+        try:
+            return self.loader.id_table[int(dataset)]
+        except (ValueError, KeyError):
+            raise web.HTTPNotFound(text=f"unknown dataset {dataset}")
+
+
+STATE = web.AppKey("state", ServiceState)
+
+
+def poem_json(poem) -> dict:
+    data = poem.to_dict()
+    data["dataset"] = poem.dataset
+    data["id"] = poem.pid
+    return data
+
+
+def json_response(data, status: int = 200, cache: str = "no-cache") -> web.Response:
+    body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+    response = web.Response(body=body, status=status, content_type="application/json", charset="utf-8")
+    response.headers["Cache-Control"] = cache
+    return response
+
+
+def _int_arg(request, name: str, default: int, low: int = 0, high: int = None) -> int:
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be an integer")
+    if value < low or (high is not None and value > high):
+        raise web.HTTPBadRequest(text=f"{name} out of range")
+    return value
+
+
+def _page(items, request) -> dict:
+    page = _int_arg(request, "page", 1, low=1)
+    size = _int_arg(request, "size", DEFAULT_PAGE_SIZE, low=1, high=MAX_PAGE_SIZE)
+    start = (page - 1) * size
+    return {
+        "total": len(items),
+        "page": page,
+        "size": size,
+        "results": [poem_json(p) for p in items[start:start + size]],
+    }
+
+
+@web.middleware
+async def http_cache(request, handler):
+    """ 记录耗时；为 GET 响应加 ETag 并处理 If-None-Match，按 Accept-Encoding 压缩较大的响应 """
+    route = request.match_info.route.resource.canonical if request.match_info.route.resource else "unknown"
+    start = time.perf_counter()
+    try:
+        response = await handler(request)
+    finally:
+        _requests.observe(time.perf_counter() - start, route=route, method=request.method)
+    if not isinstance(response, web.Response) or response.body is None:
+        return response
+    if request.method == "GET" and response.status == 200 and response.headers.get("Cache-Control") != "no-store":
+        etag = '"' + hashlib.blake2b(response.body, digest_size=16).hexdigest() + '"'
+        response.headers["ETag"] = etag
+        if etag in request.headers.get("If-None-Match", ""):
+            _not_modified.inc(route=route)
+            return web.Response(status=304, headers={"ETag": etag, "Cache-Control": response.headers["Cache-Control"]})
+    if len(response.body) >= COMPRESS_MIN_BYTES:
+        response.headers["Vary"] = "Accept-Encoding"
+        response.enable_compression()
+    return response
+
+
+def _poem_or_404(records: list, pid: str):
+    """ 编号须在 0 <= pid < len(records) 内；负数不从末尾倒数 """
+    try:
+        index = int(pid)
+    except ValueError:
+        raise web.HTTPNotFound(text="no such poem")
+    if not 0 <= index < len(records):
+        raise web.HTTPNotFound(text="no such poem")
+    return records[index]
+
+
+async def handle_datasets(request):
+    state = request.app[STATE]
+    loader = state.loader
+    return json_response([
+        {"key": key, "id": cfg["id"], "name": cfg.get("name", key), "count": len(loader.get_records(key))}
+        for key, cfg in loader.datasets.items()
+    ])
+
+
+async def handle_poem(request):
+    state = request.app[STATE]
+    poem = _poem_or_404(state.loader.get_records(state.target(request.match_info["dataset"])),
+                        request.match_info["pid"])
+    # 记录的编号在数据文件不变时是稳定的
+    return json_response(poem_json(poem), cache="public, max-age=3600")
+
+
+async def handle_similar(request):
+    """ 与指定诗词用字相近的作品，首次调用时构建或增量更新相似度索引 """
+    state = request.app[STATE]
+    poem = _poem_or_404(state.loader.get_records(state.target(request.match_info["dataset"])),
+                        request.match_info["pid"])
+    k = _int_arg(request, "k", 10, low=1, high=100)
+    found = await asyncio.get_running_loop().run_in_executor(None, similar_poems, state.loader, [poem], k)
+    return json_response([dict(poem_json(other), score=score) for other, score in found[0]])
+
+
+async def handle_rhyme(request):
+    """ 指定诗词押的平水韵部、韵脚字，以及同押一部的作品（共有韵脚字多的在前） """
+    state = request.app[STATE]
+    poem = _poem_or_404(state.loader.get_records(state.target(request.match_info["dataset"])),
+                        request.match_info["pid"])
+    limit = _int_arg(request, "limit", 20, low=1, high=MAX_PAGE_SIZE)
+    group, chars, found = await asyncio.get_running_loop().run_in_executor(
+        None, same_rhyme_poems, state.loader, poem, limit)
+    return json_response({
+        "rhyme": group,
+        "chars": chars,
+        "results": [dict(poem_json(other), shared=shared) for other, shared in found],
+    })
+
+
+# 可作为查询参数的分面（见 loader/facets.py）
+FACET_ARGS = ("form", "dynasty", "popularity")
+
+
+def _facet_args(request) -> dict:
+    """ form（体裁，如 七绝、律诗）、dynasty（朝代）与 popularity（知名度）参数，只含给出的 """
+    from loader.facets import DYNASTIES, POPULARITY
+    from loader.forms import find_forms
+
+    known = {"form": find_forms, "dynasty": DYNASTIES.__contains__, "popularity": POPULARITY.__contains__}
+    facets = {}
+    for facet in FACET_ARGS:
+        value = request.query.get(facet) or None
+        if value is None:
+            continue
+        if not known[facet](value):
+            raise web.HTTPBadRequest(text=f"unknown {facet} {value}")
+        facets[facet] = value
+    return facets
+
+
+async def _facet_records(state, dataset: str, facets: dict) -> list:
+    dataset_id = "all" if dataset == "all" else state.loader.datasets[state.target(dataset)]["id"]
+    return await asyncio.get_running_loop().run_in_executor(None, poems_by_facets, state.loader, dataset_id, facets)
+
+
+async def handle_random(request):
+    state = request.app[STATE]
+    dataset = request.query.get("dataset", "all")
+    facets = _facet_args(request)
+    if facets:
+        records = await _facet_records(state, dataset, facets)
+    else:
+        target = random.choice(list(state.loader.datasets)) if dataset == "all" else state.target(dataset)
+        records = state.loader.get_records(target)
+    if not records:
+        raise web.HTTPNotFound(text="dataset is empty")
+    return json_response(poem_json(random.choice(records)), cache="no-store")
+
+
+async def handle_gallery(request):
+    state = request.app[STATE]
+    facets = _facet_args(request)
+    if facets:
+        records = await _facet_records(state, request.match_info["dataset"], facets)
+    else:
+        records = state.loader.get_records(state.target(request.match_info["dataset"]))
+    return json_response(_page(records, request))
+
+
+async def handle_forms(request):
+    """ 各体裁的首数，dataset 缺省时统计全部文集；可再按朝代、知名度筛选 """
+    state = request.app[STATE]
+    dataset = request.query.get("dataset", "all")
+    dataset_id = "all" if dataset == "all" else state.loader.datasets[state.target(dataset)]["id"]
+    counts = await asyncio.get_running_loop().run_in_executor(
+        None, facet_counts, state.loader, dataset_id, "form", _facet_args(request))
+    return json_response(counts)
+
+
+async def handle_facets(request):
+    """ 各分面取值的首数 {分面: {取值: 首数}}，每个分面的计数都在其余分面的筛选之下 """
+    state = request.app[STATE]
+    dataset = request.query.get("dataset", "all")
+    dataset_id = "all" if dataset == "all" else state.loader.datasets[state.target(dataset)]["id"]
+    facets = _facet_args(request)
+
+    def count():
+        return {facet: facet_counts(state.loader, dataset_id, facet, facets) for facet in ("dataset", *FACET_ARGS)}
+
+    return json_response(await asyncio.get_running_loop().run_in_executor(None, count))
+
+
+async def handle_search(request):
+    state = request.app[STATE]
+    query = request.query.get("q", "")
+    author = request.query.get("author") or None
+    title = request.query.get("title") or None
+    if not (query or author or title):
+        raise web.HTTPBadRequest(text="one of q, author, title is required")
+    dataset = request.query.get("dataset", "all")
+    dataset_id = "all" if dataset == "all" else state.loader.datasets[state.target(dataset)]["id"]
+    limit = _int_arg(request, "limit", 2000, low=1, high=50000)
+    facets = _facet_args(request)
+    # 线性扫描是 CPU 密集的，放到线程池中，避免阻塞其他连接
+    results = await asyncio.get_running_loop().run_in_executor(
+        None, search_poems, state.loader, dataset_id, query, author, title, limit, state.converters, facets)
+    return json_response(_page(results, request))
+
+
+async def handle_query(request):
+    """ q 使用查询语法（见 loader/query.py），语法错误返回 400 """
+    state = request.app[STATE]
+    query = request.query.get("q", "")
+    if not query.strip():
+        raise web.HTTPBadRequest(text="q is required")
+    dataset = request.query.get("dataset", "all")
+    dataset_id = "all" if dataset == "all" else state.loader.datasets[state.target(dataset)]["id"]
+    limit = _int_arg(request, "limit", 2000, low=1, high=50000)
+    try:
+        results = await asyncio.get_running_loop().run_in_executor(
+            None, query_poems, state.loader, dataset_id, query, limit, state.converters)
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    return json_response(_page(results, request))
+
+
+async def handle_fuzzy(request):
+    """ 近似诗句搜索，max_edits 缺省时按查询长度决定 """
+    state = request.app[STATE]
+    query = request.query.get("q", "")
+    if not query.strip():
+        raise web.HTTPBadRequest(text="q is required")
+    dataset = request.query.get("dataset", "all")
+    dataset_id = "all" if dataset == "all" else state.loader.datasets[state.target(dataset)]["id"]
+    limit = _int_arg(request, "limit", 20, low=1, high=MAX_PAGE_SIZE)
+    max_edits = _int_arg(request, "max_edits", 0, low=0, high=8) if "max_edits" in request.query else None
+    hits = await asyncio.get_running_loop().run_in_executor(
+        None, fuzzy_poems, state.loader, dataset_id, query, limit, state.converters, max_edits)
+    return json_response([
+        dict(poem_json(hit.poem), line_no=hit.line_no, line=hit.line, distance=hit.distance) for hit in hits
+    ])
+
+
+async def handle_locate(request):
+    """ 诗句在正文中的精确出处：各数据集的次数与前 limit 处位置 """
+    state = request.app[STATE]
+    query = request.query.get("q", "")
+    if not query.strip():
+        raise web.HTTPBadRequest(text="q is required")
+    limit = _int_arg(request, "limit", 50, low=1, high=MAX_PAGE_SIZE)
+    counts, found = await asyncio.get_running_loop().run_in_executor(
+        None, locate_quote, state.loader, query, limit, state.converters)
+    return json_response({
+        "total": sum(counts.values()),
+        "datasets": counts,
+        "results": [occ._asdict() for occ in found],
+    })
+
+
+async def handle_lines(request):
+    """ 按字位与同句共现查句：pattern 如 ??月????，contains 为同句须含的字，length 为句长 """
+    state = request.app[STATE]
+    pattern = request.query.get("pattern", "").strip() or None
+    contains = request.query.get("contains", "").strip()
+    if not (pattern or contains):
+        raise web.HTTPBadRequest(text="pattern or contains is required")
+    dataset = request.query.get("dataset", "all")
+    dataset_id = "all" if dataset == "all" else state.loader.datasets[state.target(dataset)]["id"]
+    length = _int_arg(request, "length", 0, low=0, high=64) or None
+    limit = _int_arg(request, "limit", 50, low=1, high=MAX_PAGE_SIZE)
+    try:
+        total, found = await asyncio.get_running_loop().run_in_executor(
+            None, positional_lines, state.loader, dataset_id, pattern, contains, length, limit)
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    return json_response({
+        "total": total,
+        "results": [dict(poem_json(c.poem), line_no=c.line_no, line=c.text) for c in found],
+    })
+
+
+async def _db(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+async def handle_notes(request):
+    rows = await _db(database.get_history, request.query.get("keyword") or None, request.query.get("tag") or None)
+    return json_response([dict(row) for row in rows])
+
+
+async def handle_note_tags(request):
+    return json_response(await _db(database.get_all_existing_tags))
+
+
+async def handle_add_note(request):
+    """ 请求体 {"analysis": ..., "poem": {...}} 或 {"analysis": ..., "dataset": ..., "id": ...} """
+    state = request.app[STATE]
+    try:
+        payload = await request.json()
+        analysis = payload["analysis"]
+        if "poem" in payload:
+            poem = payload["poem"]
+            if not isinstance(poem, dict):
+                raise TypeError("poem must be an object")
+        else:
+            records = state.loader.get_records(state.target(str(payload["dataset"])))
+            index = int(payload["id"])
+            # 负数下标会从末尾取到另一首诗
+            if not 0 <= index < len(records):
+                raise IndexError(index)
+            poem = records[index]
+    except (ValueError, KeyError, IndexError, TypeError):
+        raise web.HTTPBadRequest(text="expected analysis with poem or dataset/id")
+    await _db(database.save_analysis, poem, analysis)
+    return json_response({"ok": True}, status=201, cache="no-store")
+
+
+async def handle_update_note(request):
+    try:
+        record_id = int(request.match_info["note_id"])
+        payload = await request.json()
+        args = (record_id, payload.get("user_comment", ""), payload.get("tags", ""), payload.get("rating"))
+    except (ValueError, AttributeError):
+        raise web.HTTPBadRequest(text="expected user_comment, tags and rating")
+    await _db(database.update_note, *args)
+    return json_response({"ok": True}, cache="no-store")
+
+
+async def handle_delete_note(request):
+    await _db(database.delete_history, int(request.match_info["note_id"]))
+    return json_response({"ok": True}, cache="no-store")
+
+
+async def handle_metrics(request):
+    return web.Response(text=registry.render_prometheus(), content_type="text/plain",
+                        headers={"Cache-Control": "no-store"})
+
+
+async def handle_health(request):
+    state = request.app[STATE]
+    return json_response({"status": "ok", "pid": os.getpid(), "uptime": time.time() - state.started},
+                         cache="no-store")
+
+
+def make_app(state: ServiceState) -> web.Application:
+    app = web.Application(middlewares=[http_cache])
+    app[STATE] = state
+    app.add_routes([
+        web.get("/api/health", handle_health),
+        web.get("/api/datasets", handle_datasets),
+        web.get("/api/search", handle_search),
+        web.get("/api/query", handle_query),
+        web.get("/api/fuzzy", handle_fuzzy),
+        web.get("/api/locate", handle_locate),
+        web.get("/api/lines", handle_lines),
+        web.get("/api/random", handle_random),
+        web.get("/api/poems/{dataset}/{pid}", handle_poem),
+        web.get("/api/poems/{dataset}/{pid}/similar", handle_similar),
+        web.get("/api/poems/{dataset}/{pid}/rhyme", handle_rhyme),
+        web.get("/api/gallery/{dataset}", handle_gallery),
+        web.get("/api/forms", handle_forms),
+        web.get("/api/facets", handle_facets),
+        web.get("/api/notes", handle_notes),
+        web.get("/api/notes/tags", handle_note_tags),
+        web.post("/api/notes", handle_add_note),
+        web.put("/api/notes/{note_id:\\d+}", handle_update_note),
+        web.delete("/api/notes/{note_id:\\d+}", handle_delete_note),
+        web.get("/metrics", handle_metrics),
+    ])
+    return app
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(state: ServiceState, sock: socket.socket, keepalive: float) -> None:
+    web.run_app(make_app(state), sock=sock, keepalive_timeout=keepalive, print=None)
+
+
+def serve(state: ServiceState, host: str, port: int, workers: int, keepalive: float) -> None:
+    """ 在父进程加载数据后 fork 出 workers 个进程共用同一个监听套接字 """
+    sock = _bind(host, port)
+    print(f"serving on http://{host}:{port} with {workers} worker(s)")
+    database.init_db()
+    if workers <= 1:
+        run_worker(state, sock, keepalive)
+        return
+    # 冻结已加载的对象，避免 worker 中的垃圾回收触碰它们而破坏写时复制
+    gc.freeze()
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(state, sock, keepalive)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for child in children:
+        os.waitpid(child, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="诗词语料的 HTTP 查询服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1, help="worker 进程数（fork，仅 Unix）")
+    parser.add_argument("--keepalive", type=float, default=75.0, help="keep-alive 空闲超时（秒）")
+    parser.add_argument("--config", default=DATAS_CONFIG)
+    parser.add_argument("--no-snapshot", action="store_true", help="不读写加载器快照，总是从数据文件构建")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    state = ServiceState(args.config, snapshot=not args.no_snapshot)
+    print(f"loaded {sum(len(state.loader.get_records(t)) for t in state.loader.datasets)} poems "
+          f"({state.warmed or 'built'}) in {time.perf_counter() - start:.1f}s")
+    serve(state, args.host, args.port, args.workers, args.keepalive)
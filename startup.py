@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from loader.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_phases = registry.histogram("startup_phase_seconds", "Duration of startup and warm-up phases",
+                             buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+
+class StartupReport():
+    """ 进程级的启动耗时记录：各阶段相对进程内首次导入本模块的起止时间
+
+    Streamlit 每次交互都会重跑脚本，同名阶段只记录第一次。
+    """
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self._phases = {}  # name -> (开始偏移, 耗时, 线程名)
+        self._lock = threading.Lock()
+
+    def _record(self, name: str, start: float, seconds: float) -> None:
+        with self._lock:
+            if name in self._phases:
+                return
+            self._phases[name] = (start - self.origin, seconds, threading.current_thread().name)
+        _phases.observe(seconds, phase=name)
+
+    def seen(self, name: str) -> bool:
+        return name in self._phases
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter() - start)
+
+    def mark(self, name: str) -> None:
+        """ 记录一个时间点（如首屏完成），耗时为 0 """
+        self._record(name, time.perf_counter(), 0.0)
+
+    def rows(self) -> list:
+        with self._lock:
+            items = sorted(self._phases.items(), key=lambda kv: kv[1][0])
+        return [
+            {"phase": name, "start_ms": round(start * 1000, 1), "ms": round(seconds * 1000, 1), "thread": thread}
+            for name, (start, seconds, thread) in items
+        ]
+
+    def format(self) -> str:
+        return "\n".join(f"{r['start_ms']:>10.1f} {r['ms']:>10.1f}  {r['phase']} [{r['thread']}]"
+                         for r in self.rows())
+
+
+report = StartupReport()
+
+
+class Warmup():
+    """ 在后台线程中依次执行预热任务 [(名称, 函数)]，单个任务出错不影响其余任务 """
+
+    def __init__(self, tasks: list, report: StartupReport = report) -> None:
+        self.tasks = tasks
+        self.report = report
+        self.errors = {}
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+
+    def start(self) -> "Warmup":
+        self.thread.start()
+        return self
+
+    def _run(self) -> None:
+        with self.report.phase("warmup"):
+            for name, func in self.tasks:
+                try:
+                    with self.report.phase(f"warmup:{name}"):
+                        func()
+                except Exception as e:
+                    self.errors[name] = str(e)
+                    logger.warning("warm-up task %s failed: %s", name, e)
+        self.done.set()
+        logger.info("startup timings (offset ms, duration ms):\n%s", self.report.format())
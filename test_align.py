@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import json
+
+from loader.align import AlignIndex, align_directory, dump_ci, merge_records
+
+NEW = [
+    {"author": "苏轼", "rhythmic": "水调歌头", "paragraphs": ["明月几时有？把酒问青天。", "不知天上宫阙，今夕是何年。"]},
+    {"author": "柳永", "rhythmic": "雨霖铃", "paragraphs": ["寒蝉凄切，对长亭晚，骤雨初歇。"]},
+    {"author": "李清照", "rhythmic": "如梦令", "paragraphs": ["昨夜雨疏风骤，浓睡不消残酒。"]},
+    {"author": "李清照", "rhythmic": "如梦令", "paragraphs": ["昨夜雨疏风骤，浓睡不消残酒。"]},
+    {"author": "辛弃疾", "rhythmic": "青玉案", "paragraphs": ["东风夜放花千树，更吹落、星如雨。"]},
+    {"author": "辛弃疾", "rhythmic": "青玉案", "paragraphs": ["东风夜放花千树，更吹落、星如语。"]},
+]
+
+
+def test_inserted_shifted_and_duplicates():
+    # 顺序打乱、缺字、插入一首新数据中没有的词、重复的词
+    old = [
+        {"author": "佚名", "paragraphs": ["寒蝉凄切，对长亭晚，骤雨初歇。"]},
+        {"author": "无名氏", "paragraphs": ["江南可采莲，莲叶何田田。鱼戏莲叶间。"]},
+        {"author": "苏轼", "paragraphs": ["明月几时有？把酒问青天。", "不知天上宫阙，今夕是年。"]},
+        {"author": "李清照", "paragraphs": ["昨夜雨疏风骤，浓睡不消残酒。"]},
+        {"author": "李清照", "paragraphs": ["昨夜雨疏风骤，浓睡不消残酒。"]},
+        {"author": "辛弃疾", "paragraphs": ["东风夜放花千树，更吹落、星如语。"]},
+        {"author": "辛弃疾", "paragraphs": ["东风夜放花千树，更吹落、星如雨。"]},
+    ]
+    index = AlignIndex(NEW)
+    report = merge_records(old, index)
+    assert report["same"] == 5
+    assert [m["index"] for m in report["missing"]] == [1]
+    updated = [u for u in report["updated"] if "ratio" in u and u["ratio"] < 1]
+    assert [u["index"] for u in updated] == [2]
+    assert old[2]["paragraphs"] == NEW[0]["paragraphs"] and old[0]["author"] == "柳永"
+    # 近似重复的两首各自对上，不会争用同一条新数据
+    assert old[5]["paragraphs"] == NEW[5]["paragraphs"] and old[6]["paragraphs"] == NEW[4]["paragraphs"]
+
+
+def test_one_to_one_near_duplicates():
+    old = [{"paragraphs": ["东风夜放花千树，更吹落星如。"]}, {"paragraphs": ["东风夜放花千树，更吹落星如雨。"]}]
+    report = merge_records(old, AlignIndex(NEW[4:5]))
+    # 只有一条新数据，由相似度更高的一条取得，另一条报告为缺失
+    assert report["same"] == 1 and [m["index"] for m in report["missing"]] == [0]
+
+
+def test_common_bigrams_fallback():
+    # 短词的二元组都很常见、全被跳过时，仍能从被跳过的倒排表中召回
+    new = [{"paragraphs": [f"春风明月{chr(0x4E00 + i)}{chr(0x4E80 + i)}"]} for i in range(60)]
+    new.append({"paragraphs": ["春风明月春"]})
+    index = AlignIndex(new)
+    assert index.match({"paragraphs": ["春风明月"]})[0] == 60
+    report = merge_records([{"paragraphs": ["春风明月。"]}], index, threshold=0.8)
+    assert not report["missing"] and report["updated"][0]["new"] == ["春风明月春"]
+
+
+def test_align_directory_transform(tmp_path):
+    new_path = tmp_path / "all.json"
+    new_path.write_text(json.dumps(NEW, ensure_ascii=False), encoding="utf-8")
+    old = [{"author": "苏轼", "paragraphs": ["明月几时有？把酒问青天。", "不知天上宫阙，今夕是年。"]},
+           {"author": "柳永", "paragraphs": ["寒蝉凄切，对长亭晚，骤雨初歇。"]}]
+    (tmp_path / "ci.song.0.json").write_text(dump_ci(old), encoding="utf-8")
+    (tmp_path / "ci.song.1000.json").write_text(dump_ci(old[1:]), encoding="utf-8")
+    reports = align_directory(str(new_path), str(tmp_path), workers=1, transform=_mark)
+    assert set(reports) == {"ci.song.0.json", "ci.song.1000.json"}
+    data = json.loads((tmp_path / "ci.song.0.json").read_text(encoding="utf-8"))
+    assert data[0]["paragraphs"] == NEW[0]["paragraphs"] and data[0]["checked"]
+    # 没有对齐更新的文件也因 transform 改动而写回，且不留临时文件
+    assert json.loads((tmp_path / "ci.song.1000.json").read_text(encoding="utf-8"))[0]["checked"]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def _mark(data: list) -> bool:
+    for record in data:
+        record["checked"] = True
+    return True
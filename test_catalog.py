@@ -0,0 +1,57 @@
+import json
+import os
+
+from loader.catalog import (CATALOG_VERSION, build_catalog, catalog_path, format_size, load_catalog, read_catalog,
+                            write_catalog)
+from loader.data_loader import PlainDataLoader
+
+from conftest import make_corpus
+
+
+def test_catalog(tmp_path):
+    # 要改动数据文件，使用单独的语料副本，不影响共享的 index
+    loader = PlainDataLoader(make_corpus(tmp_path))
+    catalog = build_catalog(loader)
+    assert os.path.dirname(catalog_path(loader)) == os.path.dirname(os.path.abspath(loader._path))
+    tang = catalog["tang"]
+    records = loader.get_records("tang")
+    assert tang["poems"] == len(records) and tang["lines"] == sum(len(p.lines) for p in records)
+    assert tang["chars"] == sum(len(line) for p in records for line in p.lines)
+    assert tang["schema"]["paragraphs"] == "list[str]" and tang["files"] == 1
+    assert load_catalog(loader) == catalog
+
+    # 只有修改时间变化（如重新检出）时重新计算摘要确认，并记下新的修改时间
+    tang_path, song_path = loader.dataset_files("tang")[0], loader.dataset_files("song")[0]
+    os.utime(tang_path, ns=(1, 1))
+    assert set(load_catalog(loader)) == {"tang", "song"}
+    assert read_catalog(loader)["tang"]["sources"][0][2] == 1
+    # 等宽替换字符，大小不变，条目仍须失效
+    with open(song_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(song_path, "w", encoding="utf-8") as f:
+        f.write(text.replace("青天", "靑天"))
+    os.utime(song_path, ns=(2, 2))
+    assert set(load_catalog(loader)) == {"tang"}
+    assert build_catalog(loader)["song"]["content_hash"] != catalog["song"]["content_hash"]
+
+
+def test_catalog_edge_cases(tmp_path):
+    loader = PlainDataLoader(make_corpus(tmp_path))
+    # 目录文件不存在、版本不符或含 datas.json 之外的数据集
+    assert read_catalog(loader) == {} and load_catalog(loader) == {}
+    assert set(build_catalog(loader, ["song"])) == {"song"}
+    entries = dict(read_catalog(loader), removed={"sources": []})
+    write_catalog(loader, entries)
+    assert set(load_catalog(loader)) == {"song"}
+    with open(catalog_path(loader), "w", encoding="utf-8") as f:
+        json.dump({"version": CATALOG_VERSION + 1, "datasets": entries}, f)
+    assert read_catalog(loader) == {}
+    # 新增的文件使条目失效；没有数据文件的数据集计数为 0
+    build_catalog(loader)
+    (tmp_path / "song" / "extra.json").write_text("[]", encoding="utf-8")
+    assert set(load_catalog(loader)) == {"tang"}
+    for path in loader.dataset_files("song"):
+        os.remove(path)
+    song = build_catalog(loader)["song"]
+    assert (song["poems"], song["files"], song["bytes"], song["schema"]) == (0, 0, 0, {})
+    assert [format_size(n) for n in (0, 1536, 3 << 20, 5 << 30)] == ["0 B", "1.5 KB", "3.0 MB", "5.0 GB"]
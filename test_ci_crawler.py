@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+pytest.importorskip("bs4")
+pytest.importorskip("lxml")
+from aiohttp import web  # noqa: E402
+
+from loader.ci_crawler import CiCrawler, parse_index_page, parse_paragraphs  # noqa: E402
+
+# 与 qsc.zww.cn/getdata.asp 返回格式一致的样例
+INDEX_PAGE = (
+    "filllist('·<a href=\"#\" onclick=\"doseek2(10,1);\">导引（第一体）</a>"
+    "<a href=\"#\">和岘</a><br>·<a href=\"#\" onclick=\"doseek2(10,2);\">六州</a>"
+    "<a href=\"#\">和岘</a>');"
+)
+BODY_PAGE = "fillbody('<p align=\"center\">标题</p><p>气和玉烛，睿化著鸿明。<br>缇管一阳生。</p>');"
+
+
+def test_parse_index_page():
+    content = parse_index_page(INDEX_PAGE)
+    assert content == [
+        {"rhythmic": "导引", "param": ["10", "1"], "author": "和岘"},
+        {"rhythmic": "六州", "param": ["10", "2"], "author": "和岘"},
+    ]
+
+
+def test_parse_paragraphs():
+    assert parse_paragraphs(BODY_PAGE) == ["气和玉烛，睿化著鸿明。", "缇管一阳生。"]
+
+
+def test_crawl_retry_and_resume(tmp_path):
+    calls = {"index": 0}
+
+    async def handler(request):
+        form = await request.post()
+        if form["seektype"] == "2":
+            calls["index"] += 1
+            # 第一次请求目录页时模拟服务端错误，触发重试
+            if calls["index"] == 1:
+                return web.Response(status=503)
+            text = INDEX_PAGE
+        else:
+            text = BODY_PAGE
+        return web.Response(body=text.encode("gbk"))
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/getdata.asp", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            crawler = CiCrawler(str(tmp_path / "ckpt"), base_url=f"http://127.0.0.1:{port}/getdata.asp",
+                                backoff=0.01)
+            assert await crawler.crawl([1, 2]) == []
+            # 检查点已存在，再次运行不会重新请求
+            before = calls["index"]
+            assert await crawler.crawl([1, 2]) == []
+            assert calls["index"] == before
+            return crawler
+        finally:
+            await runner.cleanup()
+
+    crawler = asyncio.run(run())
+    data = crawler.merge([1, 2], str(tmp_path / "all.json"))
+    assert len(data) == 4
+    assert data[0]["paragraphs"] == ["气和玉烛，睿化著鸿明。", "缇管一阳生。"]
+    with open(tmp_path / "all.json", encoding="utf-8") as f:
+        assert json.load(f) == data
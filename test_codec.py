@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from loader.codec import MANIFEST_NAME, load_file, select_files, to_compact, to_json
+from loader.data_loader import PlainDataLoader
+
+POEMS = [
+    {"title": "静夜思", "author": "李白", "paragraphs": ["床前明月光，疑是地上霜。", "举头望明月，低头思故乡。"]},
+    {"title": "春晓", "author": "孟浩然", "paragraphs": ["春眠不觉晓，处处闻啼鸟。"], "notes": []},
+]
+# 仓库中出现过的几种原文格式：2 格缩进、4 格缩进带结尾换行、逗号后有空格（宋词）、转义为 \u
+STYLES = {
+    "indent2": json.dumps(POEMS, indent=2, ensure_ascii=False),
+    "indent4": json.dumps(POEMS, indent=4, ensure_ascii=False) + "\n",
+    "ci": json.dumps(POEMS, indent=2, ensure_ascii=False).replace(",", ", "),
+    "ascii": json.dumps(POEMS, indent=2),
+}
+
+
+@pytest.mark.parametrize("fmt", ["minjson", "jsonl", "minjson.gz", "jsonl.gz", "jsonl.zst"])
+@pytest.mark.parametrize("style", sorted(STYLES))
+def test_round_trip_byte_identical(tmp_path, fmt, style):
+    if fmt.endswith(".zst"):
+        pytest.importorskip("zstandard")
+    raw = STYLES[style].encode("utf-8")
+    path = tmp_path / "poet.tang.0.json"
+    path.write_bytes(raw)
+    out = to_compact(str(path), fmt)
+    assert out.endswith("poet.tang.0." + fmt.replace("minjson", "min.json")) and not path.exists()
+    assert load_file(out) == POEMS
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert manifest["poet.tang.0"]["format"] == fmt and manifest["poet.tang.0"]["style"] is not None
+    restored = to_json(out)
+    assert restored == str(path) and path.read_bytes() == raw
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_unreproducible_style_falls_back(tmp_path):
+    # 不规则的空白无法由格式参数重现：有压缩时压缩原文，没有压缩时原文件不动
+    raw = '[{"title":  "静夜思", "paragraphs": ["床前明月光"]}]'.encode("utf-8")
+    path = tmp_path / "a.json"
+    path.write_bytes(raw)
+    assert to_compact(str(path), "jsonl") == str(path) and path.read_bytes() == raw
+    out = to_compact(str(path), "jsonl.gz")
+    assert out.endswith("a.json.gz")
+    assert json.loads((tmp_path / MANIFEST_NAME).read_text(encoding="utf-8"))["a"] == {"format": "json.gz",
+                                                                                     "style": None}
+    assert to_json(out) == str(path) and path.read_bytes() == raw
+
+
+def test_select_files():
+    names = ["a.json", "a.jsonl.zst", "b.json", "b.json.zst", "c.min.json", "d.jsonl.gz", MANIFEST_NAME]
+    # 优先所选格式，其次同压缩的原文，再次原始 json，最后任一格式
+    assert select_files(names, "jsonl.zst") == ["a.jsonl.zst", "b.json.zst", "c.min.json", "d.jsonl.gz"]
+    assert select_files(names) == ["a.json", "b.json", "c.min.json", "d.jsonl.gz"]
+
+
+def test_loader_reads_compact_files(tmp_path):
+    (tmp_path / "tang").mkdir()
+    for i in range(2):
+        (tmp_path / "tang" / f"poet.tang.{i}.json").write_text(STYLES["indent2"], encoding="utf-8")
+    to_compact(str(tmp_path / "tang" / "poet.tang.1.json"), "jsonl.gz", keep_source=True)
+    datasets = {"tang": {"name": "tang", "id": 0, "path": "tang/", "tag": "paragraphs", "format": "jsonl.gz"}}
+    config = tmp_path / "datas.json"
+    config.write_text(json.dumps({"cp_path": str(tmp_path), "datasets": datasets}), encoding="utf-8")
+    loader = PlainDataLoader(str(config))
+    # 保留了原文件时也只读紧凑格式，没有转换的文件读原文，清单不当作数据
+    assert [p.rsplit("/", 1)[1] for p in loader.dataset_files("tang")] == ["poet.tang.0.json", "poet.tang.1.jsonl.gz"]
+    assert [p.title for p in loader.get_records("tang")] == ["静夜思", "春晓"] * 2
@@ -0,0 +1,51 @@
+import json
+import sqlite3
+
+from loader.export import CI_STYLE, SQLITE_PRESETS, export, iter_sqlite, verify
+
+
+def make_db(path, n):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE ci (id INTEGER PRIMARY KEY, rhythmic TEXT, author TEXT, content TEXT)")
+    conn.executemany("INSERT INTO ci VALUES (?, ?, ?, ?)",
+                     [(i, f"词牌{i}", f"作者{i % 7}", f"第{i}首，上阕。\n下阕。") for i in range(n)])
+    conn.commit()
+    conn.close()
+
+
+def test_sqlite_export_shards_and_verify(tmp_path):
+    db = tmp_path / "ci.db"
+    make_db(db, 2500)
+    preset = SQLITE_PRESETS["ci"]
+    out = tmp_path / "out"
+    rows = iter_sqlite(str(db), preset["sql"], preset["split"], batch=300)
+    manifest = export(rows, str(out), preset["prefix"], "json", 1000, CI_STYLE, sort_keys=True, workers=2)
+
+    # 与 宋词/main.py 一致：每 1000 首一个 ci.song.N.json，N 为首条记录的序号
+    assert manifest["records"] == 2500
+    assert [(s["file"], s["start"], s["count"]) for s in manifest["shards"]] == [
+        ("ci.song.0.json", 0, 1000), ("ci.song.1000.json", 1000, 1000), ("ci.song.2000.json", 2000, 500)]
+    assert json.loads((out / "ci.song.manifest.json").read_text(encoding="utf-8")) == manifest
+    raw = (out / "ci.song.1000.json").read_text(encoding="utf-8")
+    # 缩进 2、逗号后有空格、键按字母序、结尾换行
+    assert raw.endswith("]\n") and '"author": "作者6", \n' in raw
+    first = json.loads(raw)[0]
+    assert list(first) == ["author", "paragraphs", "rhythmic"]
+    assert first["paragraphs"] == ["第1000首，上阕。", "下阕。"]
+    assert verify(str(out), "ci.song") == []
+
+    # 改动或缺失的分片都能查出
+    path = out / "ci.song.2000.json"
+    path.write_bytes(path.read_bytes().replace("上阕".encode("utf-8"), "下阕".encode("utf-8"), 1))
+    (out / "ci.song.0.json").unlink()
+    assert verify(str(out), "ci.song") == ["ci.song.0.json", "ci.song.2000.json"]
+    assert not list(out.glob("*.tmp"))
+
+
+def test_single_file_jsonl(tmp_path):
+    records = [{"name": f"作者{i}"} for i in range(3)]
+    manifest = export(iter(records), str(tmp_path), "author.song", "jsonl", 0, workers=1)
+    assert [s["file"] for s in manifest["shards"]] == ["author.song.jsonl"]
+    lines = (tmp_path / "author.song.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == records
+    assert verify(str(tmp_path), "author.song") == []
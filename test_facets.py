@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+import loader.facets as facets_module
+from loader.data_loader import PlainDataLoader
+from loader.facets import IntBitmap, get_facet_index, to_gids
+from loader.snapshot import load_snapshot, save_snapshot
+from search import facet_counts, poems_by_facets, search_poems
+
+from conftest import TANG, titles
+
+
+def test_facet_index(index):
+    facets = get_facet_index(index.loader)
+    assert facets.counts("dynasty") == {"唐": 3, "宋": 1}
+    assert facets.counts("popularity") == {"名篇": 1, "冷僻": 2, "无数据": 1}
+    assert facets.gids({"author": "李白", "form": "绝句"}).tolist() == [0, 2]
+    assert facets.gids({"dynasty": ["宋", "唐"], "popularity": "名篇"}).tolist() == [0]
+    assert len(facets.select({"form": "七绝"})) == 0
+    # 每个分面的计数不受自身筛选的影响，即选中该取值之后的首数
+    assert facets.counts("author", {"author": "李白", "dynasty": "唐"}) == {"李白": 2, "孟浩然": 1}
+    assert facets.counts("dataset", {"form": "词"}, index.dataset_range("song")) == {"song": 1}
+
+    bitmap = IntBitmap.from_mask(np.array([1, 0, 1, 1, 0, 0, 0, 0, 1], dtype=bool))
+    assert len(bitmap) == 4 and to_gids(bitmap).tolist() == [0, 2, 3, 8]
+    assert to_gids(bitmap & IntBitmap.from_mask(np.arange(9) > 2)).tolist() == [3, 8]
+
+    assert titles(index, "dynasty:宋 OR popularity:名篇") == ["静夜思", "水调歌头"]
+    found = search_poems(index.loader, "all", "明月", filter_author="李", facets={"popularity": "冷僻"})
+    assert [p.title for p in found] == ["月下独酌"]
+
+
+def test_facet_edge_cases(index):
+    facets = get_facet_index(index.loader)
+    for call in (lambda: facets.counts("无此分面"), lambda: facets.gids({"无此分面": "x"})):
+        with pytest.raises(ValueError):
+            call()
+    # 未知的取值没有作品，空的筛选不加限制
+    assert facets.gids({"dynasty": "明"}).tolist() == [] and facets.gids({"author": "无名"}).tolist() == []
+    assert facets.gids({}).tolist() == facets.gids({"dynasty": []}).tolist() == [0, 1, 2, 3]
+    # 范围的边界：song 中没有唐诗
+    assert facet_counts(index.loader, 1, "dynasty") == {"宋": 1}
+    assert poems_by_facets(index.loader, 1, {"dynasty": "唐"}) == []
+    assert [p.title for p in poems_by_facets(index.loader, 0, {"popularity": "名篇"})] == ["静夜思"]
+    bitmap = IntBitmap.from_mask(np.zeros(0, dtype=bool))
+    assert len(bitmap) == 0 and to_gids(bitmap).tolist() == []
+
+
+def test_file_spans_use_recorded_counts(tmp_path, monkeypatch):
+    (tmp_path / "tang").mkdir()
+    for i, poems in enumerate((TANG[:2], [], TANG[2:])):
+        (tmp_path / "tang" / f"poet.tang.{i}.json").write_text(json.dumps(poems, ensure_ascii=False), encoding="utf-8")
+    config = tmp_path / "datas.json"
+    config.write_text(json.dumps({"cp_path": str(tmp_path), "cache_path": str(tmp_path / "cache"), "datasets": {
+        "tang": {"name": "tang", "id": 0, "path": "tang/", "tag": "paragraphs"}}}), encoding="utf-8")
+    loader = PlainDataLoader(str(config))
+    assert loader.file_counts("tang") is None
+    loader.get_records("tang")
+    assert [n for _, n in loader.file_counts("tang")] == [2, 0, 1]
+
+    # 计数随快照保存与恢复，按文件定位时不再读取数据文件
+    save_snapshot(loader)
+    restored = PlainDataLoader(str(config))
+    assert load_snapshot(restored, lazy=True)
+    monkeypatch.setattr(facets_module, "load_file", None)
+    spans = facets_module.file_spans(restored, "tang", range(10, 13))
+    assert [span for _, span in spans] == [range(10, 12), range(12, 12), range(12, 13)]
@@ -0,0 +1,40 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+from loader.data_loader import PlainDataLoader
+from loader.folding import FoldTable
+from search import iter_search_poems, search_poems
+
+from conftest import titles
+
+
+def test_fold_table(index):
+    table = FoldTable([("後", "后"), ("崙", "仑"), ("崘", "崙")])
+    assert table.fold("後庭崘") == table.fold("后庭仑") == "后庭仑"
+    assert table.variants("崘") == "仑崘崙" and not table.affects("abc 明月")
+    # 靑 为 青 的异体（charmap.json 的 variants 表），倒排表与查询都按折叠后的字处理
+    assert index.posting("靑").tolist() == index.posting("青").tolist() == [3]
+    assert titles(index, "靑天") == ["水调歌头"]
+    assert [p.display_title for p in search_poems(index.loader, "all", "问靑天")] == ["水调歌头"]
+
+
+def test_fold_edge_cases(index):
+    table = FoldTable([("後", "后")])
+    # 空串与表外的字原样返回，只有自身一个写法
+    assert table.fold("") == "" and table.fold("鑫") == "鑫" and table.variants("鑫") == "鑫"
+    codes = np.array([ord(c) for c in "後鑫"], dtype=np.uint32)
+    assert "".join(map(chr, table.fold_codes(codes).tolist())) == "后鑫"
+    assert len(FoldTable([])) == 0
+    assert index.posting("鑫").tolist() == []
+
+
+def test_scoped_search_without_index(index):
+    loader = PlainDataLoader(index.loader._path)
+    found = [p for _, poems, _ in iter_search_poems(loader, 0, "明月", filter_author="李") for p in poems]
+    # 倒排表未建立时只载入所选文集
+    assert set(loader._records) == {"tang"}
+    assert [p.display_title for p in found] == ["静夜思", "月下独酌"]
+    scanned = [p.display_title for _, poems, _ in iter_search_poems(loader, 1, "問靑天") for p in poems]
+    assert scanned == ["水调歌头"] and set(loader._records) == {"tang", "song"}
+    # 范围的边界：只在所选文集中逐首核对
+    assert [p for _, poems, _ in iter_search_poems(loader, 1, "床前") for p in poems] == []
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("numpy")
+from loader.forms import FORMS, find_forms, get_form_index
+from loader.query import QuerySyntaxError, compile_query
+
+from conftest import titles
+
+
+def test_form_index(index):
+    forms = get_form_index(index.loader)
+    assert [FORMS[f] for f in forms.forms.tolist()] == ["五绝", "五绝", "五绝", "词"]
+    assert forms.counts() == {"五绝": 3, "词": 1}
+    assert forms.counts(index.dataset_range("song")) == {"词": 1}
+    assert find_forms("绝句") == [FORMS.index("五绝"), FORMS.index("七绝")] and find_forms("无此体") == []
+    assert forms.gids(find_forms("绝句"), index.dataset_range("tang")).tolist() == [0, 1, 2]
+    assert titles(index, "form:五言绝句 rhyme:阳") == ["静夜思"]
+    assert titles(index, "明月 -form:词") == ["静夜思", "月下独酌"]
+
+
+def test_form_edge_cases(index):
+    forms = get_form_index(index.loader)
+    assert find_forms("") == [] and forms.gids([]).tolist() == []
+    # 范围的边界：绝句都在 tang，song 中没有
+    assert forms.gids(find_forms("绝句"), index.dataset_range("song")).tolist() == []
+    assert forms.gids(find_forms("词"), index.dataset_range("song")).tolist() == [3]
+    assert forms.counts(range(0, 0)) == {}
+    with pytest.raises(QuerySyntaxError):
+        compile_query("form:无此体", index)
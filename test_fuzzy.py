@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+from loader.corpus import get_line_table
+from loader.data_loader import PlainDataLoader
+from loader.fuzzy import MAX_QUERY, _normalize, fuzzy_lines, semiglobal_distances
+
+from conftest import SONG, make_corpus
+
+
+def test_fuzzy_lines(index):
+    loader = index.loader
+    hits = fuzzy_lines(loader, "举头望明月低头思故相")
+    assert [(h.poem.title, h.line_no, h.distance) for h in hits] == [("静夜思", 1, 1)]
+    # 标点不计入距离，多数诗句都能以 0 距离命中
+    assert fuzzy_lines(loader, "明月几时有，把酒问青天")[0].distance == 0
+    assert [h.poem.author for h in fuzzy_lines(loader, "举杯要明月", scope="tang")] == ["李白"]
+    assert fuzzy_lines(loader, "举杯要明月", scope="song") == []
+    assert fuzzy_lines(loader, "完全无关的句子") == []
+
+
+def test_fuzzy_edge_cases(index):
+    loader = index.loader
+    # 空查询、只有标点、语料中没有的字都没有结果
+    assert fuzzy_lines(loader, "") == [] and fuzzy_lines(loader, "，。？") == []
+    assert fuzzy_lines(loader, "鑫") == []
+    # 距离上限为 0 时只有原句
+    assert fuzzy_lines(loader, "举头望明月低头思故相", 0) == []
+    assert [h.distance for h in fuzzy_lines(loader, "举头望明月，低头思故乡", 0)] == [0]
+    # 过长的查询截断到位并行算法能表示的长度
+    assert len(_normalize("床前明月光，" * 20)) == MAX_QUERY
+
+
+def test_semiglobal_distances_match_dp():
+    def reference(query, text):
+        row = [0] * (len(text) + 1)
+        for i, q in enumerate(query, 1):
+            prev, row = row, [i] + [0] * len(text)
+            for j, t in enumerate(text, 1):
+                row[j] = min(prev[j - 1] + (q != t), prev[j] + 1, row[j - 1] + 1)
+        return min(row)
+
+    rng = random.Random(0)
+    texts = ["".join(rng.choice("春花秋月") for _ in range(rng.randint(0, 12))) for _ in range(50)]
+    width = max(map(len, texts))
+    matrix = np.array([[ord(c) for c in t.ljust(width, "x")] for t in texts], dtype=np.uint32).T
+    lengths = np.array([len(t) for t in texts])
+    for query in ("春", "花月", "春花秋月春"):
+        assert semiglobal_distances(query, matrix, lengths).tolist() == [reference(query, t) for t in texts]
+
+
+def test_empty_content_lines(tmp_path):
+    loader = PlainDataLoader(make_corpus(tmp_path, SONG + [{"rhythmic": "失调名", "author": "无名氏", "paragraphs": []}]))
+    table = get_line_table(loader)
+    records = table.index.records
+    assert records[-1].lines == [] and len(table) == sum(len(p.lines) for p in records)
+    assert [table.line(i) for i in range(len(table))][-2:] == ["明月几时有？把酒问青天。", "千里共婵娟。"]
+    # 允许的编辑距离不小于查询长度时任意行都可能命中，不应越界
+    assert fuzzy_lines(loader, "明月", 2, 50)
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+from incremental import IncrementalSearch
+from search import iter_search_poems, search_poems
+
+
+@pytest.fixture
+def searcher():
+    searcher = IncrementalSearch(debounce=0.05)
+    yield searcher
+    searcher.shutdown()
+
+
+def test_incremental_search(index, searcher):
+    loader = index.loader
+    batches = list(iter_search_poems(loader, "all", "月", limit=10))
+    assert [target for target, _, _ in batches] == ["tang", "song"]
+    assert [p for _, found, _ in batches for p in found] == search_poems(loader, "all", "月", limit=10)
+    cancel = threading.Event()
+    cancel.set()
+    assert list(iter_search_poems(loader, "all", "月", cancel=cancel)) == []
+
+    first = searcher.submit(loader, "all", "明")
+    second = searcher.submit(loader, "all", "明月", previous=first)
+    assert second.finished.wait(5) and first.finished.wait(5)
+    assert first.cancelled.is_set() and first.poems == []
+    assert second.poems == search_poems(loader, "all", "明月") and second.datasets == second.total == 2
+    # 完整的结果进入共享缓存，再次提交立即完成
+    assert searcher.submit(loader, "all", "明月").done
+
+
+def test_incremental_edge_cases(index, searcher):
+    loader = index.loader
+    # 没有结果的查询也会完成；限定文集时只需搜索一个文集
+    empty = searcher.submit(loader, "all", "鑫")
+    scoped = searcher.submit(loader, 1, "明月")
+    assert empty.finished.wait(5) and empty.poems == [] and empty.error is None
+    assert scoped.finished.wait(5) and [p.display_title for p in scoped.poems] == ["水调歌头"]
+    assert scoped.datasets == scoped.total == 1
+    # 出错的任务记下错误并结束，不会一直等待
+    broken = searcher.submit(loader, 9, "明月")
+    assert broken.finished.wait(5) and broken.error is not None and broken.snapshot() == ([], 0)
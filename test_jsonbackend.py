@@ -0,0 +1,31 @@
+import pytest
+
+from loader.jsonbackend import available_backends, get_backend
+
+RAW = '[{"title": "静夜思", "author": "李白", "id": "x", "paragraphs": ["床前明月光，疑是地上霜。"]},' \
+      ' {"title": "春晓", "notes": ["n"], "paragraphs": ["春眠不觉晓"]}]'.encode("utf-8")
+FIELDS = ("title", "author", "paragraphs")
+
+
+@pytest.mark.parametrize("name", available_backends())
+def test_backends_agree(name):
+    backend = get_backend(name)
+    assert backend.loads(RAW) == get_backend("json").loads(RAW)
+    records = backend.decode_fields(RAW, FIELDS)
+    assert [r.get("title") for r in records] == ["静夜思", "春晓"]
+    assert records[1].get("author") is None and "author" not in records[1]
+    assert records[0]["paragraphs"] == ["床前明月光，疑是地上霜。"]
+
+
+@pytest.mark.parametrize("name", available_backends())
+def test_irregular_and_single_object(name):
+    backend = get_backend(name)
+    assert backend.decode_fields(b'["a", {"title": "t"}]', FIELDS)[0] == "a"
+    assert backend.decode_fields(b'{"title": "t", "id": 1}', FIELDS).get("title") == "t"
+
+
+@pytest.mark.parametrize("name", [n for n in available_backends() if n != "msgspec"])
+def test_full_tree_backends_skip_projection(name):
+    # json 与 orjson 无法在解析时跳过字段，按字段解码与完整解码相同
+    backend = get_backend(name)
+    assert backend.decode_fields(RAW, FIELDS) == backend.loads(RAW)
@@ -0,0 +1,93 @@
+import re
+import urllib.request
+
+from loader import metrics
+from loader.metrics import MetricsRegistry, record_cache, start_http_server, timed
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text: str) -> tuple:
+    """ 按文本格式解析：返回 ({指标: 类型}, {(样本名, 标签): 值})，每个样本前必须已声明 HELP 与 TYPE """
+    assert text.endswith("\n")
+    helps, types, samples = set(), {}, {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            helps.add(line.split(" ")[2])
+            continue
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name in helps and name not in types
+            types[name] = kind
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        family = re.sub(r"_(bucket|count|sum)$", "", name) if name not in types else name
+        assert family in types, line
+        key = tuple(LABEL.findall(labels or ""))
+        assert (name, key) not in samples
+        samples[(name, key)] = float(value)
+    return types, samples
+
+
+def test_render_prometheus():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests").inc(path="/a")
+    registry.counter("requests_total").inc(2, path='/"b"\n')
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 3):
+        histogram.observe(value, op="q")
+    counter = registry.counter("cache_requests_total", "Cache lookups by result")
+    counter.inc(cache="fuzzy", result="hit")
+    counter.inc(3, cache="fuzzy", result="miss")
+
+    types, samples = parse(registry.render_prometheus())
+    assert types == {"requests_total": "counter", "latency_seconds": "histogram",
+                     "cache_requests_total": "counter", "cache_hit_ratio": "gauge"}
+    assert samples[("requests_total", (("path", "/a"),))] == 1
+    assert samples[("requests_total", (("path", '/\\"b\\"\\n'),))] == 2
+    # 分桶计数是累积的，+Inf 等于总数
+    buckets = [samples[("latency_seconds_bucket", (("op", "q"), ("le", le)))] for le in ("0.1", "1.0", "+Inf")]
+    assert buckets == [1, 2, 3]
+    assert samples[("latency_seconds_count", (("op", "q"),))] == 3
+    assert samples[("latency_seconds_sum", (("op", "q"),))] == 3.55
+    assert samples[("cache_hit_ratio", (("cache", "fuzzy"),))] == 0.25
+    assert registry.cache_ratios() == {"fuzzy": (1, 4, 0.25)}
+
+
+def test_empty_registry():
+    assert MetricsRegistry().render_prometheus() == "\n"
+
+
+def test_timed_and_record_cache(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, "registry", registry)
+
+    @timed("op_seconds", "Op latency", backend="test")
+    def work(x):
+        return x * 2
+
+    assert work(3) == 6 and work(4) == 8 and work.__name__ == "work"
+    record_cache("result", True)
+    record_cache("result", False)
+    types, samples = parse(registry.render_prometheus())
+    assert types["op_seconds"] == "histogram"
+    assert samples[("op_seconds_count", (("backend", "test"), ("op", "work")))] == 2
+    assert registry.cache_ratios() == {"result": (1, 2, 0.5)}
+
+
+def test_http_endpoint(monkeypatch):
+    registry = MetricsRegistry()
+    registry.counter("up_total", "Up").inc()
+    monkeypatch.setattr(metrics, "registry", registry)
+    server = start_http_server(0, "127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as resp:
+            assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            _, samples = parse(resp.read().decode("utf-8"))
+        assert samples[("up_total", ())] == 1
+    finally:
+        server.shutdown()
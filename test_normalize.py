@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import random
+
+from loader.normalize import Normalizer, load_table
+
+
+def test_single_and_multi_char_keys():
+    normalizer = Normalizer(load_table("ci"))
+    assert normalizer("崑崙山後薄倖") == "昆仑山后薄幸"
+    # 只有多字键的首字出现时不应替换
+    assert normalizer("崑山") == "崑山"
+
+
+def test_leftmost_longest_without_overlap():
+    normalizer = Normalizer({"ab": "X", "abc": "Y", "bcd": "Z", "b": "q"})
+    assert normalizer("abcd") == "Yd"
+    assert normalizer("xbcdab") == "xZX"
+    assert normalizer("b") == "q"
+
+
+def test_shorter_keys_on_suffix_chain():
+    # 状态 "bcd" 的最长键是 bcd，较短的 cd 只能沿失败链找到
+    normalizer = Normalizer({"ab": "X", "bcd": "Y", "cd": "Z"})
+    assert normalizer("abcd") == "XZ"
+    assert normalizer("abcde") == "XZe"
+
+
+def test_matches_naive_leftmost_longest():
+    mapping = {"ab": "1", "abc": "2", "bcd": "3", "cd": "4", "bc": "5", "dab": "6"}
+    longest = sorted(mapping, key=len, reverse=True)
+
+    def naive(text):
+        parts, pos = [], 0
+        while pos < len(text):
+            key = next((k for k in longest if text.startswith(k, pos)), None)
+            parts.append(mapping[key] if key else text[pos])
+            pos += len(key) if key else 1
+        return "".join(parts)
+
+    rng = random.Random(0)
+    normalizer = Normalizer(mapping)
+    for _ in range(500):
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 12)))
+        assert normalizer(text) == naive(text), text
+
+
+def test_apply_nested_fields():
+    normalizer = Normalizer(load_table("ci"))
+    data = [{"title": "後", "content": [{"chapter": "鵷", "paragraphs": ["後來"]}]}]
+    assert normalizer.apply(data, ("content",))
+    assert data[0]["title"] == "後"
+    assert data[0]["content"][0]["paragraphs"] == ["后來"]
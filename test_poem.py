@@ -0,0 +1,39 @@
+import pickle
+
+from loader.poem import Poem
+from render import render_poem
+
+
+class _Identity():
+    def convert(self, text):
+        return text
+
+
+CONVERTERS = (_Identity(), _Identity())
+
+
+def test_flat_paragraphs():
+    raw = {"title": "静夜思", "author": "李白", "paragraphs": ["床前明月光，疑是地上霜。", "举头望明月，低头思故乡。"],
+           "id": "x"}
+    poem = Poem.from_dict(raw, "tangsong", 3)
+    assert poem.lines == raw["paragraphs"]
+    assert poem.body is None
+    assert poem.field == "paragraphs"
+    assert poem.get("paragraphs") == raw["paragraphs"]
+    assert poem.to_dict() == {k: v for k, v in raw.items() if k != "id"}
+    assert pickle.loads(pickle.dumps(poem)).text == poem.text
+
+
+def test_nested_and_string_content():
+    nested = Poem.from_dict({"title": "弟子规", "content": [
+        {"chapter": "总叙", "paragraphs": ["弟子规，圣人训。"]},
+        {"chapter": "入则孝", "paragraphs": ["父母呼，应勿缓。", "父母命，行勿懒。"]},
+    ]})
+    assert nested.lines == ["弟子规，圣人训。", "父母呼，应勿缓。", "父母命，行勿懒。"]
+    assert nested.headings() == ["总叙", "入则孝"]
+    assert render_poem(nested, CONVERTERS)["full_text"].startswith("总叙")
+
+    single = Poem.from_dict({"title": "幽梦影", "content": "读经宜冬"})
+    assert single.lines == ["读经宜冬"]
+    assert single.content == "读经宜冬"
+    assert Poem.from_dict({"rhythmic": "导引"}).display_title == "导引"
@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("numpy")
+from loader.positional import WIDTH, get_clause_table
+from search import positional_lines
+
+
+@pytest.fixture(scope="module")
+def clauses(index):
+    return get_clause_table(index.loader)
+
+
+def texts(clauses, *args, **kwargs):
+    return [c.text for c in clauses.clauses(clauses.select(*args, **kwargs))]
+
+
+def test_clause_table(index, clauses):
+    assert len(clauses) == 15
+    assert texts(clauses, "???月?") == ["床前明月光"]
+    assert texts(clauses, "明月???") == ["明月几时有"]
+    assert texts(clauses, positions={-1: "月"}) == ["举头望明月", "举杯邀明月"]
+    assert texts(clauses, positions={1: "举"}, contains="明") == ["举头望明月", "举杯邀明月"]
+    assert texts(clauses, contains="花酒") == ["花间一壶酒"]
+    assert texts(clauses, contains="酒", scope=index.dataset_range("song")) == ["把酒问青天"]
+    assert texts(clauses, contains="月", length=7) == [] and texts(clauses, "??无此字") == []
+    clause = clauses.clauses(clauses.select("千里??娟"))[0]
+    assert (clause.poem.display_title, clause.line_no) == ("水调歌头", 1)
+
+
+def test_clause_edge_cases(index, clauses):
+    # 空模式不加限制；语料中没有的字、第 0 位、超出句长的位置都没有结果
+    assert len(clauses.select("")) == len(clauses.select()) == len(clauses)
+    assert texts(clauses, contains="鑫") == [] and texts(clauses, positions={0: "月"}) == []
+    assert texts(clauses, positions={6: "月"}, length=5) == []
+    # 范围的边界：tang 的最后一首与 song 的第一首相邻，各自只含本数据集的句
+    assert texts(clauses, contains="月", scope=index.dataset_range("tang")) == ["床前明月光", "举头望明月", "举杯邀明月"]
+    assert texts(clauses, contains="月", scope=index.dataset_range("song")) == ["明月几时有"]
+    assert texts(clauses, contains="月", scope=range(0, 0)) == []
+    with pytest.raises(ValueError):
+        clauses.select(positions={WIDTH + 1: "月"})
+
+
+def test_positional_lines(index):
+    total, found = positional_lines(index.loader, 0, "??望明?", limit=1)
+    assert total == 1 and [(c.poem.title, c.line_no, c.text) for c in found] == [("静夜思", 1, "举头望明月")]
+    assert positional_lines(index.loader, 1, contains="花") == (0, [])
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("numpy")
+from loader.query import QuerySyntaxError, compile_query
+
+from conftest import titles
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("明月", ["静夜思", "月下独酌", "水调歌头"]),
+    ("明月 author:李白", ["静夜思", "月下独酌"]),
+    ("明月 AND NOT author:李白", ["水调歌头"]),
+    ("明月 -dataset:tang", ["水调歌头"]),
+    ("春晓 OR rhythmic:水调", ["春晓", "水调歌头"]),
+    ('(author:苏轼 OR title:春) "花落知"', ["春晓"]),
+    ("line:1:床前", ["静夜思"]),
+    ("line:-1:故乡", ["静夜思"]),
+    ("line:1:明月", ["静夜思", "水调歌头"]),
+    ("^举头 故乡$", ["静夜思"]),
+    ("^明月$", []),
+    ("dataset:1", ["水调歌头"]),
+])
+def test_query(index, query, expected):
+    assert titles(index, query) == expected
+
+
+def test_scope_and_errors(index):
+    assert titles(index, "明月", scope="tang") == ["静夜思", "月下独酌"]
+    # 范围的边界：song 只有一首，tang 中没有词牌
+    assert titles(index, "明月", scope="song") == ["水调歌头"]
+    assert titles(index, "rhythmic:水调", scope="tang") == []
+    for query in ("", "   ", "title:", "(明月", "明月 OR", "line:0:月", "dataset:missing", "dataset:9",
+                  "popularity:无此档"):
+        with pytest.raises(QuerySyntaxError):
+            compile_query(query, index)
+
+
+@pytest.mark.parametrize("query", ["鑫", "明月 鑫", "line:3:月", "line:-3:月", "author:李白 dataset:song"])
+def test_no_match(index, query):
+    # 语料中没有的字、超出诗行数的行号、互斥的条件都得到空结果
+    assert titles(index, query) == []
@@ -0,0 +1,88 @@
+import json
+from array import array
+
+import pytest
+
+pytest.importorskip("numpy")
+import search
+from loader.corpus import get_corpus_index
+from loader.data_loader import PlainDataLoader
+from results import ENTRY_OVERHEAD, ResultCache, ResultSet, fingerprint
+from search import search_key, search_poems
+
+from conftest import TANG, make_corpus
+
+
+def test_result_set(index):
+    loader, records = index.loader, index.records
+    found = ResultSet.from_poems(fingerprint("明月", "all"), [records[0], records[2], records[3]])
+    assert len(found) == 3 and [target for target, _ in found.segments] == ["tang", "song"]
+    assert [p.display_title for p in found.page(loader, 1, 10)] == ["月下独酌", "水调歌头"]
+    assert found.page(loader, 3, 5) == [] and len(ResultSet.from_poems("", [])) == 0
+    assert found.fingerprint == fingerprint("明月", "all") != fingerprint("all", "明月")
+    whole = ResultSet.dataset(fingerprint("tang"), "tang", 3)
+    assert [p.title for p in whole.page(loader, 0, 2)] == ["静夜思", "春晓"]
+
+
+def test_result_set_edge_cases(index):
+    loader, records = index.loader, index.records
+    found = ResultSet.from_poems("f", [records[2], records[3]])
+    # 跨段的一页、越界与倒置的范围
+    assert [p.display_title for p in found.page(loader, 0, 2)] == ["月下独酌", "水调歌头"]
+    assert found.page(loader, 2, 1) == [] and found.page(loader, 5, 10) == []
+    assert ResultSet("f", []).page(loader, 0, 10) == [] and ResultSet.dataset("f", "tang", 0).page(loader, 0, 1) == []
+    # range 段只计固定开销，编号段每首 4 字节
+    assert ResultSet.dataset("f", "tang", 10 ** 6).nbytes < ResultSet("f", [("tang", array("I", [0] * 1000))]).nbytes
+    assert ResultSet("f", []).nbytes == ENTRY_OVERHEAD
+
+
+def test_result_cache(index, tmp_path, monkeypatch):
+    # 要改动数据文件，使用单独的语料副本，不影响共享的 index
+    loader = PlainDataLoader(make_corpus(tmp_path))
+    records = loader.get_records("tang")
+    now = [0.0]
+    cache = ResultCache(max_entries=2, ttl=10, check_interval=0, clock=lambda: now[0])
+    for key in ("a", "b", "c"):
+        cache.put(loader, ResultSet.from_poems(key, records[:2]))
+    assert cache.get(loader, "a") is None and len(cache.get(loader, "b")) == 2
+    cache.put(loader, ResultSet.from_poems("d", records[:1]))
+    assert cache.get(loader, "c") is None and cache.get(loader, "b") is not None
+    now[0] = 11
+    assert cache.get(loader, "b") is None and len(cache) == 1
+    # 数据文件变化后旧结果作废
+    path = loader.dataset_files("tang")[0]
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert cache.get(loader, "d") is None and len(cache) == 0 and cache.nbytes == 0
+
+    # 重新算出的结果来自新的数据：加载器的记录与倒排表随清单一起失效
+    monkeypatch.setattr(search, "result_cache", cache)
+    assert [p.title for p in search_poems(loader, 0, "新月")] == []
+    before = get_corpus_index(loader)
+    added = TANG + [{"title": "新月", "author": "某", "paragraphs": ["新月如钩，明月将圆。"]}]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(added, f, ensure_ascii=False)
+    assert [p.title for p in search_poems(loader, 0, "新月")] == ["新月"]
+    assert [p.display_title for p in search_poems(loader, "all", "明月")] == ["静夜思", "月下独酌", "新月", "水调歌头"]
+    assert len(loader.get_records("tang")) == 4 and get_corpus_index(loader) is not before
+
+    # 简繁体不同写法共用一条缓存
+    first = search_poems(index.loader, "all", "问青天")
+    assert search_poems(index.loader, "all", "問靑天") == first and len(first) == 1
+
+
+def test_result_cache_edge_cases(index):
+    loader, records = index.loader, index.records
+    cache = ResultCache(max_bytes=ENTRY_OVERHEAD + 100, check_interval=60)
+    # 单个超过字节上限的结果不缓存，也不挤掉已有条目
+    cache.put(loader, ResultSet.from_poems("small", records[:1]))
+    cache.put(loader, ResultSet("big", [("tang", array("I", range(100)))]))
+    assert cache.get(loader, "big") is None and cache.get(loader, "small") is not None and len(cache) == 1
+    assert cache.get(loader, "missing") is None
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+    # 指纹：分面取值的顺序与空的分面不影响，其余条件都参与
+    assert search_key("all", "明月", facets={"dynasty": ["唐", "宋"], "form": None}) == \
+        search_key("all", "明月", facets={"dynasty": ["宋", "唐"]})
+    assert search_key("all", "明月") != search_key(0, "明月") != search_key(0, "明月", limit=10)
+    assert search_key("all", "", filter_author="李白") != search_key("all", "", filter_title="李白")
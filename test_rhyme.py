@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("numpy")
+from loader.data_loader import PlainDataLoader
+from loader.query import QuerySyntaxError, compile_query
+from loader.rhyme import get_rhyme_index
+from search import same_rhyme_poems
+
+from conftest import SONG, make_corpus, titles
+
+
+def test_rhyme_index(index):
+    rhymes = get_rhyme_index(index.loader)
+    table = rhymes.rhymes
+    assert table.find("阳") == table.find("下平七陽") == table.find("七阳韵") >= 0
+    # 静夜思押阳韵（霜、乡），春晓押筱韵（晓、鸟、少），水调歌头押先韵（天、娟）
+    assert table.label(int(rhymes.poem_groups[0])) == "下平七陽"
+    assert rhymes.rhyme_chars(0) == "霜乡"
+    assert table.label(int(rhymes.poem_groups[1])) == "上聲十七篠"
+    assert table.label(int(rhymes.poem_groups[3])) == "下平一先"
+    assert rhymes.poems(table.find("阳")).tolist() == [0]
+    assert titles(index, "rhyme:阳") == ["静夜思"] and titles(index, "rhyme:先 OR rhyme:篠") == ["春晓", "水调歌头"]
+
+
+def test_unknown_rhyme(index):
+    table = get_rhyme_index(index.loader).rhymes
+    assert table.find("无此韵") == table.find("") == -1 and table.groups_of("鑫") == []
+    assert get_rhyme_index(index.loader).poems(-1).tolist() == []
+    for query in ("rhyme:无此韵", "rhyme:"):
+        with pytest.raises(QuerySyntaxError):
+            compile_query(query, index)
+
+
+def test_same_rhyme_poems(tmp_path):
+    # 韵脚字不在韵书中的作品不押任何韵部
+    loader = PlainDataLoader(make_corpus(tmp_path, SONG + [{"rhythmic": "无韵", "paragraphs": ["犇犇犇，鑫鑫鑫。"]}]))
+    records = loader.get_records("song")
+    group, chars, found = same_rhyme_poems(loader, records[0])
+    assert (group, chars, found) == ("下平一先", "天娟", [])
+    group, chars, found = same_rhyme_poems(loader, records[1])
+    assert group is None and found == []
@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer
+
+import database
+from server import ServiceState, make_app
+
+POEMS = [
+    {"title": "静夜思", "author": "李白", "paragraphs": ["床前明月光，疑是地上霜。", "举头望明月，低头思故乡。"]},
+    {"title": "春晓", "author": "孟浩然", "paragraphs": ["春眠不觉晓，处处闻啼鸟。" * 60]},
+]
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "poems.json").write_text(json.dumps(POEMS, ensure_ascii=False), encoding="utf-8")
+    config = tmp_path / "datas.json"
+    config.write_text(json.dumps({"cp_path": str(tmp_path), "cache_path": str(tmp_path / "cache"), "datasets": {
+        "sample": {"name": "样例", "id": 0, "path": "data/", "tag": "paragraphs"}}}), encoding="utf-8")
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "notes.db"))
+    database.init_db()
+    return ServiceState(str(config))
+
+
+def run(state, scenario):
+    async def main():
+        async with TestClient(TestServer(make_app(state))) as client:
+            await scenario(client)
+    asyncio.run(main())
+
+
+def test_poems_etag_and_compression(state):
+    async def scenario(client):
+        response = await client.get("/api/poems/sample/0")
+        assert (await response.json())["title"] == "静夜思"
+        etag = response.headers["ETag"]
+        response = await client.get("/api/poems/0/0", headers={"If-None-Match": etag})
+        assert response.status == 304
+        response = await client.get("/api/poems/sample/1", headers={"Accept-Encoding": "gzip"})
+        assert response.headers.get("Content-Encoding") == "gzip"
+        assert (await client.get("/api/poems/sample/9")).status == 404
+
+        page = await (await client.get("/api/gallery/sample?size=1&page=2")).json()
+        assert page["total"] == 2 and page["results"][0]["title"] == "春晓"
+        found = await (await client.get("/api/search", params={"q": "明月"})).json()
+        assert [p["id"] for p in found["results"]] == [0]
+    run(state, scenario)
+
+
+def test_notes_roundtrip(state):
+    async def scenario(client):
+        response = await client.post("/api/notes", json={"dataset": "sample", "id": 0, "analysis": "思乡"})
+        assert response.status == 201
+        notes = await (await client.get("/api/notes")).json()
+        assert notes[0]["title"] == "静夜思" and notes[0]["analysis"] == "思乡"
+        await client.put(f"/api/notes/{notes[0]['id']}", json={"user_comment": "好", "tags": "必背", "rating": 5})
+        assert await (await client.get("/api/notes/tags")).json() == ["必背"]
+        await client.delete(f"/api/notes/{notes[0]['id']}")
+        assert await (await client.get("/api/notes")).json() == []
+    run(state, scenario)
+
+
+def test_add_note_rejects_bad_input(state):
+    async def scenario(client):
+        for payload in ({"dataset": "sample", "id": -1, "analysis": "x"},
+                        {"dataset": "sample", "id": 2, "analysis": "x"},
+                        {"dataset": "sample", "id": "a", "analysis": "x"},
+                        {"poem": "静夜思", "analysis": "x"},
+                        {"poem": ["静夜思"], "analysis": "x"},
+                        {"dataset": "sample", "id": 0},
+                        ["analysis"]):
+            assert (await client.post("/api/notes", json=payload)).status == 400, payload
+        assert await (await client.get("/api/notes")).json() == []
+        response = await client.post("/api/notes", json={"poem": POEMS[1], "analysis": "春景"})
+        assert response.status == 201
+        assert (await (await client.get("/api/notes")).json())[0]["title"] == "春晓"
+    run(state, scenario)
+
+
+def test_poem_routes_reject_out_of_range_pid(state):
+    async def scenario(client):
+        for pid in ("-1", "2", "x"):
+            for suffix in ("", "/similar", "/rhyme"):
+                assert (await client.get(f"/api/poems/sample/{pid}{suffix}")).status == 404, (pid, suffix)
+        assert (await (await client.get("/api/poems/sample/1")).json())["title"] == "春晓"
+    run(state, scenario)
+
+
+def test_indexes_loaded_before_fork(state):
+    from loader.corpus import cached_derived
+    from loader.similar import DEFAULT_DIMS
+
+    # worker 继承父进程中已打开的索引，不再各自构建
+    for name in ("corpus", "bigrams", "suffix", "clauses", "rhymes", "facets", "forms", f"similar-{DEFAULT_DIMS}"):
+        assert cached_derived(state.loader, name) is not None, name
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("numpy")
+from loader.data_loader import PlainDataLoader
+from loader.similar import SimilarIndex, index_ready
+
+from conftest import make_corpus
+
+
+@pytest.mark.parametrize("dims", [0, 4])
+def test_similar_index(index, tmp_path, dims):
+    loader = index.loader
+    similar = SimilarIndex(loader, dims, root=str(tmp_path / "similar"))
+    assert similar.rebuilt == ["tang", "song"]
+    found = similar.similar([("tang", 0), ("song", 0)], k=2)
+    # 静夜思与月下独酌共有 "举"、"明月" 等
+    assert [(t, pid) for t, pid, _ in found[0]][0] == ("tang", 2)
+    assert all(0 < score <= 1 for row in found for _, _, score in row)
+    assert SimilarIndex(loader, dims, root=similar.root).rebuilt == []
+
+    # 空查询；k 超过语料规模时只返回其余的作品，不含自身
+    assert similar.similar([], k=2) == []
+    everything = similar.similar([("tang", 0)], k=100)[0]
+    assert len(everything) <= 3 and ("tang", 0) not in [(t, pid) for t, pid, _ in everything]
+
+
+def test_similar_index_freshness(tmp_path):
+    loader = PlainDataLoader(make_corpus(tmp_path))
+    root = str(tmp_path / "similar")
+    assert not index_ready(loader, 4, root)
+    similar = SimilarIndex(loader, 4, root)
+    assert index_ready(loader, 4, root) and not index_ready(loader, 8, root)
+    assert similar.ensure_fresh() == []
+    # 同一进程中源文件变化后，下次取用时只重建变化的数据集
+    path = loader.dataset_files("song")[0]
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert not index_ready(loader, 4, root)
+    assert similar.ensure_fresh() == ["song"] and index_ready(loader, 4, root)
@@ -0,0 +1,42 @@
+import json
+import os
+
+from loader.data_loader import PlainDataLoader
+from loader.snapshot import load_snapshot, read_header, save_snapshot, warm
+
+POEMS = [
+    {"title": "静夜思", "author": "李白", "paragraphs": ["床前明月光，疑是地上霜。"]},
+    {"title": "春晓", "author": "孟浩然", "paragraphs": ["春眠不觉晓，处处闻啼鸟。"]},
+    {"title": "望庐山瀑布", "author": "李白", "paragraphs": ["日照香炉生紫烟，遥看瀑布挂前川。"]},
+]
+
+
+def make_config(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "poems.json").write_text(json.dumps(POEMS, ensure_ascii=False), encoding="utf-8")
+    config = tmp_path / "datas.json"
+    config.write_text(json.dumps({"cp_path": str(tmp_path), "cache_path": str(tmp_path / "cache"), "datasets": {
+        "sample": {"name": "样例", "id": 0, "path": "data/", "tag": "paragraphs"}}}), encoding="utf-8")
+    return str(config)
+
+
+def test_snapshot_roundtrip_and_invalidation(tmp_path):
+    config = make_config(tmp_path)
+    path = save_snapshot(PlainDataLoader(config))
+    assert read_header(path)["records"] == 3
+
+    for lazy in (False, True):
+        loader = PlainDataLoader(config)
+        assert load_snapshot(loader, lazy=lazy)
+        assert [p.title for p in loader.get_records("sample")] == ["静夜思", "春晓", "望庐山瀑布"]
+        assert list(loader.author_table("sample")["李白"]) == [0, 2]
+
+    # 源文件变化后快照失效，warm 会重建
+    data = tmp_path / "data" / "poems.json"
+    data.write_text(json.dumps(POEMS[:2], ensure_ascii=False), encoding="utf-8")
+    os.utime(data, ns=(1, 1))
+    loader = PlainDataLoader(config)
+    assert not load_snapshot(loader)
+    assert warm(loader) == "built"
+    assert warm(PlainDataLoader(config)) == "snapshot"
+    assert read_header(path)["records"] == 2
@@ -0,0 +1,21 @@
+from startup import StartupReport, Warmup
+
+
+def test_warmup_records_phases_and_errors():
+    report = StartupReport()
+    calls = []
+
+    def boom():
+        raise RuntimeError("missing")
+
+    warmup = Warmup([("a", lambda: calls.append("a")), ("bad", boom), ("b", lambda: calls.append("b"))], report)
+    warmup.start()
+    assert warmup.done.wait(5)
+    assert calls == ["a", "b"]
+    assert warmup.errors == {"bad": "missing"}
+    phases = [row["phase"] for row in report.rows()]
+    assert phases[0] == "warmup" and "warmup:a" in phases and "warmup:b" in phases
+
+    report.mark("first_paint")
+    report.mark("first_paint")
+    assert [row["phase"] for row in report.rows()].count("first_paint") == 1
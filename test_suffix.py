@@ -0,0 +1,31 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+from loader.suffix import get_suffix_index, suffix_array
+
+
+def test_suffix_array():
+    text = np.array([3, 1, 2, 1, 2, 1, 0, 2], dtype=np.uint32)
+    assert suffix_array(text).tolist() == sorted(range(len(text)), key=lambda i: text[i:].tolist())
+    assert suffix_array(np.zeros(0, dtype=np.uint32)).tolist() == []
+
+
+def test_suffix_index(index):
+    suffix = get_suffix_index(index.loader)
+    assert suffix.count("明月") == 4
+    assert suffix.count_by_dataset("明月") == {"tang": 3, "song": 1}
+    assert [tuple(o) for o in suffix.locate("明月")] == [
+        ("tang", 0, 0, 2), ("tang", 0, 1, 3), ("tang", 2, 1, 3), ("song", 0, 0, 0)]
+    assert [tuple(o) for o in suffix.locate("举", limit=1)] == [("tang", 0, 1, 0)]
+    # 行间有分隔符，不会跨行匹配
+    assert suffix.count("霜。举") == 0 and suffix.count("无此字") == 0
+
+
+def test_suffix_edge_cases(index):
+    suffix = get_suffix_index(index.loader)
+    # 空模式与语料中没有的字都不算出现
+    assert suffix.count("") == 0 and suffix.locate("") == []
+    assert suffix.count("鑫") == 0 and suffix.count_by_dataset("鑫") == {} and suffix.locate("鑫") == []
+    # 整行（含行末标点）与最后一行的结尾都能找到
+    assert suffix.count("千里共婵娟。") == 1 and suffix.count("对影成三人。") == 1
+    assert suffix.locate("明月", limit=0) == []
@@ -1,46 +1,21 @@
 #!-*- coding: utf-8 -*-
 
-import json, sys
-import sqlite3
-from collections import OrderedDict
+import os
+import sys
 
-try:               # Python 2
-    reload(sys)
-    sys.setdefaultencoding('utf-8')
-except NameError:  # Python 3
-    pass
+# 导出逻辑位于仓库根目录的 loader 中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
-c = sqlite3.connect('ci.db')
+from loader.export import CI_STYLE, SQLITE_PRESETS, export, iter_sqlite
 
-cursor = c.execute("SELECT name, long_desc, short_desc from ciauthor;")
 
-d = {"name": None, "description": None, "short_description": None}
+def export_preset(db_path: str, name: str, shard_size: int):
+    preset = SQLITE_PRESETS[name]
+    rows = iter_sqlite(db_path, preset["sql"], preset["split"])
+    return export(rows, "./", preset["prefix"], "json", shard_size, CI_STYLE, sort_keys=True)
 
-authors = []
-
-for row in cursor:
-    author = OrderedDict(sorted(d.items(), key=lambda t: t[0]))
-    author["name"] = row[0]
-    author["description"] = row[1]
-    author["short_description"] = row[2]
-    authors.append(author) 
-
-open('author.song.json', 'w').write(json.dumps(authors, indent=2, ensure_ascii=False))
-
-
-cursor = c.execute("SELECT rhythmic, author, content from ci;")
-
-d = {"rhythmic": None, "author": None, "paragraphs": None}
-
-cis = []
-
-for row in cursor:
-    ci = OrderedDict(sorted(d.items(), key=lambda t: t[0]))
-    ci["rhythmic"] = row[0]
-    ci["author"] = row[1]
-    ci["paragraphs"] = row[2].split('\n')
-    cis.append(ci) 
-
-for i in range(0, 21050, 1000):
-    open('ci.song.%s.json' % i, 'w').write(json.dumps(cis[i:i+1000], indent=2, ensure_ascii=False))
 
+if __name__ == '__main__':
+    # 作者信息写为单个 author.song.json，词按每 1000 条一个 ci.song.N.json 分片
+    export_preset('ci.db', 'ciauthor', 0)
+    export_preset('ci.db', 'ci', 1000)